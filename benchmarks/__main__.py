@@ -0,0 +1,44 @@
+"""Runs the benchmarks of client-side CPU hot paths.
+
+    python -m benchmarks                               # quick run, prints time and peak memory
+    python -m benchmarks --full --save baseline.json   # records a baseline
+    python -m benchmarks --full --baseline baseline.json   # exits with 1 when any benchmark regressed
+
+Timings depend on the machine, so '--baseline' is meaningful only against a baseline recorded by '--save' on the same machine
+(and Python, numpy), e.g. in the same CI job before the change being measured.
+"""
+import argparse
+import sys
+from benchmarks.runner import find_regressions, format_measurement, load_baseline, run, save_baseline
+from benchmarks.suite import benchmarks
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks of client-side CPU hot paths.')
+    parser.add_argument('--full', action='store_true', help='run also the largest sizes (10k cars, 1000 tiles, 100k points)')
+    parser.add_argument('-k', '--filter', default='', help='run only the benchmarks whose name contains the given text')
+    parser.add_argument('--repeat', type=int, default=5, help='number of measured rounds (default: 5)')
+    parser.add_argument('--save', metavar='PATH', help='save the measurements as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare the measurements with a baseline recorded by --save on the same machine and fail on regressions')
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help='allowed relative slowdown (default: 0.5)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2, help='allowed relative growth of peak memory (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    selected = [b for b in benchmarks() if (args.full or b.quick) and args.filter in b.name]
+    print(f'{"benchmark":<48} {"min":>10} {"median":>10} {"peak memory":>16}')
+    measurements = run(selected, args.repeat, lambda m: print(format_measurement(m), flush=True))
+    if args.save:
+        save_baseline(args.save, measurements)
+        print(f'Baseline saved to {args.save}.')
+    if args.baseline:
+        regressions = find_regressions(measurements, load_baseline(args.baseline), args.time_tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+        print('No regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
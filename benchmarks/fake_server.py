@@ -0,0 +1,256 @@
+"""Local stand-in of the spaceknow apis (Auth0, Ragnar, Kraken release and grid, tasking) for end-to-end load and latency tests.
+
+    with FakeSpaceknowServer(FakeServerConfig(processing_time=0.5, error_rate=0.05)) as server, \
+            SpaceknowCarsAnalyser('user', 'password', api_domain=server.url, auth0_domain=server.url) as analyser:
+        ...
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from threading import Lock, Thread
+from time import monotonic, sleep, time
+from typing import Optional
+import base64
+import json
+import random
+import re
+import uuid
+from benchmarks import generators
+from spaceknow.api import RagnarApi, SpaceknowApi, TaskingObject
+from spaceknow.authorization import AuthorizationService
+from spaceknow.errors import TaskingError
+from spaceknow.tiling import tile_cover
+
+
+@dataclass
+class FakeServerConfig:
+    latency: float = 0.0
+    """Number of seconds every response is delayed by, i.e. network round trip."""
+    processing_time: float = 1.0
+    """Number of seconds a pipeline (search or analysis) stays in PROCESSING."""
+    next_try: int = 1
+    """Interval recommended by the get-status responses ('nextTry'), 0 leaves the interval on the polling policy of the client."""
+    scenes: int = 3
+    """Number of scenes every search returns, spread evenly over the searched dates."""
+    tiles: Optional[int] = None
+    """Number of tiles of every analysis. Defaults to None, i.e. the tiles (at zoom 19) the analysed extent intersects."""
+    cars_per_tile: int = 20
+    """Number of detections in every detections.geojson."""
+    error_rate: float = 0.0
+    """Probability a grid request (tile or detections) fails with 'error_status', which the client retries."""
+    error_status: int = 503
+    failure_rate: float = 0.0
+    """Probability a pipeline ends FAILED instead of RESOLVED."""
+    token_ttl: int = 3600
+    """Number of seconds issued tokens are valid for."""
+    seed: int = 0
+
+
+class FakeSpaceknowServer:
+    """HTTP server answering the requests of the apis (see FakeServerConfig). Requests are served by a thread each,
+    so concurrency, connection reuse and polling of the client are exercised as against the real apis."""
+
+    def __init__(self, config: FakeServerConfig = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            config (FakeServerConfig, optional): Behaviour of the server. Defaults to FakeServerConfig().
+            host (str, optional): Defaults to '127.0.0.1'.
+            port (int, optional): Defaults to 0, i.e. any free port.
+        """
+        self.config = config or FakeServerConfig()
+        self.__state = _FakeState(self.config)
+        self.__server = ThreadingHTTPServer((host, port), _handler(self.__state))
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self) -> str:
+        """Domain to be passed to the client as 'api_domain' and 'auth0_domain'."""
+        host, port = self.__server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self) -> dict[str, int]:
+        """Number of requests received so far per endpoint family, e.g. 'get-status' or 'detections'."""
+        return self.__state.request_counts()
+
+    def start(self) -> 'FakeSpaceknowServer':
+        self.__thread = Thread(target=self.__server.serve_forever, name='fake-spaceknow-server', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self) -> 'FakeSpaceknowServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+@dataclass
+class _Pipeline:
+    ready_at: float
+    failed: bool
+    result: dict
+
+
+class _FakeState:
+    """Pipelines and generated payloads shared by the handler threads."""
+
+    RELEASE_PATTERN = re.compile(r'^/kraken/release/(cars|imagery)/geojson/(initiate|retrieve)$')
+    GRID_PATTERN = re.compile(r'^/kraken/grid/([^/]+)/-/(\d+)/(\d+)/(\d+)/(truecolor\.png|detections\.geojson)$')
+
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self.__random = random.Random(config.seed)
+        self.__lock = Lock()
+        self.__pipelines: dict[str, _Pipeline] = {}
+        self.__counts: dict[str, int] = {}
+        self.__detections: dict[tuple[int,int,int], bytes] = {}
+        buffer = BytesIO()
+        generators.tile_images(1)[0].save(buffer, 'PNG')
+        self.__tile_image = buffer.getvalue()
+
+    def request_counts(self) -> dict[str, int]:
+        with self.__lock:
+            return dict(self.__counts)
+
+    def handle(self, method: str, path: str, body: Optional[dict]) -> tuple[int, str, bytes]:
+        """Returns status code, content type and body of a response."""
+        if method == 'POST' and path == AuthorizationService.ENDPOINT:
+            return self.__respond('oauth', {'id_token': self.__token()})
+        if method == 'POST' and path == RagnarApi.INITIATE_ENDPOINT:
+            return self.__respond('search', self.__initiate(self.__search_results(body)))
+        if method == 'POST' and path == RagnarApi.RETRIEVE_ENDPOINT:
+            return self.__respond('search', self.__retrieve(body))
+        if method == 'POST' and path == TaskingObject.ENDPOINT:
+            return self.__respond('get-status', self.__status(body))
+        release = self.RELEASE_PATTERN.match(path)
+        if method == 'POST' and release:
+            family = f'release-{release.group(1)}'
+            if release.group(2) == 'initiate':
+                return self.__respond(family, self.__initiate(self.__analysis_results(body)))
+            return self.__respond(family, self.__retrieve(body))
+        grid = self.GRID_PATTERN.match(path)
+        if method == 'GET' and grid:
+            family = 'imagery' if grid.group(5) == 'truecolor.png' else 'detections'
+            self.__count(family)
+            if self.__chance(self.config.error_rate):
+                return self.config.error_status, 'application/json', json.dumps({'error': 'SERVICE-UNAVAILABLE'}).encode()
+            if family == 'imagery':
+                return 200, 'image/png', self.__tile_image
+            return 200, 'application/json', self.__detections_of(tuple(int(c) for c in grid.group(2, 3, 4)))
+        return self.__respond('unknown', {'error': 'NON-EXISTENT-ENDPOINT', 'errorMessage': f'{method} {path}'})
+
+    def __respond(self, family: str, response: dict) -> tuple[int, str, bytes]:
+        self.__count(family)
+        return 200, 'application/json', json.dumps(response).encode()
+
+    def __count(self, family: str) -> None:
+        with self.__lock:
+            self.__counts[family] = self.__counts.get(family, 0) + 1
+
+    def __chance(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self.__lock:
+            return self.__random.random() < probability
+
+    def __token(self) -> str:
+        claims = {'sub': 'fake', 'exp': int(time()) + self.config.token_ttl}
+        encode = lambda part: base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b'=').decode()
+        return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.signature"
+
+    def __initiate(self, result: dict) -> dict:
+        pipeline_id = uuid.uuid4().hex
+        pipeline = _Pipeline(monotonic() + self.config.processing_time, self.__chance(self.config.failure_rate), result)
+        with self.__lock:
+            self.__pipelines[pipeline_id] = pipeline
+        return {'pipelineId': pipeline_id, 'status': 'NEW', 'nextTry': self.config.next_try}
+
+    def __status(self, body: dict) -> dict:
+        pipeline = self.__pipeline(body)
+        if pipeline is None:
+            return self.__non_existent(body)
+        if monotonic() < pipeline.ready_at:
+            return {'status': 'PROCESSING', 'nextTry': self.config.next_try}
+        return {'status': 'FAILED' if pipeline.failed else 'RESOLVED'}
+
+    def __retrieve(self, body: dict) -> dict:
+        pipeline = self.__pipeline(body)
+        if pipeline is None or pipeline.failed:
+            return self.__non_existent(body)
+        if monotonic() < pipeline.ready_at:
+            return {'error': TaskingError.PIPELINE_NOT_PROCESSED, 'errorMessage': 'Pipeline has not been resolved yet.'}
+        return pipeline.result
+
+    def __pipeline(self, body: dict) -> Optional[_Pipeline]:
+        with self.__lock:
+            return self.__pipelines.get((body or {}).get('pipelineId'))
+
+    def __non_existent(self, body: dict) -> dict:
+        return {'error': TaskingError.NON_EXISTENT_PIPELINE, 'errorMessage': f"Pipeline {(body or {}).get('pipelineId')} wasn't found."}
+
+    def __search_results(self, body: dict) -> dict:
+        start = datetime.strptime(body['startDatetime'], SpaceknowApi.TIME_FORMAT)
+        end = datetime.strptime(body['endDatetime'], SpaceknowApi.TIME_FORMAT)
+        step = (end - start) / self.config.scenes if self.config.scenes else timedelta(0)
+        results = []
+        for i in range(self.config.scenes):
+            scene_datetime = start + step * (i + 0.5)
+            results.append({'sceneId': f'scene-{scene_datetime:%Y%m%d%H%M%S}', 'datetime': scene_datetime.strftime(SpaceknowApi.TIME_FORMAT)})
+        return {'results': results}
+
+    def __analysis_results(self, body: dict) -> dict:
+        tiles = tile_cover(body['extent'])
+        if self.config.tiles is not None:
+            zoom, x_tile, y_tile = tiles[0]
+            width = max(1, int(self.config.tiles ** 0.5))
+            tiles = [(zoom, x_tile + i % width, y_tile + i // width) for i in range(self.config.tiles)]
+        return {'mapId': uuid.uuid4().hex, 'tiles': [list(tile) for tile in tiles]}
+
+    def __detections_of(self, tile: tuple[int,int,int]) -> bytes:
+        # Detections of a tile are equal across scenes and are generated once.
+        with self.__lock:
+            detections = self.__detections.get(tile)
+        if detections is None:
+            detections = json.dumps(generators.detections_geojson(self.config.cars_per_tile, tile, seed=self.config.seed + tile[1] * 1_000_003 + tile[2])).encode()
+            with self.__lock:
+                self.__detections[tile] = detections
+        return detections
+
+
+def _handler(state: _FakeState) -> type:
+    class FakeSpaceknowHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        """Keeps connections alive, so connection reuse of the client is exercised."""
+
+        def do_GET(self):
+            self.__serve(None)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.__serve(json.loads(self.rfile.read(length) or b'null'))
+
+        def __serve(self, body: Optional[dict]) -> None:
+            if state.config.latency:
+                sleep(state.config.latency)
+            status, content_type, content = state.handle(self.command, self.path, body)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeSpaceknowHandler
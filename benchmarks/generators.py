@@ -0,0 +1,57 @@
+import math
+import random
+from PIL import Image
+from spaceknow.visualization import tile_to_deg_coords
+
+TILE = (19, 482233, 297428)
+"""Tile the synthetic detections are generated in."""
+CAR_SIZE = 0.08
+"""Size of a car relative to the tile (~5 m at zoom 19)."""
+
+
+def detections_geojson(cars: int, tile: tuple[int,int,int] = TILE, seed: int = 0) -> dict:
+    """Generates Kraken-like FeatureCollection of cars (rotated rectangles) scattered across a tile.
+
+    Args:
+        cars (int): Number of detections.
+        tile (tuple[int,int,int], optional): Tile the cars are placed in. Defaults to TILE.
+        seed (int, optional): Seed of the generator, equal seeds give equal detections. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    zoom, x_tile, y_tile = tile
+    features = []
+    for _ in range(cars):
+        x, y = x_tile + rng.uniform(0.05, 0.95), y_tile + rng.uniform(0.05, 0.95)
+        angle = rng.uniform(0, math.pi)
+        corners = [(CAR_SIZE / 2 * dx, CAR_SIZE / 4 * dy) for dx, dy in [(-1, -1), (1, -1), (1, 1), (-1, 1), (-1, -1)]]
+        ring = []
+        for dx, dy in corners:
+            lat, lon = tile_to_deg_coords(x + dx * math.cos(angle) - dy * math.sin(angle), y + dx * math.sin(angle) + dy * math.cos(angle), zoom)
+            ring.append([lon, lat])
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {'class': 'cars', 'count': rng.randint(1, 3)}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def tiles(count: int, zoom: int = TILE[0]) -> list[tuple[int,int,int]]:
+    """Generates tiles of a nearly square extent, shuffled as Kraken doesn't return them ordered."""
+    width = math.ceil(math.sqrt(count))
+    generated = [(zoom, TILE[1] + i % width, TILE[2] + i // width) for i in range(count)]
+    random.Random(count).shuffle(generated)
+    return generated
+
+
+def tile_images(count: int, size: int = 256) -> list[Image.Image]:
+    """Generates tile images. All of them share one image, as their content doesn't affect the measured code."""
+    image = Image.new('RGB', (size, size), (40, 80, 40))
+    return [image] * count
+
+
+def coordinates(count: int, tile: tuple[int,int,int] = TILE, seed: int = 0) -> tuple[list[float], list[float]]:
+    """Generates longitudes and latitudes of points within a tile."""
+    rng = random.Random(seed)
+    zoom, x_tile, y_tile = tile
+    points = [tile_to_deg_coords(x_tile + rng.random(), y_tile + rng.random(), zoom) for _ in range(count)]
+    return [lon for _, lon in points], [lat for lat, _ in points]
@@ -0,0 +1,133 @@
+"""Drives SpaceknowCarsAnalyser against the local fake server (see benchmarks.fake_server) and reports end-to-end throughput and latency percentiles.
+
+    python -m benchmarks.load                                              # 20 extents, 4 at once
+    python -m benchmarks.load --extents 100 --concurrency 16 --latency 0.05 --error-rate 0.05
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+from typing import Iterator, Optional
+import argparse
+import math
+import sys
+from geojson import Polygon
+from benchmarks import generators
+from benchmarks.fake_server import FakeServerConfig, FakeSpaceknowServer
+from spaceknow.api import ConnectionPoolStats
+from spaceknow.control import PollingPolicy
+from spaceknow.interface import SpaceknowCarsAnalyser
+from spaceknow.throttling import RetryPolicy
+from spaceknow.visualization import tile_to_deg_coords
+
+FROM_DATE = datetime(2021, 1, 1)
+TO_DATE = datetime(2021, 2, 1)
+
+
+@dataclass
+class LoadResult:
+    extents: int
+    failed: int
+    seconds: float
+    """Wall time of the whole run."""
+    latencies: list[float]
+    """Seconds from taking an extent up to its car counts, per succeeded extent."""
+    requests: dict[str, int] = field(default_factory=dict)
+    """Requests received by the server per endpoint family."""
+    pools: list[ConnectionPoolStats] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Succeeded extents per second."""
+        return (self.extents - self.failed) / self.seconds if self.seconds else 0.0
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Nearest-rank percentile of the latencies, None when no extent succeeded."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def extents(count: int, side: int = 2) -> Iterator[Polygon]:
+    """Generates distinct square extents of 'side' x 'side' tiles (at zoom 19) in a row, so their searches and analyses aren't shared."""
+    zoom, x_tile, y_tile = generators.TILE
+    for i in range(count):
+        # Corners are shifted into the tiles, so the extent doesn't touch its neighbouring tiles.
+        x0, y0, x1, y1 = x_tile + i * (side + 1) + 0.01, y_tile + 0.01, x_tile + i * (side + 1) + side - 0.01, y_tile + side - 0.01
+        corners = [tile_to_deg_coords(x, y, zoom) for x, y in [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]]
+        yield Polygon([[(lon, lat) for lat, lon in corners]], precision=15)
+
+
+def run(config: FakeServerConfig, extent_count: int, concurrency: int = 4, max_workers: int = 8, extent_side: int = 2,
+    polling_policy: PollingPolicy = None, retry_policy: RetryPolicy = None) -> LoadResult:
+    """Starts the fake server and analyses 'extent_count' extents by SpaceknowCarsAnalyser.analyse_many, 'concurrency' extents at once.
+
+    Args:
+        config (FakeServerConfig): Behaviour of the fake server.
+        extent_count (int): Number of analysed extents.
+        concurrency (int, optional): Maximal number of extents being analysed at once. Defaults to 4.
+        max_workers (int, optional): Maximal number of tiles being fetched at once. Defaults to 8.
+        extent_side (int, optional): Side of the extents in tiles, i.e. an analysis has 'extent_side' ** 2 tiles unless the server sets 'tiles'. Defaults to 2.
+        polling_policy (PollingPolicy, optional): Defaults to PollingPolicy(min_interval=0.05), so the server recommended 'nextTry' isn't rounded up to a second.
+        retry_policy (RetryPolicy, optional): Defaults to RetryPolicy(initial_delay=0.05).
+    """
+    started = {}
+    def taken(generated: Iterator[Polygon]) -> Iterator[Polygon]:
+        # analyse_many takes an extent only when it starts analysing it.
+        for index, extent in enumerate(generated):
+            started[index] = perf_counter()
+            yield extent
+
+    with FakeSpaceknowServer(config) as server, SpaceknowCarsAnalyser('load', 'test', max_workers=max_workers,
+            polling_policy=polling_policy or PollingPolicy(min_interval=0.05, initial_interval=0.05),
+            retry_policy=retry_policy or RetryPolicy(initial_delay=0.05),
+            api_domain=server.url, auth0_domain=server.url) as analyser:
+        start = perf_counter()
+        latencies, failed = [], 0
+        for result in analyser.analyse_many(taken(extents(extent_count, extent_side)), FROM_DATE, TO_DATE, max_concurrent_extents=concurrency):
+            if result.error is None:
+                latencies.append(perf_counter() - started[result.index])
+            else:
+                failed += 1
+        seconds = perf_counter() - start
+        return LoadResult(extent_count, failed, seconds, latencies, server.requests, analyser.connection_pool_stats)
+
+
+def format_result(result: LoadResult) -> str:
+    lines = [
+        f'extents      {result.extents} ({result.failed} failed) in {result.seconds:.2f} s',
+        f'throughput   {result.throughput:.2f} extents/s']
+    if result.latencies:
+        percentiles = ', '.join(f'p{p} {result.percentile(p):.3f} s' for p in (50, 90, 99))
+        lines.append(f'latency      {percentiles}, max {max(result.latencies):.3f} s')
+    lines.append('requests     ' + ', '.join(f'{family} {count}' for family, count in sorted(result.requests.items())))
+    for pool in result.pools:
+        lines.append(f'connections  {pool.host}: {pool.connections} opened for {pool.requests} requests')
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description='End-to-end load test against a local fake spaceknow server.')
+    parser.add_argument('--extents', type=int, default=20, help='number of analysed extents (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=4, help='extents analysed at once (default: 4)')
+    parser.add_argument('--max-workers', type=int, default=8, help='tiles fetched at once (default: 8)')
+    parser.add_argument('--extent-side', type=int, default=2, help='side of an extent in tiles (default: 2)')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every response in seconds (default: 0)')
+    parser.add_argument('--processing-time', type=float, default=0.5, help='seconds a pipeline stays in PROCESSING (default: 0.5)')
+    parser.add_argument('--next-try', type=int, default=0, help="'nextTry' of get-status responses, 0 leaves polling on the client (default: 0)")
+    parser.add_argument('--scenes', type=int, default=3, help='scenes per search (default: 3)')
+    parser.add_argument('--tiles', type=int, default=None, help='tiles per analysis (default: tiles of the extent)')
+    parser.add_argument('--cars-per-tile', type=int, default=20, help='detections per tile (default: 20)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability a tile request fails with 503 (default: 0)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability a pipeline ends FAILED (default: 0)')
+    args = parser.parse_args(argv)
+
+    config = FakeServerConfig(latency=args.latency, processing_time=args.processing_time, next_try=args.next_try, scenes=args.scenes, tiles=args.tiles,
+        cars_per_tile=args.cars_per_tile, error_rate=args.error_rate, failure_rate=args.failure_rate)
+    result = run(config, args.extents, args.concurrency, args.max_workers, args.extent_side)
+    print(format_result(result))
+    return 0 if result.failed == 0 or args.failure_rate > 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
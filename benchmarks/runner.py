@@ -0,0 +1,129 @@
+from dataclasses import asdict, dataclass
+from statistics import median
+from time import perf_counter
+from typing import Callable, Iterable, Optional
+import gc
+import json
+import platform
+import tracemalloc
+from benchmarks.suite import Benchmark
+
+BASELINE_VERSION = 1
+
+
+@dataclass
+class Measurement:
+    name: str
+    seconds: float
+    """Fastest time of a call, the least noisy estimate."""
+    median_seconds: float
+    peak_bytes: Optional[int]
+    """Peak of memory allocated by Python during a call (tracemalloc). None for the benchmarks whose memory isn't traced (see 'Benchmark.traced_memory')."""
+    calls: int
+    """Number of measured calls."""
+
+
+def measure(benchmark: Benchmark, repeat: int = 5, min_time: float = 0.05) -> Measurement:
+    """Measures time and peak memory of a benchmark. Time is measured in 'repeat' rounds of calls lasting at least 'min_time' seconds,
+    peak memory in a separate call, since tracing memory slows the calls down. Peak memory isn't measured unless tracemalloc sees it (see 'Benchmark.traced_memory')."""
+    call = benchmark.setup()
+    call()
+    loops = 1
+    while True:
+        elapsed = __time(call, loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    timings = [elapsed / loops] + [__time(call, loops) / loops for _ in range(repeat - 1)]
+    peak_bytes = __trace_peak_bytes(call) if benchmark.traced_memory else None
+    return Measurement(benchmark.name, min(timings), median(timings), peak_bytes, loops * repeat)
+
+
+def run(benchmarks: Iterable[Benchmark], repeat: int = 5, report: Callable[[Measurement], None] = None) -> list[Measurement]:
+    measurements = []
+    for benchmark in benchmarks:
+        measurement = measure(benchmark, repeat)
+        if report:
+            report(measurement)
+        measurements.append(measurement)
+    return measurements
+
+
+def to_baseline(measurements: list[Measurement]) -> dict:
+    """Builds machine-readable baseline. Timings are comparable only on the same machine and interpreter, those are recorded too."""
+    return {
+        'version': BASELINE_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'results': {m.name: asdict(m) for m in measurements}
+    }
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f'Unsupported baseline version {baseline.get("version")}.')
+    return baseline
+
+
+def save_baseline(path: str, measurements: list[Measurement]) -> None:
+    with open(path, 'w') as baseline_file:
+        json.dump(to_baseline(measurements), baseline_file, indent=2, sort_keys=True)
+
+
+def find_regressions(measurements: list[Measurement], baseline: dict, time_tolerance: float = 0.5, memory_tolerance: float = 0.2) -> list[str]:
+    """Compares measurements with a baseline. Benchmarks missing in the baseline are skipped.
+
+    Args:
+        measurements (list[Measurement])
+        baseline (dict): See 'to_baseline'.
+        time_tolerance (float, optional): Allowed relative slowdown. Defaults to 0.5, i.e. 50 %.
+        memory_tolerance (float, optional): Allowed relative growth of peak memory. Defaults to 0.2, i.e. 20 %.
+
+    Returns:
+        list[str]: Descriptions of the regressions.
+    """
+    regressions = []
+    for measurement in measurements:
+        expected: Optional[dict] = baseline['results'].get(measurement.name)
+        if expected is None:
+            continue
+        if measurement.seconds > expected['seconds'] * (1 + time_tolerance):
+            regressions.append(f"{measurement.name}: {__format_seconds(measurement.seconds)} per call, baseline {__format_seconds(expected['seconds'])}")
+        if measurement.peak_bytes is None or expected.get('peak_bytes') is None:
+            continue
+        # A few hundred bytes of noise (e.g. interned objects) aren't regressions of tiny benchmarks.
+        if measurement.peak_bytes > expected['peak_bytes'] * (1 + memory_tolerance) + 1024:
+            regressions.append(f"{measurement.name}: peak {measurement.peak_bytes} B, baseline {expected['peak_bytes']} B")
+    return regressions
+
+
+def format_measurement(measurement: Measurement) -> str:
+    peak_memory = f'{measurement.peak_bytes / 1024:>12.1f} KiB' if measurement.peak_bytes is not None else f'{"-":>16}'
+    return f'{measurement.name:<48} {__format_seconds(measurement.seconds):>10} {__format_seconds(measurement.median_seconds):>10} {peak_memory}'
+
+
+def __trace_peak_bytes(call: Callable) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def __time(call: Callable, loops: int) -> float:
+    start = perf_counter()
+    for _ in range(loops):
+        call()
+    return perf_counter() - start
+
+
+def __format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
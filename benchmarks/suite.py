@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Any, Callable
+from benchmarks import generators
+from spaceknow.api import KrakenApi
+from spaceknow.visualization import build_mosaic, deg_to_tile_coords, deg_to_tile_coords_array, highlight_cars_on_tile, tile_to_pixel_coords, \
+    tile_to_pixel_coords_array
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    """Prepares the input (not measured) and returns the measured call."""
+    quick: bool = True
+    """Whether the benchmark is a part of the quick run."""
+    traced_memory: bool = True
+    """Whether tracemalloc sees the memory allocated by the call. It doesn't see native buffers, such as pixels of PIL images, 
+    so peak memory of the image benchmarks isn't measured."""
+
+
+CARS = (1, 100, 1000, 10000)
+TILES = (1, 100, 1000)
+POINTS = (1000, 100000)
+
+
+def parse_features(cars: int) -> Callable[[], Any]:
+    detections = generators.detections_geojson(cars)
+    kraken = KrakenApi(None)
+    return lambda: kraken._parse_detections_to_list_of_features(detections)
+
+
+def parse_batch(cars: int) -> Callable[[], Any]:
+    detections = generators.detections_geojson(cars)
+    kraken = KrakenApi(None)
+    return lambda: kraken._parse_detections_to_batch(detections)
+
+
+def highlight(cars: int) -> Callable[[], Any]:
+    detections = KrakenApi(None)._parse_detections_to_batch(generators.detections_geojson(cars))
+    image = generators.tile_images(1)[0]
+    return lambda: highlight_cars_on_tile(generators.TILE, image.copy(), detections)
+
+
+def deg_to_tile(points: int) -> Callable[[], Any]:
+    lons, lats = generators.coordinates(points)
+    return lambda: [deg_to_tile_coords(lon, lat, generators.TILE[0]) for lon, lat in zip(lons, lats)]
+
+
+def deg_to_tile_array(points: int) -> Callable[[], Any]:
+    lons, lats = generators.coordinates(points)
+    return lambda: deg_to_tile_coords_array(lons, lats, generators.TILE[0])
+
+
+def tile_to_pixel(points: int) -> Callable[[], Any]:
+    xs, ys = generators.coordinates(points)
+    origin = generators.TILE[1:]
+    return lambda: [tile_to_pixel_coords(origin, (256, 256), xy) for xy in zip(xs, ys)]
+
+
+def tile_to_pixel_array(points: int) -> Callable[[], Any]:
+    xs, ys = generators.coordinates(points)
+    return lambda: tile_to_pixel_coords_array(generators.TILE[1:], (256, 256), xs, ys)
+
+
+def mosaic(tiles: int) -> Callable[[], Any]:
+    tile_coords, images = generators.tiles(tiles), generators.tile_images(tiles)
+    return lambda: build_mosaic(tile_coords, images)
+
+
+def benchmarks() -> list[Benchmark]:
+    """Returns all the benchmarks. Sizes span from a single car or tile up to 10k cars per tile and 1000 tiles per scene."""
+    suite = []
+    for cars in CARS:
+        quick = cars <= 1000
+        suite.append(Benchmark(f'parse_detections_to_list_of_features[{cars}]', lambda c=cars: parse_features(c), quick))
+        suite.append(Benchmark(f'parse_detections_to_batch[{cars}]', lambda c=cars: parse_batch(c), quick))
+        suite.append(Benchmark(f'highlight_cars_on_tile[{cars}]', lambda c=cars: highlight(c), quick, traced_memory=False))
+    for points in POINTS:
+        quick = points <= 1000
+        suite.append(Benchmark(f'deg_to_tile_coords[{points}]', lambda p=points: deg_to_tile(p), quick))
+        suite.append(Benchmark(f'deg_to_tile_coords_array[{points}]', lambda p=points: deg_to_tile_array(p), quick))
+        suite.append(Benchmark(f'tile_to_pixel_coords[{points}]', lambda p=points: tile_to_pixel(p), quick))
+        suite.append(Benchmark(f'tile_to_pixel_coords_array[{points}]', lambda p=points: tile_to_pixel_array(p), quick))
+    for tiles in TILES:
+        quick = tiles <= 100
+        suite.append(Benchmark(f'build_mosaic[{tiles}]', lambda t=tiles: mosaic(t), quick, traced_memory=False))
+    return suite
@@ -7,5 +7,6 @@ setup(
     author_email='david.tomecek1@seznam.cz',
     url='https://github.com/cavic19/spaceknow-car-counter',
     install_requires=['Pillow','geojson','requests'],
-    packages=find_packages(exclude=['tests*']),
+    extras_require={'numpy': ['numpy'], 'orjson': ['orjson'], 'aio': ['aiohttp']},
+    packages=find_packages(exclude=['tests*', 'benchmarks*']),
 )
\ No newline at end of file
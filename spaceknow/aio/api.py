@@ -0,0 +1,240 @@
+import asyncio
+from typing import Any, Callable, Awaitable, Optional, Tuple, Union
+from datetime import datetime
+from io import BytesIO
+from geojson import GeoJSON
+from PIL import Image
+from spaceknow.api import POST_METHOD, GET_METHOD, SpaceknowApi, TaskingObject, RagnarApi, KrakenApi
+from spaceknow.aio.transport import AsyncTransport, AiohttpTransport, TransportResponse
+from spaceknow.aio.authorization import AsyncTokenProvider
+from spaceknow.errors import SpaceknowApiException, TaskingError, TaskingException
+from spaceknow.throttling import RateLimiter, RetryPolicy
+from spaceknow.models import DetectionBatch, Feature, TaskingStatus
+
+
+class AsyncAuthorizedSession:
+    """Asynchronous counterpart of AuthorizedSession. Requests are sent through a pluggable AsyncTransport."""
+    def __init__(self, authToken: str = None, transport: AsyncTransport = None, rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None,
+        token_provider: AsyncTokenProvider = None, domain: str = None):
+        """
+        Args:
+            authToken (str, optional): Authorization token. Defaults to None.
+            transport (AsyncTransport, optional): Sends the requests. Defaults to AiohttpTransport.
+            rate_limiter (RateLimiter, optional): Limits rate of requests per endpoint family. Defaults to None, i.e. no limits.
+            retry_policy (RetryPolicy, optional): Retries failed idempotent requests. Defaults to RetryPolicy().
+            token_provider (AsyncTokenProvider, optional): Provides always valid token to the apis, which overrides 'authToken'. Defaults to None.
+            domain (str, optional): Domain the apis sharing the session send requests to. Defaults to None, i.e. SpaceknowApi.DOMAIN.
+        """
+        self.headers = {}
+        self.domain = domain
+        self.token_provider = token_provider
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.__transport = transport or AiohttpTransport()
+        self.update_auth_token(authToken)
+
+    @property
+    def transport(self) -> AsyncTransport:
+        return self.__transport
+
+    def update_auth_token(self, authToken: str) -> None:
+        """Updates current authorization token.""" 
+        self.headers.update({'authorization': f'Bearer {authToken}'})
+
+    async def request(self, method: str, url: str, json: dict = None, headers: dict = None) -> TransportResponse:
+        return await self.__transport.request(method, url, headers={**self.headers, **(headers or {})}, json=json)
+
+    async def close(self) -> None:
+        await self.__transport.close()
+
+
+class AsyncSpaceknowApi(SpaceknowApi):
+    """Base class for all asynchronous spaceknow APIs."""
+    def __init__(self, session: AsyncAuthorizedSession):
+        super().__init__(session)
+
+    async def _request(self, method, api_endpoint, json_body: dict = None) -> TransportResponse:
+        """Sends a request to an API and returns the raw response. See '_send'."""
+        return (await self._send(method, api_endpoint, json_body))[0]
+
+    async def _send(self, method, api_endpoint, json_body: dict = None, decode_json: bool = False) -> Tuple[TransportResponse, Optional[Any]]:
+        """Sends a request to an API. The request is throttled, retried and reauthorized according to the session. See 'SpaceknowApi._send'."""
+        attempt = 0
+        reauthorized = False
+        while True:
+            await self.__sleep(self._throttle_delay(api_endpoint))
+            token_provider = self._session.token_provider
+            token = await token_provider.token() if token_provider is not None else None
+            try:
+                response = await self._session.request(method, url= self._url(api_endpoint), json=json_body, **self._authorization_kwargs(token))
+            except Exception as ex:
+                delay = self._retry_delay(method, attempt, exception=ex)
+                if delay is None:
+                    raise
+            else:
+                body = self._try_decode_json(response) if decode_json else None
+                if token is not None and not reauthorized and self._is_authorization_failure(response, body):
+                    token_provider.invalidate(token)
+                    reauthorized = True
+                    continue
+                delay = self._retry_delay(method, attempt, response=response)
+                if delay is None:
+                    return response, body
+            await self.__sleep(delay)
+            attempt += 1
+
+    async def __sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    async def _call(self, method, api_endpoint, json_body: dict) -> dict:
+        """Calls an API."""
+        response, body = await self._send(method, api_endpoint, json_body, decode_json=True)
+        return self._parse_response(response, body)
+
+    async def _get_image(self, endpoint) -> Image:
+        """Gets image from a given endpoint.
+
+        Raises:
+            UnexpectedResponseException: When no image parsable data are presented.
+        """
+        response = await self._request(GET_METHOD, endpoint)
+        return self._parse_image(response)
+
+
+class AsyncTaskingObject(TaskingObject, AsyncSpaceknowApi):
+    """Asynchronous counterpart of TaskingObject."""
+
+    def __init__(self, session: AsyncAuthorizedSession, pipeline_id: str, on_success: Callable[[],Awaitable]):
+        """
+        Args:
+            session (AsyncAuthorizedSession): HttpClient with valid authorization token
+            pipeline_id (str): Pipeline ID, that coresponds to a encapsulated procedure
+            on_success (Callable[[],Awaitable]): Coroutine function called when procedure is successfully finished
+        """
+        super().__init__(session, pipeline_id, on_success)
+
+    async def get_status(self) -> Tuple[TaskingStatus, int]:
+        """Checks on a status of procedure enclosed in a tasking object.
+
+        Raises:
+            UnexpectedResponseException
+
+        Returns:
+            Tuple[TaskingStatus, int]: Tuple of a current status and int represnting recommended time before next check.
+        """
+        response = await self.call(POST_METHOD, self.ENDPOINT, {'pipelineId': self.pipeline_id})
+        return self._parse_status(response)
+
+    async def retrieve_data(self):
+        """Retrives data from encapsulated procedere via constructor injected 'on_success' coroutine function"""
+        return await super().retrieve_data()
+
+    async def call(self, method, api_endpoint, json_body) -> dict:
+        try:
+            return await self._call(method,api_endpoint,json_body)
+        except SpaceknowApiException as ex:
+            if ex.error_type in [TaskingError.NON_EXISTENT_PIPELINE, TaskingError.PIPELINE_NOT_PROCESSED]:
+                raise TaskingException(ex.error_type, ex.error_message) from ex
+            raise
+
+
+class AsyncRagnarApi(RagnarApi, AsyncSpaceknowApi):
+    """Asynchronous counterpart of RagnarApi."""
+
+    async def initiate_search(
+        self, 
+        extent: GeoJSON, 
+        from_date_time: datetime, 
+        to_date_time: datetime, 
+        images_provider: str = RagnarApi.DEFAULT_PROVIDER, 
+        dataset: str = RagnarApi.DEFAULT_DATASET) -> AsyncTaskingObject:
+        """Initiates search for scenes intersecting with a given extent. See RagnarApi.initiate_search."""
+        json_body = self._search_request_body(extent, from_date_time, to_date_time, images_provider, dataset)
+        response = await self._call(POST_METHOD, self.INITIATE_ENDPOINT, json_body)
+        pipeline_id = self._try_get('pipelineId', response)
+        return AsyncTaskingObject(self._session, pipeline_id, lambda: self.retrieve_results(pipeline_id))
+
+    def attach_search(self, pipeline_id: str) -> AsyncTaskingObject:
+        """Returns tasking object of a search initiated earlier. See RagnarApi.attach_search."""
+        return AsyncTaskingObject(self._session, pipeline_id, lambda: self.retrieve_results(pipeline_id))
+
+    async def retrieve_results(self, pipeline_id) -> list[tuple[datetime, str]]:
+        """Retrieves list of (datetime, scene id) pairs. See RagnarApi.retrieve_results."""
+        try:
+            response = await self._call(POST_METHOD, self.RETRIEVE_ENDPOINT,{'pipelineId': pipeline_id})
+        except SpaceknowApiException as ex:
+            if ex.error_type in [TaskingError.NON_EXISTENT_PIPELINE, TaskingError.PIPELINE_NOT_PROCESSED]:
+                raise TaskingException(ex.error_type, ex.error_message) from ex
+            raise
+        return self._parse_search_results(response)
+
+
+class AsyncKrakenApi(KrakenApi, AsyncSpaceknowApi):
+    """Asynchronous counterpart of KrakenApi."""
+
+    async def initiate_car_analysis(self, extent: GeoJSON, scene_id: str) -> AsyncTaskingObject:
+        """Initiates cars analysis. See KrakenApi.initiate_car_analysis."""
+        return await self.__initiate_analysis(extent, scene_id, 'cars')
+
+    async def initiate_imagery_analysis(self, extent: GeoJSON, scene_id: str) -> AsyncTaskingObject:
+        """Initiates imagery analysis. See KrakenApi.initiate_imagery_analysis."""
+        return await self.__initiate_analysis(extent, scene_id, 'imagery')
+
+    def attach_car_analysis(self, pipeline_id: str) -> AsyncTaskingObject:
+        """Returns tasking object of a cars analysis initiated earlier. See KrakenApi.attach_car_analysis."""
+        return AsyncTaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, 'cars'))
+
+    def attach_imagery_analysis(self, pipeline_id: str) -> AsyncTaskingObject:
+        """Returns tasking object of an imagery analysis initiated earlier. See KrakenApi.attach_imagery_analysis."""
+        return AsyncTaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, 'imagery'))
+
+    async def __initiate_analysis(self, extent: GeoJSON, scene_id: str, middle_path: str) -> AsyncTaskingObject:
+        body_json = self._analysis_request_body(extent, scene_id)
+        endpoint = self.RELEASE_ENDPOINT %(middle_path, 'initiate')
+        response = await self._call(POST_METHOD, endpoint, body_json)
+        pipeline_id = self._try_get('pipelineId', response)
+        return AsyncTaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, middle_path))
+
+    async def __retrieve_analysis(self, pipeline_id: str, middle_path: str) -> Union[str, list]:
+        try:
+            endpoint = self.RELEASE_ENDPOINT %(middle_path, 'retrieve')
+            body_json = {'pipelineId': pipeline_id}
+            response = await self._call(POST_METHOD, endpoint, body_json)
+        except SpaceknowApiException as ex:
+            if ex.error_type in [TaskingError.NON_EXISTENT_PIPELINE, TaskingError.PIPELINE_NOT_PROCESSED]:
+                raise TaskingException(ex.error_type, ex.error_message) from ex
+            raise
+        return self._parse_analysis_results(response)
+
+    async def get_satelite_image(self, map_id: str, tile: Tuple[int, int, int]) -> Image.Image:
+        """Retrieves satelite image, by map_id, tile, that were analysed earlier. See KrakenApi.get_satelite_image."""
+        endpoint = self.GRID_IMAGERY_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        if self._image_cache is None:
+            return await self._get_image(endpoint)
+        # The cache reads and writes files, so it runs in a worker thread not to block the event loop.
+        content = await asyncio.to_thread(self._image_cache.get, map_id, tile)
+        if content is not None:
+            return Image.open(BytesIO(content))
+        response = await self._request(GET_METHOD, endpoint)
+        image = self._parse_image(response)
+        await asyncio.to_thread(self._image_cache.put, map_id, tile, response.content)
+        return image
+
+    async def get_detections(self, map_id: str, tile: Tuple[int,int,int]) -> list[Feature]:
+        """Retrieves data results of cars analysis. See KrakenApi.get_detections."""
+        endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        response = await self._call(GET_METHOD, endpoint, json_body=None)
+        return self._parse_detections_to_list_of_features(response)
+
+    async def get_detection_batch(self, map_id: str, tile: Tuple[int,int,int]) -> DetectionBatch:
+        """Retrieves data results of cars analysis in compact columnar form. See KrakenApi.get_detection_batch."""
+        endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        response = await self._call(GET_METHOD, endpoint, json_body=None)
+        return self._parse_detections_to_batch(response)
+
+    async def get_detection_counts(self, map_id: str, tile: Tuple[int,int,int]) -> dict[str, int]:
+        """Retrieves only number of objects per class found in a tile. See KrakenApi.get_detection_counts."""
+        endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        response = await self._call(GET_METHOD, endpoint, json_body=None)
+        return self._parse_detection_counts(response)
@@ -0,0 +1,38 @@
+from spaceknow.aio.transport import AsyncTransport, AiohttpTransport
+import asyncio
+from spaceknow.api import POST_METHOD
+from spaceknow.authorization import AUTH0_DOMAIN, AuthorizationService, TokenProvider
+from spaceknow.models import Credentials
+
+
+class AsyncAuthorizationService(AuthorizationService):
+    """Asynchronous counterpart of AuthorizationService."""
+
+    def __init__(self, client_id, transport: AsyncTransport = None, domain: str = AUTH0_DOMAIN):
+        super().__init__(client_id, domain=domain)
+        self.__transport = transport or AiohttpTransport()
+
+    async def request_jwt(self, credentials: Credentials) -> str:
+        """Authenticates user with given credentials. See AuthorizationService.request_jwt."""
+        body_json = self._jwt_request_body(credentials)
+        url = self.domain + self.ENDPOINT
+        response = await self.__transport.request(POST_METHOD, url, json=body_json)
+        return self._parse_jwt_response(response)
+
+
+class AsyncTokenProvider(TokenProvider):
+    """Asynchronous counterpart of TokenProvider. A single coroutine refreshes the token while the others wait for it."""
+
+    def __init__(self, authorization_service: AsyncAuthorizationService, credentials: Credentials, **kwargs):
+        super().__init__(authorization_service, credentials, **kwargs)
+        self.__refresh_lock = None
+
+    async def token(self) -> str:
+        """Returns valid token, requests a new one when needed. See TokenProvider.token."""
+        # The lock has to be created within a running event loop.
+        if self.__refresh_lock is None:
+            self.__refresh_lock = asyncio.Lock()
+        async with self.__refresh_lock:
+            if self._needs_refresh():
+                self._set_token(await self._authorization_service.request_jwt(self._credentials))
+            return self._token
@@ -0,0 +1,86 @@
+from spaceknow.aio.api import AsyncTaskingObject
+from spaceknow.control import PollingPolicy
+from spaceknow.errors import TaskingException
+from spaceknow.models import TaskingStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Tuple
+import asyncio
+
+
+async def gather(awaitables: Iterable[Awaitable]) -> list:
+    """Awaits all the awaitables concurrently and returns their results in the given order. Unlike bare 'asyncio.gather', the rest of them is cancelled
+    (and awaited) as soon as any of them fails or the gathering task is cancelled, so no polling or fetching is left running orphaned.
+
+    Raises:
+        Exception: The first exception raised by any of the awaitables.
+    """
+    tasks = [asyncio.ensure_future(a) for a in awaitables]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class AsyncTaskingManager:
+    """Controls execution of AsyncTaskingObjects without blocking the event loop."""
+    TASK_FAILED_ERROR = 'TASKING-FAILED'
+    TASK_TIMEOUT_ERROR = 'TASKING-TIMEOUT'
+    def __init__(self, logger: Callable[[str, float], None] = None, polling_policy: PollingPolicy = None) -> None:
+        """
+        Args:
+            logger (Callable[[str, float], None]): Logs status of a TaskingObject (status: str, time_untill_next _tep: float). Defaults to None.
+            polling_policy (PollingPolicy, optional): Decides intervals between checks and deadline of a procedure. Defaults to PollingPolicy().
+        """
+        self.__logger = logger or (lambda s, i: None)
+        self.__polling_policy = polling_policy or PollingPolicy()
+
+    async def wait_untill_completed(self, tasking_object: AsyncTaskingObject):
+        """Waits untill the Tasking procedure is finished and returns the result. The wait is cancelled by cancelling the awaiting task.
+
+        Raises:
+            TaskingException: When the procedure fails or exceeds its deadline.
+        """
+        policy = self.__polling_policy
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline if policy.deadline is not None else float('inf')
+        attempt = 0
+        while True:
+            status, wait_in_seconds = await tasking_object.get_status()
+            if status == TaskingStatus.FAILED:
+                raise TaskingException(self.TASK_FAILED_ERROR,'Tasking failed unexpectedly.')
+            if status not in [TaskingStatus.PROCESSING, TaskingStatus.NEW]:
+                self.__logger(status.name, wait_in_seconds)
+                return await tasking_object.retrieve_data()
+            now = loop.time()
+            if now >= deadline:
+                raise TaskingException(self.TASK_TIMEOUT_ERROR, f'Tasking was not finished within {policy.deadline}s.')
+            interval = policy.interval(attempt, wait_in_seconds)
+            attempt += 1
+            self.__logger(status.name, interval)
+            await asyncio.sleep(min(interval, deadline - now))
+
+    async def as_completed(self, tasking_objects: Iterable[AsyncTaskingObject]) -> AsyncIterator[Tuple[AsyncTaskingObject, Any]]:
+        """Polls all the given tasking objects concurrently and yields them alongside with their results as they are resolved.
+
+        Raises:
+            TaskingException: When any of the procedures fails.
+        """
+        async def wait(tasking_object):
+            return tasking_object, await self.wait_untill_completed(tasking_object)
+        tasks = [asyncio.ensure_future(wait(t)) for t in tasking_objects]
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                yield await next_completed
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def wait_all(self, tasking_objects: Iterable[AsyncTaskingObject]) -> list:
+        """Waits untill all the Tasking procedures are finished and returns their results in the same order as the given tasking objects.
+
+        Raises:
+            TaskingException: When any of the procedures fails, the rest of the waits is cancelled then.
+        """
+        return await gather(self.wait_untill_completed(t) for t in tasking_objects)
@@ -0,0 +1,235 @@
+from datetime import datetime
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+
+from geojson import GeoJSON
+from PIL.Image import Image
+
+from spaceknow.aio.api import AsyncAuthorizedSession, AsyncKrakenApi, AsyncRagnarApi
+from spaceknow.aio.authorization import AsyncAuthorizationService, AsyncTokenProvider
+from spaceknow.authorization import AUTH0_CLIENT_ID, AUTH0_DOMAIN
+from spaceknow.aio.control import AsyncTaskingManager, gather
+from spaceknow.aio.transport import AsyncTransport, AiohttpTransport
+from spaceknow.cache import SearchCache, TileImageCache, search_key, uncovered_intervals
+from spaceknow.throttling import RateLimiter, RetryPolicy
+from spaceknow.control import PollingPolicy
+from spaceknow.errors import NoEntriesException
+from spaceknow.models import Credentials, DetectionBatch
+from spaceknow.visualization import build_mosaic, highlight_cars_on_tile
+
+T = TypeVar('T')
+
+
+class AsyncSpaceknowAnalysis:
+    """Asynchronous counterpart of SpaceknowAnalysis. All the scenes and tiles are processed concurrently."""
+
+    def __init__(self,
+     kraken_api: AsyncKrakenApi,
+     tasking_manager: AsyncTaskingManager,
+     sceneids_with_datetimes: list[tuple[datetime,str]],
+     extent: GeoJSON,
+     max_concurrent_requests: int = 16):
+        """
+        Args:
+            max_concurrent_requests (int, optional): Maximal number of tiles being fetched at once. Defaults to 16.
+        """
+        self.__kraken_api = kraken_api
+        self.__tasking_manager = tasking_manager
+        self.__sceneids_with_datetimess = sceneids_with_datetimes
+        self.__extent = extent
+        self.__max_concurrent_requests = max_concurrent_requests
+        # Tasks are cached instead of their results, so concurrent callers share the analysis of a scene in progress.
+        self.__cars_maps: dict[str, asyncio.Task] = {}
+        self.__detections: dict[str, asyncio.Task] = {}
+        self.__counts: dict[str, asyncio.Task] = {}
+        self.__waiters: dict[asyncio.Task, int] = {}
+
+    async def get_images(self) -> list[tuple[datetime, Image]]:
+        """Get image per scene. The image contains highlighted cars found in a given extent.
+        
+        Returns:
+            list[tuple[datetime, Image]]: Images alongside with date they were taken.
+        """
+        # Semaphore has to be created within a running event loop.
+        semaphore = asyncio.Semaphore(self.__max_concurrent_requests)
+        scene_ids = self.__get_scene_ids()
+        images = dict(zip(scene_ids, await gather(self.__get_images_from_scene_id(s, semaphore) for s in scene_ids)))
+        return [(sc[0], images[sc[1]]) for sc in self.__sceneids_with_datetimess]
+
+    async def get_car_counts(self) -> list[tuple[datetime, int]]:
+        """Counts cars in a prespecified area.
+
+        Returns:
+            list[tuple[datetime, int]]: Number of cars found within given extent (GeoJSON) on paricilar date.
+        """
+        semaphore = asyncio.Semaphore(self.__max_concurrent_requests)
+        scene_ids = self.__get_scene_ids()
+        counts = dict(zip(scene_ids, await gather(self.__cars_in_scene(s, semaphore) for s in scene_ids)))
+        return [(sc[0], counts[sc[1]]) for sc in self.__sceneids_with_datetimess]
+
+    async def __get_images_from_scene_id(self, scene_id: str, semaphore: asyncio.Semaphore) -> Image:
+        (tiles, detections), imagery_map_id = await gather([
+            self.__get_cars_tiles_and_detections(scene_id, semaphore),
+            self.__get_imagery_map_id(scene_id)])
+        images = await self.__gather_bounded([self.__kraken_api.get_satelite_image(imagery_map_id, t) for t in tiles], semaphore)
+        images_with_highlights = [highlight_cars_on_tile(*i) for i in zip(tiles, images, detections)]
+        return build_mosaic(tiles, images_with_highlights)
+
+    async def __get_imagery_map_id(self, scene_id: str) -> str:
+        kraken_imagery_task_obj = await self.__kraken_api.initiate_imagery_analysis(self.__extent, scene_id)
+        imagery_map_id, _ = await self.__tasking_manager.wait_untill_completed(kraken_imagery_task_obj)
+        return imagery_map_id
+
+    async def __get_cars_map(self, scene_id: str) -> tuple[str, list[tuple[int,int,int]]]:
+        """Returns map id and tiles of the kraken cars analysis of a scene. The pipeline is initiated once, concurrent callers wait for the same one."""
+        return await self.__shared(self.__cars_maps, scene_id, lambda: self.__analyse_cars(scene_id))
+
+    async def __analyse_cars(self, scene_id: str) -> tuple[str, list[tuple[int,int,int]]]:
+        kraken_cars_task_obj = await self.__kraken_api.initiate_car_analysis(self.__extent, scene_id)
+        return await self.__tasking_manager.wait_untill_completed(kraken_cars_task_obj)
+
+    async def __get_cars_tiles_and_detections(self, scene_id: str, semaphore: asyncio.Semaphore) -> tuple[list[tuple[int,int,int]], list[DetectionBatch]]:
+        return await self.__shared(self.__detections, scene_id, lambda: self.__fetch_detections(scene_id, semaphore))
+
+    async def __fetch_detections(self, scene_id: str, semaphore: asyncio.Semaphore) -> tuple[list[tuple[int,int,int]], list[DetectionBatch]]:
+        cars_map_id, cars_tiles = await self.__get_cars_map(scene_id)
+        detections = await self.__gather_bounded([self.__kraken_api.get_detection_batch(cars_map_id, t) for t in cars_tiles], semaphore)
+        return cars_tiles, detections
+
+    async def __get_cars_tile_counts(self, scene_id: str, semaphore: asyncio.Semaphore) -> list[dict[str, int]]:
+        """Returns number of objects per class of every tile. Geometries of the detections are skipped, unless they are being fetched already."""
+        detections_task = self.__detections.get(scene_id)
+        if detections_task is not None and (not detections_task.done() or self.__succeeded(detections_task)):
+            _, detections = await self.__get_cars_tiles_and_detections(scene_id, semaphore)
+            return [d.counts_per_class() for d in detections]
+        return await self.__shared(self.__counts, scene_id, lambda: self.__fetch_counts(scene_id, semaphore))
+
+    async def __fetch_counts(self, scene_id: str, semaphore: asyncio.Semaphore) -> list[dict[str, int]]:
+        cars_map_id, cars_tiles = await self.__get_cars_map(scene_id)
+        return await self.__gather_bounded([self.__kraken_api.get_detection_counts(cars_map_id, t) for t in cars_tiles], semaphore)
+
+    async def __cars_in_scene(self, scene_id: str, semaphore: asyncio.Semaphore) -> int:
+        tile_counts = await self.__get_cars_tile_counts(scene_id, semaphore)
+        return sum([sum(c.values()) for c in tile_counts])
+
+    async def __shared(self, tasks: dict[str, asyncio.Task], scene_id: str, start: Callable[[], Awaitable[T]]) -> T:
+        """Awaits the task of a scene, started by the first caller. Failed or cancelled tasks are started again, results of the succeeded ones are kept.
+        A caller being cancelled doesn't cancel the task for the others, the task is cancelled only once none of its callers waits for it."""
+        task = tasks.get(scene_id)
+        if task is None or (task.done() and not self.__succeeded(task)):
+            task = tasks[scene_id] = asyncio.ensure_future(start())
+        self.__waiters[task] = self.__waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.__waiters[task] -= 1
+            if self.__waiters[task] == 0:
+                del self.__waiters[task]
+                task.cancel()
+
+    @staticmethod
+    def __succeeded(task: asyncio.Task) -> bool:
+        return task.done() and not task.cancelled() and task.exception() is None
+
+    def __get_scene_ids(self) -> list[str]:
+        """Returns scene ids without duplicates."""
+        return list(dict.fromkeys(sc[1] for sc in self.__sceneids_with_datetimess))
+
+    async def __gather_bounded(self, coroutines: list[Awaitable], semaphore: asyncio.Semaphore) -> list:
+        """Awaits all the coroutines, at most 'max_concurrent_requests' at once, and returns their results in the given order (see 'gather')."""
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+        return await gather(bounded(c) for c in coroutines)
+
+
+class AsyncSpaceknowCarsAnalyser:
+    """Asynchronous counterpart of SpaceknowCarsAnalyser. Single event loop may drive many analyses at once.
+    
+    Usage:
+        async with AsyncSpaceknowCarsAnalyser(username, password) as analyser:
+            analysis = await analyser.analyse_on(extent, from_date, to_date)
+            car_counts = await analysis.get_car_counts()
+    """
+
+    AUTH0_CLIENT_ID = AUTH0_CLIENT_ID
+
+    def __init__(self, username:str, password: str, logger: Callable[[str], None] = None, transport: AsyncTransport = None, max_concurrent_requests: int = 16, image_cache: TileImageCache = None,
+        polling_policy: PollingPolicy = None,
+        rate_limiter: RateLimiter = None,
+        retry_policy: RetryPolicy = None,
+        search_cache: SearchCache = None,
+        api_domain: str = None,
+        auth0_domain: str = AUTH0_DOMAIN):
+        """
+        Args:
+            username (str)
+            password (str)
+            logger (Callable[[str], None], optional): Logs out activities. Defaults to None.
+            transport (AsyncTransport, optional): Sends all the HTTP requests. Defaults to AiohttpTransport.
+            max_concurrent_requests (int, optional): Maximal number of tiles being fetched at once per analysis. Defaults to 16.
+            image_cache (TileImageCache, optional): Stores downloaded satelite images on disk. Defaults to None.
+            polling_policy (PollingPolicy, optional): Decides how often status of server side procedures is checked and how long they may take. Defaults to PollingPolicy().
+            rate_limiter (RateLimiter, optional): Limits rate of requests per endpoint family, e.g. to stay within api quota. Defaults to None, i.e. no limits.
+            retry_policy (RetryPolicy, optional): Retries idempotent requests (tile fetches) failed on transient errors. Defaults to RetryPolicy().
+            search_cache (SearchCache, optional): Stores searched date intervals and their scenes, so only the intervals not searched yet are queried. Defaults to None, i.e. the whole interval is searched every time.
+            api_domain (str, optional): Domain of the spaceknow apis, e.g. of a local fake server. Defaults to None, i.e. SpaceknowApi.DOMAIN.
+            auth0_domain (str, optional): Domain of the Auth0 authorization. Defaults to AUTH0_DOMAIN.
+        """
+        self.__credentials = Credentials(username, password)
+        self.__search_cache = search_cache
+        self.__tasking_manager = AsyncTaskingManager(lambda tx, nm: logger(f'{tx}! Next try in {nm:.1f}s.')  if logger else None, polling_policy)
+        self.__transport = transport or AiohttpTransport()
+        self.__auth_session = AsyncAuthorizedSession(transport=self.__transport, rate_limiter=rate_limiter, retry_policy=retry_policy, domain=api_domain)
+        self.__ragnar_api = AsyncRagnarApi(self.__auth_session)
+        self.__kraken_api = AsyncKrakenApi(self.__auth_session, image_cache)
+        self.__auth_service = AsyncAuthorizationService(self.AUTH0_CLIENT_ID, self.__transport, auth0_domain)
+        self.__auth_session.token_provider = AsyncTokenProvider(self.__auth_service, self.__credentials)
+        self.__max_concurrent_requests = max_concurrent_requests
+        self.__is_initialized = False
+
+    async def analyse_on(self, extent: GeoJSON, from_date: datetime, to_date: datetime) -> AsyncSpaceknowAnalysis:
+        """Requests imagery data from a remote api and returns 'AsyncSpaceknowAnalysis' object on which futher actions may be caried out
+
+        Args:
+            extent (GeoJSON): The area of convern
+            from_date (datetime): The earliest possible image creationg date
+            to_date (datetime): The latest possible image creationg date
+
+        Returns:
+            AsyncSpaceknowAnalysis: By means of this object the analysis is conducted
+        """
+        await self.initialize()
+        sceneids_with_datetimes = await self.__get_scene_ids_with_datetimes(extent, from_date, to_date)
+        if len(sceneids_with_datetimes) == 0:
+            raise NoEntriesException('No scene ids.')
+        return AsyncSpaceknowAnalysis(self.__kraken_api, self.__tasking_manager, sceneids_with_datetimes, extent, self.__max_concurrent_requests)
+
+    async def __get_scene_ids_with_datetimes(self, extent: GeoJSON, from_date: datetime, to_date: datetime) -> list[tuple[datetime,str]]:
+        """Searches only the date intervals missing in the search cache. See SpaceknowCarsAnalyser."""
+        key = search_key(extent, AsyncRagnarApi.DEFAULT_PROVIDER, AsyncRagnarApi.DEFAULT_DATASET)
+        covered = self.__search_cache.get_intervals(key) if self.__search_cache is not None else []
+        intervals = uncovered_intervals(covered, from_date, to_date)
+        ragnar_task_objs = await gather(self.__ragnar_api.initiate_search(extent, f, t) for f, t in intervals)
+        searched = await self.__tasking_manager.wait_all(ragnar_task_objs)
+        if self.__search_cache is None:
+            return searched[0]
+        for (f, t), sceneids_with_datetimes in zip(intervals, searched):
+            self.__search_cache.put(key, f, t, sceneids_with_datetimes)
+        return self.__search_cache.get_results(key, from_date, to_date)
+
+    async def initialize(self):
+        """Authenticates the user. Afterwards the token is refreshed ahead of its expiration (see AsyncTokenProvider)."""
+        if not self.__is_initialized:
+            await self.__auth_session.token_provider.token()
+            self.__is_initialized = True
+
+    async def close(self) -> None:
+        """Closes the underlying transport."""
+        await self.__transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,68 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import json as jsonlib
+
+
+@dataclass
+class TransportResponse:
+    """Response returned by an AsyncTransport. Mimics the parts of 'requests.Response' the apis rely on."""
+    status_code: int
+    content: bytes
+    headers: dict = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        """Parses content as json.
+
+        Raises:
+            ValueError: When the content isn't json parsable.
+        """
+        return jsonlib.loads(self.content)
+
+
+class AsyncTransport(ABC):
+    """Sends HTTP requests without blocking the event loop. Implement it to plug in a different HTTP client (e.g. a local fake server)."""
+
+    @abstractmethod
+    async def request(self, method: str, url: str, headers: dict = None, json: dict = None) -> TransportResponse:
+        pass
+
+    async def close(self) -> None:
+        """Releases underlying connections."""
+        pass
+
+
+class AiohttpTransport(AsyncTransport):
+    """AsyncTransport backed by 'aiohttp' package. One connection pool is shared by all requests."""
+
+    def __init__(self, limit: int = 100):
+        """
+        Args:
+            limit (int, optional): Maximal number of simultaneously opened connections. Defaults to 100.
+
+        Raises:
+            ImportError: When 'aiohttp' package isn't installed.
+        """
+        try:
+            import aiohttp
+        except ImportError as ex:
+            raise ImportError("AiohttpTransport requires 'aiohttp' package. Install it or provide a different AsyncTransport.") from ex
+        self.__aiohttp = aiohttp
+        self.__limit = limit
+        self.__session = None
+
+    async def request(self, method: str, url: str, headers: dict = None, json: dict = None) -> TransportResponse:
+        # The client session has to be created within a running event loop.
+        if self.__session is None:
+            connector = self.__aiohttp.TCPConnector(limit=self.__limit)
+            self.__session = self.__aiohttp.ClientSession(connector=connector)
+        async with self.__session.request(method, url, headers=headers, json=json) as response:
+            return TransportResponse(response.status, await response.read(), dict(response.headers))
+
+    async def close(self) -> None:
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
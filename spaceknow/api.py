@@ -1,54 +1,236 @@
 from typing import Tuple
 from PIL import Image, UnidentifiedImageError
 from requests import Session
-from spaceknow.errors import UnexpectedResponseException, SpaceknowApiException,TaskingError, TaskingException
+from requests.adapters import HTTPAdapter
+from dataclasses import dataclass
+from spaceknow.errors import ApiError, KrakenError, MapExpiredException, UnexpectedResponseException, SpaceknowApiException,TaskingError, TaskingException
 from geojson import GeoJSON
 from datetime import datetime
-from spaceknow.models import Feature, TaskingStatus, GeoJSONExtentValidator
-from typing import Callable, Union
+from spaceknow.models import DetectionBatch, Feature, TaskingStatus, GeoJSONExtentValidator
+from spaceknow.cache import TileImageCache
+from spaceknow.authorization import TokenProvider
+from spaceknow.throttling import RateLimiter, RetryPolicy, retry_after
+from typing import Any, Callable, Optional, Union
+from time import sleep
 from io import BytesIO
+import json
+try:
+    import orjson
+except ImportError:
+    # Responses are decoded by the standard json module.
+    orjson = None
 
 
 POST_METHOD = 'POST'
 GET_METHOD = 'GET'
 
+@dataclass
+class ConnectionSettings:
+    """Tunes connections of an AuthorizedSession."""
+    pool_connections: int = 10
+    """Number of hosts whose connection pools are kept."""
+    pool_maxsize: int = 16
+    """Maximal number of connections kept alive per host. Should be at least the number of requests sent at once (e.g. max_workers)."""
+    pool_block: bool = False
+    """If True, a request waits for a pooled connection instead of opening an extra one, which is discarded afterwards."""
+    keep_alive: bool = True
+    """Reuses connections, so TCP and TLS handshakes aren't repeated for every request."""
+    timeout: Union[float, Tuple[float, float], None] = (10, 60)
+    """Connect and read timeouts in seconds. None means waiting forever."""
+    compression: bool = True
+    """Accepts gzip/deflate compressed responses (e.g. detections.geojson)."""
+
+
+@dataclass
+class ConnectionPoolStats:
+    host: str
+    connections: int
+    """Number of connections opened so far, i.e. number of handshakes."""
+    requests: int
+    """Number of requests sent so far."""
+    maxsize: int
+
+
 class AuthorizedSession(Session):
-    """Session that contains authorization token."""
-    def __init__(self, authToken: str = None):
+    """Session that contains authorization token. Requests of all the apis sharing the session are throttled by its rate limiter and retried by its retry policy."""
+    def __init__(self, authToken: str = None, rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None, connection_settings: ConnectionSettings = None,
+        token_provider: TokenProvider = None, domain: str = None):
+        """
+        Args:
+            authToken (str, optional): Authorization token. Defaults to None.
+            rate_limiter (RateLimiter, optional): Limits rate of requests per endpoint family. Defaults to None, i.e. no limits.
+            retry_policy (RetryPolicy, optional): Retries failed idempotent requests. Defaults to RetryPolicy().
+            connection_settings (ConnectionSettings, optional): Connection pooling, keep-alive, timeouts and compression. Defaults to ConnectionSettings().
+            token_provider (TokenProvider, optional): Provides always valid token to the apis, which overrides 'authToken'. Defaults to None.
+            domain (str, optional): Domain the apis sharing the session send requests to, e.g. of a local fake server. Defaults to None, i.e. SpaceknowApi.DOMAIN.
+        """
         super().__init__()
+        self.domain = domain
+        self.token_provider = token_provider
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.connection_settings = connection_settings or ConnectionSettings()
+        self.__configure_connections(self.connection_settings)
         self.update_auth_token(authToken)
 
     def update_auth_token(self, authToken: str) -> None:
         """Updates current authorization token.""" 
         self.headers.update({'authorization': f'Bearer {authToken}'})
 
+    def request(self, method, url, **kwargs):
+        """Sends a request (see 'requests.Session.request'). Timeout of the connection settings is used unless a different one is given."""
+        kwargs.setdefault('timeout', self.connection_settings.timeout)
+        return super().request(method, url, **kwargs)
+
+    def pool_stats(self) -> list[ConnectionPoolStats]:
+        """Returns statistics of connection pools per host. Many more requests than connections means the connections are being reused."""
+        stats = []
+        for adapter in dict.fromkeys(self.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    stats.append(ConnectionPoolStats(f'{pool.scheme}://{pool.host}', pool.num_connections, pool.num_requests, pool.pool.maxsize))
+        return stats
+
+    def __configure_connections(self, settings: ConnectionSettings) -> None:
+        adapter = HTTPAdapter(pool_connections=settings.pool_connections, pool_maxsize=settings.pool_maxsize, pool_block=settings.pool_block)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({
+            'Connection': 'keep-alive' if settings.keep_alive else 'close',
+            'Accept-Encoding': 'gzip, deflate' if settings.compression else 'identity'})
+
 
 
 class SpaceknowApi:
     """Base class for all spaceknow APIs. Handling spaceknow api ERRORS. Expects only json formatted response."""
     DOMAIN = 'https://api.spaceknow.com'
     TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    MAX_ERROR_BODY_SIZE = 4096
     def __init__(self, session: AuthorizedSession):
         self._session = session
         self._extent_validator = GeoJSONExtentValidator(0)
 
+    def _request(self, method, api_endpoint, json_body: dict = None):
+        """Sends a request to an API and returns the raw response. See '_send'."""
+        return self._send(method, api_endpoint, json_body)[0]
+
+    def _send(self, method, api_endpoint, json_body: dict = None, decode_json: bool = False) -> Tuple[Any, Optional[Any]]:
+        """Sends a request to an API. The request is throttled and retried according to the session (see AuthorizedSession).
+        When the token of the session's token provider is rejected, only this request is sent again with a refreshed one.
+
+        Args:
+            decode_json (bool, optional): If True, the body is decoded once (see '_decode_json') and checked for a rejected token,
+                instead of being decoded again by the caller. Defaults to False.
+
+        Returns:
+            Tuple[Any, Optional[Any]]: The raw response and its decoded body, None when it wasn't decoded or isn't json parsable.
+        """
+        attempt = 0
+        reauthorized = False
+        while True:
+            self.__sleep(self._throttle_delay(api_endpoint))
+            token_provider = getattr(self._session, 'token_provider', None)
+            token = token_provider.token() if token_provider is not None else None
+            try:
+                response = self._session.request(method, url= self._url(api_endpoint), json=json_body, **self._authorization_kwargs(token))
+            except Exception as ex:
+                delay = self._retry_delay(method, attempt, exception=ex)
+                if delay is None:
+                    raise
+            else:
+                body = self._try_decode_json(response) if decode_json else None
+                if token is not None and not reauthorized and self._is_authorization_failure(response, body):
+                    token_provider.invalidate(token)
+                    reauthorized = True
+                    continue
+                delay = self._retry_delay(method, attempt, response=response)
+                if delay is None:
+                    return response, body
+            self.__sleep(delay)
+            attempt += 1
+
+    def _url(self, api_endpoint: str) -> str:
+        """Url of an endpoint at the domain of the session, SpaceknowApi.DOMAIN unless the session sets another one."""
+        return (getattr(self._session, 'domain', None) or self.DOMAIN) + api_endpoint
+
+    def _authorization_kwargs(self, token: Optional[str]) -> dict:
+        """Request arguments overriding authorization header of the session with a token given by its token provider."""
+        return {'headers': {'authorization': f'Bearer {token}'}} if token is not None else {}
+
+    def _is_authorization_failure(self, response, body: Any = None) -> bool:
+        """Checks whether the api rejected the token. Unless the decoded body is given, only small json bodies are parsed, i.e. tiles aren't."""
+        if getattr(response, 'status_code', None) == 401:
+            return True
+        if body is None:
+            content = response.content or b''
+            if len(content) > self.MAX_ERROR_BODY_SIZE or not content.lstrip().startswith(b'{'):
+                return False
+            body = self._try_decode_json(response)
+        return isinstance(body, dict) and body.get('error') in [ApiError.NOT_AUTHORIZED, ApiError.INVALID_JWT]
+
+    def _throttle_delay(self, api_endpoint: str) -> float:
+        """Reserves a request at the rate limiter of the session and returns number of seconds to wait before sending it."""
+        rate_limiter = getattr(self._session, 'rate_limiter', None)
+        return rate_limiter.reserve(api_endpoint) if rate_limiter is not None else 0.0
+
+    def _retry_delay(self, method: str, attempt: int, response = None, exception: Exception = None) -> Optional[float]:
+        """Returns number of seconds to wait before the request is retried or None when it shouldn't be retried."""
+        retry_policy = getattr(self._session, 'retry_policy', None)
+        if retry_policy is None:
+            return None
+        status_code = getattr(response, 'status_code', None)
+        if not retry_policy.should_retry(method, attempt, status_code, exception):
+            return None
+        return retry_policy.delay(attempt, retry_after(getattr(response, 'headers', None)))
+
+    def __sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            sleep(seconds)
+
     def _call(self, method, api_endpoint, json_body: dict) -> dict:
         """Calls an API."""
-        response = self._session.request(method, url= self.DOMAIN + api_endpoint, json=json_body)
+        response, body = self._send(method, api_endpoint, json_body, decode_json=True)
+        return self._parse_response(response, body)
+
+    def _parse_response(self, response, body: Any = None) -> dict:
+        """Parses json body of a response, unless it was decoded already, and checks it for spaceknow api errors."""
         try:       
-            response_json =  response.json()
+            response_json = body if body is not None else self._decode_json(response)
             self.__check_for_errors(response_json)
             return response_json
         except ValueError as ex:
             raise UnexpectedResponseException(response.text) from ex
 
+    def _decode_json(self, response) -> dict:
+        """Decodes json body of a response. Uses 'orjson' package when installed, as it is several times faster on large bodies (e.g. detections).
+
+        Raises:
+            ValueError: When the body isn't json parsable.
+        """
+        if orjson is None:
+            return response.json()
+        return orjson.loads(response.content)
+
+    def _try_decode_json(self, response) -> Optional[Any]:
+        """Decodes json body of a response or returns None when it isn't json parsable."""
+        try:
+            return self._decode_json(response)
+        except ValueError:
+            return None
+
     def _get_image(self, endpoint) -> Image:
         """Gets image from a given endpoint.
 
         Raises:
             UnexpectedResponseException: When no image parsable data are presented.
         """
-        response = self._session.request(GET_METHOD, url = self.DOMAIN + endpoint)
+        response = self._request(GET_METHOD, endpoint)
+        return self._parse_image(response)
+
+    def _parse_image(self, response) -> Image:
+        """Parses image out of a response content."""
         try:
             return Image.open(BytesIO(response.content))
         except UnidentifiedImageError:
@@ -104,6 +286,9 @@ class TaskingObject(SpaceknowApi):
             Tuple[TaskingStatus, int]: Tuple of a current status and int represnting recommended time before next check.
         """
         response = self.call(POST_METHOD, self.ENDPOINT, {'pipelineId': self.pipeline_id})
+        return self._parse_status(response)
+
+    def _parse_status(self, response: dict) -> Tuple[TaskingStatus, int]:
         status = self._try_get('status', response)
         nextTry = int(response.get('nextTry', 0))
         return TaskingStatus[status], nextTry
@@ -126,32 +311,41 @@ class RagnarApi(SpaceknowApi):
     """Ragnar API is a system that can be used for searching and ordering satellite imagery"""
     INITIATE_ENDPOINT = '/imagery/search/initiate'    
     RETRIEVE_ENDPOINT = '/imagery/search/retrieve'
+    DEFAULT_PROVIDER = 'gbdx'
+    DEFAULT_DATASET = 'idaho-pansharpened'
 
     def initiate_search(
         self, 
         extent: GeoJSON, 
         from_date_time: datetime, 
         to_date_time: datetime, 
-        images_provider: str = 'gbdx', 
-        dataset: str = 'idaho-pansharpened') -> TaskingObject:
+        images_provider: str = DEFAULT_PROVIDER, 
+        dataset: str = DEFAULT_DATASET) -> TaskingObject:
         """Initiates search for scenes intersecting with a given extent. Returned scenes are within a given time period and are provided by a given provider and dataset.
 
         Args:
             extent (GeoJSON): Desired area to obtain satelite images for.
         """
+        json_body = self._search_request_body(extent, from_date_time, to_date_time, images_provider, dataset)
+        response = self._call(POST_METHOD, self.INITIATE_ENDPOINT, json_body)
+        pipeline_id = self._try_get('pipelineId', response)
+        return TaskingObject(self._session, pipeline_id, lambda: self.retrieve_results(pipeline_id))
+
+    def attach_search(self, pipeline_id: str) -> TaskingObject:
+        """Returns TaskingObject of a search initiated earlier (e.g. by a previous run), so it isn't initiated again."""
+        return TaskingObject(self._session, pipeline_id, lambda: self.retrieve_results(pipeline_id))
+
+    def _search_request_body(self, extent: GeoJSON, from_date_time: datetime, to_date_time: datetime, images_provider: str, dataset: str) -> dict:
+        """Validates arguments of a search and builds its request body."""
         self._extent_validator.validate(extent)
         self.__check_dates_validity(from_date_time, to_date_time)  
-        json_body = {
+        return {
             'provider': images_provider,
             'dataset': dataset,
             'startDatetime': from_date_time.strftime(self.TIME_FORMAT),
             'endDatetime': to_date_time.strftime(self.TIME_FORMAT),
             'extent': extent
         } 
-        response = self._call(POST_METHOD, self.INITIATE_ENDPOINT, json_body)
-        pipeline_id = self._try_get('pipelineId', response)
-        return TaskingObject(self._session, pipeline_id, lambda: self.retrieve_results(pipeline_id))
-
 
     def __check_dates_validity(self, from_date_time: datetime, to_date_time: datetime):
         if from_date_time > to_date_time:
@@ -171,17 +365,20 @@ class RagnarApi(SpaceknowApi):
         Returns:
             list[str]: List of scene ids coresponding to original query in 'initiate_search' method.
         """
-        response = None
         try:
             response = self._call(POST_METHOD, self.RETRIEVE_ENDPOINT,{'pipelineId': pipeline_id})
-            results = response['results']
-            datetimes = [datetime.strptime(r['datetime'], self.TIME_FORMAT) for r in results]
-            scenes = [r['sceneId'] for r in results ]
-            return list(zip(datetimes,scenes))
         except SpaceknowApiException as ex:
             if ex.error_type in [TaskingError.NON_EXISTENT_PIPELINE, TaskingError.PIPELINE_NOT_PROCESSED]:
                 raise TaskingException(ex.error_type, ex.error_message) from ex
             raise
+        return self._parse_search_results(response)
+
+    def _parse_search_results(self, response: dict) -> list[tuple[datetime, str]]:
+        try:
+            results = response['results']
+            datetimes = [datetime.strptime(r['datetime'], self.TIME_FORMAT) for r in results]
+            scenes = [r['sceneId'] for r in results ]
+            return list(zip(datetimes,scenes))
         except KeyError as ex:
             raise UnexpectedResponseException(response) from ex
 
@@ -198,6 +395,15 @@ class KrakenApi(SpaceknowApi):
 
     GRID_CARS_ENDPOINT = "/kraken/grid/%s/-/%s/%s/%s/detections.geojson"
     """/kraken/grid/<map_id>/-/<z>/<x>/<y>/detections.geojson"""
+
+    def __init__(self, session: AuthorizedSession, image_cache: TileImageCache = None):
+        """
+        Args:
+            session (AuthorizedSession): HttpClient with valid authorization token
+            image_cache (TileImageCache, optional): Stores downloaded satelite images, so they are fetched only once. Defaults to None.
+        """
+        super().__init__(session)
+        self._image_cache = image_cache
     
     def initiate_car_analysis(self, extent: GeoJSON, scene_id: str) -> TaskingObject:
         """[summary]
@@ -222,17 +428,28 @@ class KrakenApi(SpaceknowApi):
         """
         return self.__initiate_analysis(extent, scene_id, 'imagery')
 
+    def attach_car_analysis(self, pipeline_id: str) -> TaskingObject:
+        """Returns TaskingObject of a cars analysis initiated earlier (e.g. by a previous run), so it isn't initiated again."""
+        return TaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, 'cars'))
+
+    def attach_imagery_analysis(self, pipeline_id: str) -> TaskingObject:
+        """Returns TaskingObject of an imagery analysis initiated earlier (e.g. by a previous run), so it isn't initiated again."""
+        return TaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, 'imagery'))
+
     def __initiate_analysis(self, extent: GeoJSON, scene_id: str, middle_path: str) -> TaskingObject:
-        self._extent_validator.validate(extent)
-        body_json = {
-            'sceneId': scene_id,
-            'extent': extent
-        }
+        body_json = self._analysis_request_body(extent, scene_id)
         endpoint = self.RELEASE_ENDPOINT %(middle_path, 'initiate')
         response = self._call(POST_METHOD, endpoint, body_json)
         pipeline_id = self._try_get('pipelineId', response)
         return TaskingObject(self._session, pipeline_id, lambda: self.__retrieve_analysis(pipeline_id, middle_path))
 
+    def _analysis_request_body(self, extent: GeoJSON, scene_id: str) -> dict:
+        """Validates arguments of an analysis and builds its request body."""
+        self._extent_validator.validate(extent)
+        return {
+            'sceneId': scene_id,
+            'extent': extent
+        }
 
     def __retrieve_analysis(self, pipeline_id: str, middle_path: str) -> Union[str, list]:
         """Retrieves data from a server. In a case the data aren't ready to be retrieved, the TaskingException is raised. 
@@ -252,13 +469,25 @@ class KrakenApi(SpaceknowApi):
             endpoint = self.RELEASE_ENDPOINT %(middle_path, 'retrieve')
             body_json = {'pipelineId': pipeline_id}
             response = self._call(POST_METHOD, endpoint, body_json)
-            map_id = self._try_get('mapId', response)
-            tiles = self._try_get('tiles', response)
-            return map_id, tiles
         except SpaceknowApiException as ex:
             if ex.error_type in [TaskingError.NON_EXISTENT_PIPELINE, TaskingError.PIPELINE_NOT_PROCESSED]:
                 raise TaskingException(ex.error_type, ex.error_message) from ex
             raise
+        return self._parse_analysis_results(response)
+
+    def _parse_response(self, response, body: Any = None) -> dict:
+        """Parses a response (see SpaceknowApi). Missing maps are reported by MapExpiredException."""
+        try:
+            return super()._parse_response(response, body)
+        except SpaceknowApiException as ex:
+            if ex.error_type in [KrakenError.NON_EXISTENT_MAP]:
+                raise MapExpiredException(ex.error_type, ex.error_message) from ex
+            raise
+
+    def _parse_analysis_results(self, response: dict) -> Union[str, list]:
+        map_id = self._try_get('mapId', response)
+        tiles = self._try_get('tiles', response)
+        return map_id, tiles
     
 
     def get_satelite_image(self, map_id: str, tile: Tuple[int, int, int]) -> Image.Image:
@@ -272,7 +501,15 @@ class KrakenApi(SpaceknowApi):
             Image.Image: Satelite image coresponding to give map_id, tile.
         """
         endpoint = self.GRID_IMAGERY_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
-        return self._get_image(endpoint)
+        if self._image_cache is None:
+            return self._get_image(endpoint)
+        content = self._image_cache.get(map_id, tile)
+        if content is not None:
+            return Image.open(BytesIO(content))
+        response = self._request(GET_METHOD, endpoint)
+        image = self._parse_image(response)
+        self._image_cache.put(map_id, tile, response.content)
+        return image
 
     def get_detections(self, map_id: str, tile: Tuple[int,int,int]) -> list[Feature]:
         """Retrieves data results of cars analysis. 
@@ -286,31 +523,65 @@ class KrakenApi(SpaceknowApi):
         """
         endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
         response = self._call(GET_METHOD, endpoint, json_body=None)
-        return self.__parse_detections_to_list_of_features(response)
-
-
-    def __parse_detections_to_list_of_features(self, detections: dict) -> list[Feature]:
-        features = self._try_get('features', detections)
-    
-        geometry_strings = [self._try_get('geometry', f) for f in features]
-        properties = [self._try_get('properties', f) for f in features]
-        
-        classes = [self._try_get('class',p) for p in properties]
-        counts = [int(self._try_get('count',p)) for p in properties]
-        geometries = [GeoJSON(g) for g in geometry_strings]
-
-        return [Feature(item[0], item[1], item[2]) for item in zip(classes, counts, geometries)]
-            
-
-
-
-
-
-     
+        return self._parse_detections_to_list_of_features(response)
 
+    def get_detection_batch(self, map_id: str, tile: Tuple[int,int,int]) -> DetectionBatch:
+        """Retrieves data results of cars analysis in compact columnar form. See 'get_detections'.
 
+        Args:
+            map_id (str): Unique identifier of analysis result.
+            tile (Tuple[int,int,int]): Tile coordinates (zoom, x_tile, y_tile).
 
+        Returns:
+            DetectionBatch: Detections found in the tile.
+        """
+        endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        response = self._call(GET_METHOD, endpoint, json_body=None)
+        return self._parse_detections_to_batch(response)
 
+    def get_detection_counts(self, map_id: str, tile: Tuple[int,int,int]) -> dict[str, int]:
+        """Retrieves only number of objects per class found in a tile. Geometries of the detections are skipped entirely,
+        which makes it much cheaper than 'get_detections' when only the counts are needed.
 
+        Args:
+            map_id (str): Unique identifier of analysis result.
+            tile (Tuple[int,int,int]): Tile coordinates (zoom, x_tile, y_tile).
 
+        Returns:
+            dict[str, int]: Number of objects per class, e.g. {'cars': 12}.
+        """
+        endpoint = self.GRID_CARS_ENDPOINT %(map_id, tile[0], tile[1], tile[2])
+        response = self._call(GET_METHOD, endpoint, json_body=None)
+        return self._parse_detection_counts(response)
 
+    def _parse_detection_counts(self, detections: dict) -> dict[str, int]:
+        counts = {}
+        try:
+            for feature in self._try_get('features', detections):
+                properties = feature['properties']
+                class_type = properties['class']
+                counts[class_type] = counts.get(class_type, 0) + int(properties['count'])
+        except (KeyError, TypeError, AttributeError, ValueError) as ex:
+            raise UnexpectedResponseException(detections) from ex
+        return counts
+
+    def _parse_detections_to_batch(self, detections: dict) -> DetectionBatch:
+        """Parses detections in a single pass straight into columnar form. No geometry objects are built until a detection is accessed."""
+        builder = DetectionBatch.builder()
+        try:
+            for feature in self._try_get('features', detections):
+                properties = feature['properties']
+                builder.append(properties['class'], int(properties['count']), feature['geometry'])
+        except (KeyError, TypeError, AttributeError, ValueError) as ex:
+            raise UnexpectedResponseException(detections) from ex
+        return builder.build()
+
+    def _parse_detections_to_list_of_features(self, detections: dict) -> list[Feature]:
+        features = []
+        try:
+            for feature in self._try_get('features', detections):
+                properties = feature['properties']
+                features.append(Feature(properties['class'], int(properties['count']), GeoJSON(feature['geometry'])))
+        except (KeyError, TypeError, AttributeError, ValueError) as ex:
+            raise UnexpectedResponseException(detections) from ex
+        return features
@@ -1,8 +1,15 @@
 from requests import Session
+from threading import Lock
+from time import time
+from typing import Callable, Optional
+import base64
+import json
 from spaceknow.errors import  AuthenticationException, UnexpectedResponseException
 from spaceknow.models import Credentials
 
 AUTH0_DOMAIN = 'https://spaceknow.auth0.com'
+AUTH0_CLIENT_ID = 'hmWJcfhRouDOaJK2L8asREMlMrv3jFE1'
+"""Auth0 client of the spaceknow apis, shared by the synchronous and the asynchronous analysers."""
 
 class AuthorizationService:
     """Service providing authorization via JWT"""
@@ -12,9 +19,16 @@ class AuthorizationService:
 
     ENDPOINT = '/oauth/ro'
 
-    def __init__(self, client_id, session: Session = None):
+    def __init__(self, client_id, session: Session = None, domain: str = AUTH0_DOMAIN):
+        """
+        Args:
+            client_id (str): Auth0 client id.
+            session (Session, optional): Sends the requests. Pass in the session of the apis, so they share connection pool. Defaults to a new Session.
+            domain (str, optional): Auth0 domain, e.g. of a local fake server. Defaults to AUTH0_DOMAIN.
+        """
         self.__client_id =  client_id
         self.__session = session or Session()
+        self.domain = domain
 
     def request_jwt(self, credentials: Credentials) -> str:
         """ Authenticates user with giver username and password and if successed returns jwt else throws AuthenticationException
@@ -26,8 +40,14 @@ class AuthorizationService:
         Returns:
             str: json web token
         """
-        pass
-        body_json = {
+        body_json = self._jwt_request_body(credentials)
+        url = self.domain + self.ENDPOINT
+        # The session may be shared with the apis, their authorization header isn't sent to auth0.
+        response = self.__session.post(url=url, json=body_json, headers={'authorization': None})
+        return self._parse_jwt_response(response)
+
+    def _jwt_request_body(self, credentials: Credentials) -> dict:
+        return {
             'client_id': self.__client_id,
             'username': credentials.username,
             'password': credentials.password,
@@ -35,8 +55,9 @@ class AuthorizationService:
             'grant_type': self.DEFAULT_GRANT_TYPE,
             'scope': self.DEFAULT_SCOPE
         }
-        url = AUTH0_DOMAIN + self.ENDPOINT
-        response = self.__session.post(url=url, json=body_json)      
+
+    def _parse_jwt_response(self, response) -> str:
+        """Parses json web token out of a response. Raises AuthenticationException in a case of rejected credentials."""
         try:
             return response.json()['id_token']
         except ValueError:
@@ -48,5 +69,65 @@ class AuthorizationService:
                 raise AuthenticationException(f'{error_type}: {error_message}.')
             else:
                 raise UnexpectedResponseException(response)
-    
 
+
+def jwt_expiration(token: str) -> Optional[float]:
+    """Reads expiration time ('exp' claim) of a JWT. The signature isn't verified.
+
+    Returns:
+        Optional[float]: Unix time the token expires at or None when it can't be read.
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenProvider:
+    """Provides valid JWT to the apis. The token is refreshed ahead of its expiration, or after the api rejected it, 
+    by a single thread while the others wait for it. Safe to be used from multiple threads."""
+    DEFAULT_REFRESH_MARGIN = 60
+
+    def __init__(self, authorization_service: AuthorizationService, credentials: Credentials, refresh_margin: float = DEFAULT_REFRESH_MARGIN, clock: Callable[[], float] = time):
+        """
+        Args:
+            authorization_service (AuthorizationService): Requests new tokens.
+            credentials (Credentials): User's credentials.
+            refresh_margin (float, optional): Number of seconds before expiration the token is refreshed at. Defaults to 60.
+            clock (Callable[[], float], optional): Returns current unix time. Defaults to time.time.
+        """
+        self._authorization_service = authorization_service
+        self._credentials = credentials
+        self.__refresh_margin = refresh_margin
+        self.__clock = clock
+        self._token = None
+        self.__expiration = None
+        self.__lock = Lock()
+
+    def token(self) -> str:
+        """Returns valid token, requests a new one when needed.
+
+        Raises:
+            AuthenticationException: When the credentials are rejected.
+        """
+        with self.__lock:
+            if self._needs_refresh():
+                self._set_token(self._authorization_service.request_jwt(self._credentials))
+            return self._token
+
+    def invalidate(self, token: str) -> None:
+        """Marks a token as rejected by the api, so it is refreshed on the next request. Tokens already refreshed by other threads are kept."""
+        with self.__lock:
+            if self._token == token:
+                self._token = None
+
+    def _needs_refresh(self) -> bool:
+        if self._token is None:
+            return True
+        return self.__expiration is not None and self.__clock() >= self.__expiration - self.__refresh_margin
+
+    def _set_token(self, token: str) -> None:
+        self._token = token
+        self.__expiration = jwt_expiration(token)
@@ -0,0 +1,648 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import datetime, timedelta
+from geojson import GeoJSON
+from hashlib import sha1, sha256
+from spaceknow.models import DetectionBatch
+from threading import Lock, get_ident
+from time import time
+from typing import Any, Callable, Hashable, Optional, Tuple
+import json
+import os
+import sqlite3
+import sys
+
+
+def extent_fingerprint(extent: GeoJSON, precision: int = 9) -> str:
+    """Computes canonical fingerprint of an extent. Equal extents have equal fingerprints regardless of key order or float noise.
+
+    Args:
+        extent (GeoJSON): Area of concern.
+        precision (int, optional): Number of decimal places the coordinates are rounded to. Defaults to 9 (~0.1 mm).
+
+    Returns:
+        str: Hex digest identifying the extent.
+    """
+    def canonical(value):
+        if isinstance(value, float):
+            return round(value, precision)
+        if isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        if isinstance(value, dict):
+            return {k: canonical(v) for k, v in value.items()}
+        return value
+    canonical_json = json.dumps(canonical(extent), sort_keys=True, separators=(',', ':'))
+    return sha1(canonical_json.encode('utf-8')).hexdigest()
+
+
+class DetectionsCache(ABC):
+    """Stores results of Kraken cars analyses, i.e. map_id and tiles per (extent, scene) and detections and their counts per (extent, scene, tile).
+    Extents are identified by their fingerprints (see 'extent_fingerprint')."""
+    DEFAULT_TTL = 24 * 60 * 60
+    """Kraken maps expire on serverside, so map_ids of the scenes shouldn't be kept for long."""
+
+    @abstractmethod
+    def get_scene(self, extent_key: str, scene_id: str) -> Optional[Tuple[str, list[tuple[int,int,int]]]]:
+        """Returns (map_id, tiles) of a scene or None when it isn't cached."""
+        pass
+
+    @abstractmethod
+    def put_scene(self, extent_key: str, scene_id: str, map_id: str, tiles: list[tuple[int,int,int]]) -> None:
+        pass
+
+    @abstractmethod
+    def get_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[DetectionBatch]:
+        """Returns detections found in a tile or None when it isn't cached."""
+        pass
+
+    @abstractmethod
+    def put_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], detections: DetectionBatch) -> None:
+        pass
+
+    @abstractmethod
+    def get_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[dict[str, int]]:
+        """Returns number of objects per class found in a tile or None when it isn't cached."""
+        pass
+
+    @abstractmethod
+    def put_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], counts: dict[str, int]) -> None:
+        pass
+
+
+def approximate_size(value: Any) -> int:
+    """Approximates number of bytes taken up by a value, including the objects it contains (lists, dicts, dataclasses)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(v) for v in value)
+    elif is_dataclass(value):
+        size += sum(approximate_size(getattr(value, f.name)) for f in fields(value))
+    return size
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+class LRUCache:
+    """Thread safe in-memory cache. Least recently used entries are evicted once approximate size of the values exceeds 'max_bytes'."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = approximate_size, on_evict: Callable[[Hashable], None] = None):
+        """
+        Args:
+            max_bytes (int): Memory ceiling of the stored values.
+            sizeof (Callable[[Any], int], optional): Approximates size of a value in bytes. Defaults to approximate_size.
+            on_evict (Callable[[Hashable], None], optional): Called with keys of the entries evicted (or not stored) due to the memory ceiling,
+                e.g. to remove entries depending on them. It's called without the lock held, so it may use the cache. Defaults to None.
+        """
+        self.__max_bytes = max_bytes
+        self.__sizeof = sizeof
+        self.__on_evict = on_evict
+        self.__entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.__size = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__lock = Lock()
+
+    def get(self, key: Hashable, default = None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value) -> None:
+        """Stores a value. Values bigger than the memory ceiling aren't stored at all."""
+        size = self.__sizeof(value)
+        evicted = []
+        with self.__lock:
+            replaced = self.__entries.pop(key, None)
+            if replaced is not None:
+                self.__size -= replaced[1]
+            if size > self.__max_bytes:
+                evicted.append(key)
+            else:
+                self.__entries[key] = (value, size)
+                self.__size += size
+            while self.__size > self.__max_bytes:
+                evicted_key, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__size -= evicted_size
+                self.__evictions += 1
+                evicted.append(evicted_key)
+        if self.__on_evict is not None:
+            for evicted_key in evicted:
+                self.__on_evict(evicted_key)
+
+    def pop(self, key: Hashable, default = None):
+        """Removes an entry and returns its value."""
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                return default
+            self.__size -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(self.__hits, self.__misses, self.__evictions, len(self.__entries), self.__size)
+
+
+class MemoryDetectionsCache(DetectionsCache):
+    """Process-local DetectionsCache bounded by memory (see LRUCache). Safe to be used from multiple threads.
+    A scene is evicted together with any of its tiles, so its map_id isn't reused to fetch the tiles again after it may have expired."""
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = DetectionsCache.DEFAULT_TTL, clock: Callable[[], float] = time):
+        """
+        Args:
+            max_bytes (int, optional): Memory ceiling of the cached results. Defaults to 256 MiB.
+            ttl (float, optional): Time in seconds after which entries expire. None means entries never expire, which is safe only as long as
+                the kraken maps don't expire. Defaults to one day.
+            clock (Callable[[], float], optional): Returns current unix time. Defaults to time.time.
+        """
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__lru = LRUCache(max_bytes, on_evict=self.__on_evict)
+
+    @property
+    def stats(self) -> CacheStats:
+        """Hit, miss and eviction counters alongside with current size of the cache."""
+        return self.__lru.stats
+
+    def get_scene(self, extent_key: str, scene_id: str) -> Optional[Tuple[str, list[tuple[int,int,int]]]]:
+        return self.__get(('scene', extent_key, scene_id))
+
+    def put_scene(self, extent_key: str, scene_id: str, map_id: str, tiles: list[tuple[int,int,int]]) -> None:
+        self.__put(('scene', extent_key, scene_id), (map_id, tiles))
+
+    def get_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[DetectionBatch]:
+        return self.__get(('tile', extent_key, scene_id, tuple(tile)))
+
+    def put_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], detections: DetectionBatch) -> None:
+        self.__put(('tile', extent_key, scene_id, tuple(tile)), detections)
+
+    def get_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[dict[str, int]]:
+        return self.__get(('counts', extent_key, scene_id, tuple(tile)))
+
+    def put_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], counts: dict[str, int]) -> None:
+        self.__put(('counts', extent_key, scene_id, tuple(tile)), counts)
+
+    def clear(self) -> None:
+        """Removes all the entries."""
+        self.__lru.clear()
+
+    def __get(self, key: tuple):
+        entry = self.__lru.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if self.__ttl is not None and created <= self.__clock() - self.__ttl:
+            self.__lru.pop(key)
+            return None
+        return value
+
+    def __put(self, key: tuple, value) -> None:
+        self.__lru.put(key, (value, self.__clock()))
+
+    def __on_evict(self, key: tuple) -> None:
+        if key[0] != 'scene':
+            self.__lru.pop(('scene', key[1], key[2]))
+
+
+class SqliteDetectionsCache(DetectionsCache):
+    """Persistent DetectionsCache stored in a sqlite database file. Safe to be used from multiple threads.
+    Once the stored entries exceed 'max_bytes', least recently used tiles and the oldest scenes and counts are evicted.
+    A scene is evicted together with any of its tiles, so its map_id isn't reused to fetch the tiles again after it may have expired."""
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, ttl: Optional[float] = DetectionsCache.DEFAULT_TTL):
+        """
+        Args:
+            path (str): Path to the database file. It is created when it doesn't exist.
+            max_bytes (int, optional): Upper bound of the size of stored entries. Defaults to 512 MiB.
+            ttl (float, optional): Time in seconds after which entries expire. None means entries never expire, which is safe only as long as
+                the kraken maps don't expire. Defaults to one day.
+        """
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute('''CREATE TABLE IF NOT EXISTS scenes (
+                extent_key TEXT, scene_id TEXT, map_id TEXT, tiles TEXT, created REAL,
+                PRIMARY KEY (extent_key, scene_id))''')
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS scenes_created ON scenes (created)')
+            self.__connection.execute('''CREATE TABLE IF NOT EXISTS tile_detections (
+                extent_key TEXT, scene_id TEXT, z INTEGER, x INTEGER, y INTEGER, detections BLOB, size INTEGER, created REAL, accessed REAL,
+                PRIMARY KEY (extent_key, scene_id, z, x, y))''')
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS tile_detections_accessed ON tile_detections (accessed)')
+            self.__connection.execute('''CREATE TABLE IF NOT EXISTS tile_counts (
+                extent_key TEXT, scene_id TEXT, z INTEGER, x INTEGER, y INTEGER, counts TEXT, created REAL,
+                PRIMARY KEY (extent_key, scene_id, z, x, y))''')
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS tile_counts_created ON tile_counts (created)')
+        # Scenes and counts take up the length of their json.
+        self.__size = sum(self.__connection.execute(query).fetchone()[0] for query in [
+            'SELECT COALESCE(SUM(LENGTH(tiles)), 0) FROM scenes',
+            'SELECT COALESCE(SUM(size), 0) FROM tile_detections',
+            'SELECT COALESCE(SUM(LENGTH(counts)), 0) FROM tile_counts'])
+
+    def get_scene(self, extent_key: str, scene_id: str) -> Optional[Tuple[str, list[tuple[int,int,int]]]]:
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT map_id, tiles FROM scenes WHERE extent_key = ? AND scene_id = ? AND created > ?',
+                (extent_key, scene_id, self.__expiration())).fetchone()
+        if row is None:
+            return None
+        return row[0], [tuple(t) for t in json.loads(row[1])]
+
+    def put_scene(self, extent_key: str, scene_id: str, map_id: str, tiles: list[tuple[int,int,int]]) -> None:
+        content = json.dumps([list(t) for t in tiles])
+        with self.__lock, self.__connection:
+            self.__delete_scene(extent_key, scene_id)
+            self.__connection.execute('INSERT INTO scenes VALUES (?, ?, ?, ?, ?)', (extent_key, scene_id, map_id, content, time()))
+            self.__size += len(content)
+            self.__evict()
+
+    def get_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[DetectionBatch]:
+        key = (extent_key, scene_id, *tile)
+        with self.__lock, self.__connection:
+            row = self.__connection.execute(
+                'SELECT detections FROM tile_detections WHERE extent_key = ? AND scene_id = ? AND z = ? AND x = ? AND y = ? AND created > ?',
+                (*key, self.__expiration())).fetchone()
+            if row is None:
+                return None
+            self.__connection.execute(
+                'UPDATE tile_detections SET accessed = ? WHERE extent_key = ? AND scene_id = ? AND z = ? AND x = ? AND y = ?', (time(), *key))
+        return DetectionBatch.from_bytes(row[0])
+
+    def put_tile(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], detections: DetectionBatch) -> None:
+        key = (extent_key, scene_id, *tile)
+        content = detections.to_bytes()
+        size = len(content)
+        now = time()
+        with self.__lock, self.__connection:
+            replaced = self.__connection.execute(
+                'SELECT size FROM tile_detections WHERE extent_key = ? AND scene_id = ? AND z = ? AND x = ? AND y = ?', key).fetchone()
+            self.__connection.execute('INSERT OR REPLACE INTO tile_detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (*key, content, size, now, now))
+            self.__size += size - (replaced[0] if replaced else 0)
+            self.__evict()
+
+    def get_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int]) -> Optional[dict[str, int]]:
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT counts FROM tile_counts WHERE extent_key = ? AND scene_id = ? AND z = ? AND x = ? AND y = ? AND created > ?',
+                (extent_key, scene_id, *tile, self.__expiration())).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put_tile_counts(self, extent_key: str, scene_id: str, tile: tuple[int,int,int], counts: dict[str, int]) -> None:
+        key = (extent_key, scene_id, *tile)
+        content = json.dumps(counts)
+        with self.__lock, self.__connection:
+            replaced = self.__connection.execute(
+                'SELECT LENGTH(counts) FROM tile_counts WHERE extent_key = ? AND scene_id = ? AND z = ? AND x = ? AND y = ?', key).fetchone()
+            self.__connection.execute('INSERT OR REPLACE INTO tile_counts VALUES (?, ?, ?, ?, ?, ?, ?)', (*key, content, time()))
+            self.__size += len(content) - (replaced[0] if replaced else 0)
+            self.__evict()
+
+    def clear(self) -> None:
+        """Removes all the entries."""
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM scenes')
+            self.__connection.execute('DELETE FROM tile_detections')
+            self.__connection.execute('DELETE FROM tile_counts')
+            self.__size = 0
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __expiration(self) -> float:
+        """Entries created before the returned time are expired."""
+        return time() - self.__ttl if self.__ttl is not None else float('-inf')
+
+    def __evict(self) -> None:
+        """Removes expired entries and then the least recently used ones untill the size limit is met. Tiles are ordered by their last access,
+        scenes and counts by their creation. Expects the lock to be held."""
+        if self.__ttl is not None:
+            expiration = self.__expiration()
+            for table, size in [('scenes', 'LENGTH(tiles)'), ('tile_detections', 'size'), ('tile_counts', 'LENGTH(counts)')]:
+                self.__size -= self.__connection.execute(f'SELECT COALESCE(SUM({size}), 0) FROM {table} WHERE created <= ?', (expiration,)).fetchone()[0]
+                self.__connection.execute(f'DELETE FROM {table} WHERE created <= ?', (expiration,))
+        while self.__size > self.__max_bytes:
+            candidates = [(table, row) for table, row in [
+                ('scenes', self.__connection.execute('SELECT created, rowid, LENGTH(tiles), extent_key, scene_id FROM scenes ORDER BY created LIMIT 1').fetchone()),
+                ('tile_detections', self.__connection.execute('SELECT accessed, rowid, size, extent_key, scene_id FROM tile_detections ORDER BY accessed LIMIT 1').fetchone()),
+                ('tile_counts', self.__connection.execute('SELECT created, rowid, LENGTH(counts), extent_key, scene_id FROM tile_counts ORDER BY created LIMIT 1').fetchone())]
+                if row is not None]
+            if not candidates:
+                break
+            table, (_, rowid, size, extent_key, scene_id) = min(candidates, key=lambda c: c[1][0])
+            self.__connection.execute(f'DELETE FROM {table} WHERE rowid = ?', (rowid,))
+            self.__size -= size
+            self.__delete_scene(extent_key, scene_id)
+
+    def __delete_scene(self, extent_key: str, scene_id: str) -> None:
+        """Expects the lock to be held."""
+        row = self.__connection.execute('SELECT LENGTH(tiles) FROM scenes WHERE extent_key = ? AND scene_id = ?', (extent_key, scene_id)).fetchone()
+        if row is not None:
+            self.__connection.execute('DELETE FROM scenes WHERE extent_key = ? AND scene_id = ?', (extent_key, scene_id))
+            self.__size -= row[0]
+
+
+def search_key(extent: GeoJSON, images_provider: str, dataset: str) -> str:
+    """Builds key of Ragnar searches of an extent in imagery of a given provider and dataset (see SearchCache)."""
+    return f'{extent_fingerprint(extent)}/{images_provider}/{dataset}'
+
+
+def merge_intervals(intervals: list[tuple[datetime, datetime]]) -> list[tuple[datetime, datetime]]:
+    """Merges overlapping or touching closed intervals and returns them sorted."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def covered_interval(from_date_time: datetime, to_date_time: datetime, recent_margin: float, now: datetime) -> Optional[tuple[datetime, datetime]]:
+    """Returns the part of a searched interval to be marked as searched. The part after 'now - recent_margin' (seconds) isn't, 
+    since the provider may ingest its scenes late. None when no part is old enough."""
+    end = min(to_date_time, now - timedelta(seconds=recent_margin))
+    return (from_date_time, end) if end > from_date_time else None
+
+
+def uncovered_intervals(covered: list[tuple[datetime, datetime]], from_date_time: datetime, to_date_time: datetime) -> list[tuple[datetime, datetime]]:
+    """Returns sub-intervals of [from_date_time, to_date_time] not covered by any of the 'covered' intervals. 
+    The sub-intervals share their bounds with the covered ones, so no instant in between is missed."""
+    gaps = []
+    start = from_date_time
+    for covered_start, covered_end in merge_intervals(covered):
+        if covered_end < start:
+            continue
+        if covered_start > to_date_time:
+            break
+        if covered_start > start:
+            gaps.append((start, covered_start))
+        start = max(start, covered_end)
+        if start >= to_date_time:
+            return gaps
+    gaps.append((start, to_date_time))
+    return gaps
+
+
+DEFAULT_RECENT_MARGIN = 3 * 24 * 3600
+"""Searched dates more recent than 3 days are searched again, as scenes may be ingested by the provider days after they were taken."""
+
+
+class SearchCache(ABC):
+    """Stores results of Ragnar searches, i.e. (datetime, scene_id) per search key (see 'search_key'), alongside with the date intervals 
+    searched so far. A search of a moving window then queries only the intervals not searched yet."""
+
+    @abstractmethod
+    def get_intervals(self, key: str) -> list[tuple[datetime, datetime]]:
+        """Returns merged closed intervals searched so far."""
+        pass
+
+    @abstractmethod
+    def get_results(self, key: str, from_date_time: datetime, to_date_time: datetime) -> list[tuple[datetime, str]]:
+        """Returns stored (datetime, scene_id) within [from_date_time, to_date_time] ordered by datetime."""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, from_date_time: datetime, to_date_time: datetime, results: list[tuple[datetime, str]]) -> None:
+        """Stores results of a search of [from_date_time, to_date_time] and marks the interval as searched, except of its most recent part (see 'covered_interval')."""
+        pass
+
+
+class MemorySearchCache(SearchCache):
+    """Process-local SearchCache. Safe to be used from multiple threads."""
+
+    def __init__(self, recent_margin: float = DEFAULT_RECENT_MARGIN, clock: Callable[[], datetime] = datetime.now):
+        """
+        Args:
+            recent_margin (float, optional): Number of seconds before now, after which searched dates are searched again next time. Defaults to 3 days.
+            clock (Callable[[], datetime], optional): Returns current time. Defaults to datetime.now.
+        """
+        self.__recent_margin = recent_margin
+        self.__clock = clock
+        self.__intervals: dict[str, list[tuple[datetime, datetime]]] = {}
+        self.__results: dict[str, set[tuple[datetime, str]]] = {}
+        self.__lock = Lock()
+
+    def get_intervals(self, key: str) -> list[tuple[datetime, datetime]]:
+        with self.__lock:
+            return list(self.__intervals.get(key, []))
+
+    def get_results(self, key: str, from_date_time: datetime, to_date_time: datetime) -> list[tuple[datetime, str]]:
+        with self.__lock:
+            return sorted(r for r in self.__results.get(key, ()) if from_date_time <= r[0] <= to_date_time)
+
+    def put(self, key: str, from_date_time: datetime, to_date_time: datetime, results: list[tuple[datetime, str]]) -> None:
+        interval = covered_interval(from_date_time, to_date_time, self.__recent_margin, self.__clock())
+        with self.__lock:
+            if interval is not None:
+                self.__intervals[key] = merge_intervals(self.__intervals.get(key, []) + [interval])
+            self.__results.setdefault(key, set()).update((d, s) for d, s in results)
+
+    def clear(self) -> None:
+        """Removes all the entries."""
+        with self.__lock:
+            self.__intervals.clear()
+            self.__results.clear()
+
+
+class SqliteSearchCache(SearchCache):
+    """Persistent SearchCache stored in a sqlite database file, so a daily search of a moving window queries only the new days. 
+    Safe to be used from multiple threads."""
+    TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+    def __init__(self, path: str, recent_margin: float = DEFAULT_RECENT_MARGIN, clock: Callable[[], datetime] = datetime.now):
+        """
+        Args:
+            path (str): Path to the database file. It is created when it doesn't exist.
+            recent_margin (float, optional): Number of seconds before now, after which searched dates are searched again next time. Defaults to 3 days.
+            clock (Callable[[], datetime], optional): Returns current time. Defaults to datetime.now.
+        """
+        self.__recent_margin = recent_margin
+        self.__clock = clock
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS search_intervals (key TEXT, start TEXT, end TEXT, PRIMARY KEY (key, start))')
+            self.__connection.execute('''CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT, datetime TEXT, scene_id TEXT, PRIMARY KEY (key, datetime, scene_id))''')
+
+    def get_intervals(self, key: str) -> list[tuple[datetime, datetime]]:
+        with self.__lock:
+            rows = self.__connection.execute('SELECT start, end FROM search_intervals WHERE key = ? ORDER BY start', (key,)).fetchall()
+        return [(self.__parse(s), self.__parse(e)) for s, e in rows]
+
+    def get_results(self, key: str, from_date_time: datetime, to_date_time: datetime) -> list[tuple[datetime, str]]:
+        with self.__lock:
+            rows = self.__connection.execute(
+                'SELECT datetime, scene_id FROM search_results WHERE key = ? AND datetime BETWEEN ? AND ? ORDER BY datetime, scene_id',
+                (key, self.__format(from_date_time), self.__format(to_date_time))).fetchall()
+        return [(self.__parse(d), s) for d, s in rows]
+
+    def put(self, key: str, from_date_time: datetime, to_date_time: datetime, results: list[tuple[datetime, str]]) -> None:
+        interval = covered_interval(from_date_time, to_date_time, self.__recent_margin, self.__clock())
+        with self.__lock, self.__connection:
+            if interval is not None:
+                rows = self.__connection.execute('SELECT start, end FROM search_intervals WHERE key = ?', (key,)).fetchall()
+                intervals = merge_intervals([(self.__parse(s), self.__parse(e)) for s, e in rows] + [interval])
+                self.__connection.execute('DELETE FROM search_intervals WHERE key = ?', (key,))
+                self.__connection.executemany('INSERT INTO search_intervals VALUES (?, ?, ?)', 
+                    [(key, self.__format(s), self.__format(e)) for s, e in intervals])
+            self.__connection.executemany('INSERT OR IGNORE INTO search_results VALUES (?, ?, ?)', 
+                [(key, self.__format(d), s) for d, s in results])
+
+    def clear(self) -> None:
+        """Removes all the entries."""
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM search_intervals')
+            self.__connection.execute('DELETE FROM search_results')
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __format(self, date_time: datetime) -> str:
+        return date_time.strftime(self.TIME_FORMAT)
+
+    def __parse(self, value: str) -> datetime:
+        return datetime.strptime(value, self.TIME_FORMAT)
+
+
+class TileImageCache:
+    """Content-addressed on-disk cache of raw satelite images (e.g. truecolor.png) keyed by map_id and tile.
+    Every image is stored once under the digest of its content, identical tiles of different maps share it.
+    Least recently used images are evicted once their total size exceeds 'max_bytes'. Safe to be used from multiple threads."""
+    LOW_WATERMARK = 0.9
+    """Eviction frees space down to this fraction of 'max_bytes', so it doesn't run on every put."""
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Args:
+            directory (str): Directory the images are stored in. It is created when it doesn't exist.
+            max_bytes (int, optional): Upper bound of the size of stored images. Defaults to 1 GiB.
+        """
+        self.__keys_directory = os.path.join(directory, 'keys')
+        self.__blobs_directory = os.path.join(directory, 'blobs')
+        os.makedirs(self.__keys_directory, exist_ok=True)
+        os.makedirs(self.__blobs_directory, exist_ok=True)
+        self.__max_bytes = max_bytes
+        self.__lock = Lock()
+        self.__size = sum(size for _, size, _ in self.__stat_blobs())
+
+    def get(self, map_id: str, tile: tuple[int,int,int]) -> Optional[bytes]:
+        """Returns raw image of a tile or None when it isn't cached."""
+        key_path = self.__key_path(map_id, tile)
+        try:
+            with open(key_path) as key_file:
+                blob_path = self.__blob_path(key_file.read())
+            with open(blob_path, 'rb') as blob_file:
+                content = blob_file.read()
+            os.utime(blob_path)
+            return content
+        except FileNotFoundError:
+            # Either the tile wasn't cached or its image was evicted meanwhile.
+            return None
+
+    def put(self, map_id: str, tile: tuple[int,int,int], content: bytes) -> None:
+        digest = sha256(content).hexdigest()
+        blob_path = self.__blob_path(digest)
+        with self.__lock:
+            if os.path.exists(blob_path):
+                os.utime(blob_path)
+            else:
+                self.__write_atomically(blob_path, content)
+                self.__size += len(content)
+            self.__write_atomically(self.__key_path(map_id, tile), digest.encode('ascii'))
+            if self.__size > self.__max_bytes:
+                self.__evict()
+
+    @property
+    def size_bytes(self) -> int:
+        return self.__size
+
+    def __evict(self) -> None:
+        """Removes least recently used images untill the size drops below the low watermark, alongside with the keys pointing to them. Expects the lock to be held."""
+        evicted = set()
+        for _, size, path in sorted(self.__stat_blobs()):
+            if self.__size <= self.__max_bytes * self.LOW_WATERMARK:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.__size -= size
+            evicted.add(os.path.basename(path))
+        if not evicted:
+            return
+        for path in self.__file_paths(self.__keys_directory):
+            try:
+                with open(path) as key_file:
+                    is_evicted = key_file.read() in evicted
+                if is_evicted:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Removed by another process meanwhile.
+                pass
+
+    def __stat_blobs(self) -> list[tuple[float, int, str]]:
+        """Returns modification time, size and path of every stored image."""
+        stats = []
+        for directory in self.__file_paths(self.__blobs_directory, directories=True):
+            for path in self.__file_paths(directory):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stats.append((stat.st_mtime, stat.st_size, path))
+        return stats
+
+    def __file_paths(self, directory: str, directories: bool = False) -> list[str]:
+        """Lists files (or directories) of a directory, skipping unfinished writes (see '__write_atomically') and entries removed during the scan."""
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return []
+        paths = []
+        for entry in entries:
+            try:
+                if entry.is_dir() == directories and not entry.name.endswith('.tmp'):
+                    paths.append(entry.path)
+            except FileNotFoundError:
+                continue
+        return paths
+
+    def __key_path(self, map_id: str, tile: tuple[int,int,int]) -> str:
+        key = f'{map_id}/{tile[0]}/{tile[1]}/{tile[2]}'
+        return os.path.join(self.__keys_directory, sha1(key.encode('utf-8')).hexdigest())
+
+    def __blob_path(self, digest: str) -> str:
+        return os.path.join(self.__blobs_directory, digest[:2], digest)
+
+    def __write_atomically(self, path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.{get_ident()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(content)
+        os.replace(temporary_path, path)
@@ -0,0 +1,213 @@
+from abc import ABC, abstractmethod
+from threading import Lock
+from time import time
+from typing import Any, Callable, Optional
+import json
+import sqlite3
+from spaceknow.api import TaskingObject
+from spaceknow.errors import TaskingException
+from spaceknow.models import TaskingStatus
+
+
+def checkpoint_key(*parts) -> str:
+    """Builds key of a checkpoint out of its parts, e.g. checkpoint_key('imagery', extent_key, scene_id)."""
+    return '/'.join(str(p) for p in parts)
+
+
+class CheckpointStore(ABC):
+    """Records progress of analyses, so a re-run (e.g. after a crash) reattaches to server side procedures initiated before
+    and fetches only the tiles it is missing. Progress is recorded per key (see 'checkpoint_key') as
+    - pipeline id of an initiated procedure,
+    - result of a resolved procedure (json serializable, e.g. map_id and tiles),
+    - tiles completed so far."""
+
+    @abstractmethod
+    def get_pipeline(self, key: str) -> Optional[str]:
+        """Returns pipeline id of a procedure or None when it wasn't initiated."""
+        pass
+
+    @abstractmethod
+    def put_pipeline(self, key: str, pipeline_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_result(self, key: str) -> Optional[Any]:
+        """Returns result of a procedure or None when it wasn't resolved."""
+        pass
+
+    @abstractmethod
+    def put_result(self, key: str, result: Any) -> None:
+        pass
+
+    @abstractmethod
+    def get_completed_tiles(self, key: str) -> set[tuple[int,int,int]]:
+        pass
+
+    @abstractmethod
+    def put_completed_tile(self, key: str, tile: tuple[int,int,int]) -> None:
+        pass
+
+    @abstractmethod
+    def discard(self, key: str) -> None:
+        """Removes pipeline id, result and completed tiles of a key, e.g. when the procedure expired on serverside."""
+        pass
+
+
+def resume_or_initiate(store: Optional[CheckpointStore], key: str, attach: Callable[[str], TaskingObject], initiate: Callable[[], TaskingObject]) -> TaskingObject:
+    """Reattaches to a procedure recorded under a key or initiates a new one and records it. 
+    Recorded procedures, which failed or no longer exist on serverside, are discarded and initiated again.
+
+    Args:
+        store (CheckpointStore, optional): Records the procedures. None initiates the procedure without recording it.
+        key (str): Identifies the procedure (see 'checkpoint_key').
+        attach (Callable[[str], TaskingObject]): Returns tasking object of a given pipeline id, e.g. KrakenApi.attach_car_analysis.
+        initiate (Callable[[], TaskingObject]): Initiates the procedure.
+    """
+    if store is None:
+        return initiate()
+    pipeline_id = store.get_pipeline(key)
+    if pipeline_id is not None:
+        tasking_object = attach(pipeline_id)
+        try:
+            status, _ = tasking_object.get_status()
+            if status != TaskingStatus.FAILED:
+                return tasking_object
+        except TaskingException:
+            pass
+        store.discard(key)
+    tasking_object = initiate()
+    store.put_pipeline(key, tasking_object.pipeline_id)
+    return tasking_object
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """Process-local CheckpointStore. Reattaches only analyses repeated by the same analyser. Safe to be used from multiple threads."""
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = time):
+        """
+        Args:
+            ttl (float, optional): Time in seconds after which results expire, e.g. lifetime of Kraken maps. Defaults to None, i.e. results never expire.
+            clock (Callable[[], float], optional): Returns current unix time. Defaults to time.time.
+        """
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__pipelines: dict[str, str] = {}
+        self.__results: dict[str, tuple[Any, float]] = {}
+        self.__tiles: dict[str, set[tuple[int,int,int]]] = {}
+        self.__lock = Lock()
+
+    def get_pipeline(self, key: str) -> Optional[str]:
+        with self.__lock:
+            return self.__pipelines.get(key)
+
+    def put_pipeline(self, key: str, pipeline_id: str) -> None:
+        with self.__lock:
+            self.__pipelines[key] = pipeline_id
+
+    def get_result(self, key: str) -> Optional[Any]:
+        with self.__lock:
+            result, created = self.__results.get(key, (None, None))
+            if result is not None and self.__ttl is not None and created <= self.__clock() - self.__ttl:
+                # Expired results (e.g. of Kraken maps no longer available) are dropped with their pipeline, so the procedure is initiated again.
+                self.__pipelines.pop(key, None)
+                del self.__results[key]
+                return None
+            return result
+
+    def put_result(self, key: str, result: Any) -> None:
+        with self.__lock:
+            self.__results[key] = (result, self.__clock())
+
+    def get_completed_tiles(self, key: str) -> set[tuple[int,int,int]]:
+        with self.__lock:
+            return set(self.__tiles.get(key, ()))
+
+    def put_completed_tile(self, key: str, tile: tuple[int,int,int]) -> None:
+        with self.__lock:
+            self.__tiles.setdefault(key, set()).add(tuple(tile))
+
+    def discard(self, key: str) -> None:
+        with self.__lock:
+            self.__pipelines.pop(key, None)
+            self.__results.pop(key, None)
+            self.__tiles.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all the checkpoints."""
+        with self.__lock:
+            self.__pipelines.clear()
+            self.__results.clear()
+            self.__tiles.clear()
+
+
+class SqliteCheckpointStore(CheckpointStore):
+    """Persistent CheckpointStore stored in a sqlite database file, so analyses are resumed across runs. Safe to be used from multiple threads."""
+
+    def __init__(self, path: str, ttl: float = None):
+        """
+        Args:
+            path (str): Path to the database file. It is created when it doesn't exist.
+            ttl (float, optional): Time in seconds after which results expire, e.g. lifetime of Kraken maps. Defaults to None, i.e. results never expire.
+        """
+        self.__ttl = ttl
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS pipelines (key TEXT PRIMARY KEY, pipeline_id TEXT, created REAL)')
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT, created REAL)')
+            self.__connection.execute('''CREATE TABLE IF NOT EXISTS completed_tiles (
+                key TEXT, z INTEGER, x INTEGER, y INTEGER, PRIMARY KEY (key, z, x, y))''')
+
+    def get_pipeline(self, key: str) -> Optional[str]:
+        row = self.__fetchone('SELECT pipeline_id FROM pipelines WHERE key = ?', (key,))
+        return row[0] if row is not None else None
+
+    def put_pipeline(self, key: str, pipeline_id: str) -> None:
+        self.__execute('INSERT OR REPLACE INTO pipelines VALUES (?, ?, ?)', (key, pipeline_id, time()))
+
+    def get_result(self, key: str) -> Optional[Any]:
+        row = self.__fetchone('SELECT result, created FROM results WHERE key = ?', (key,))
+        if row is None:
+            return None
+        if self.__ttl is not None and row[1] <= time() - self.__ttl:
+            # Expired results (e.g. of Kraken maps no longer available) are dropped with their pipeline, so the procedure is initiated again.
+            with self.__lock, self.__connection:
+                self.__connection.execute('DELETE FROM pipelines WHERE key = ?', (key,))
+                self.__connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            return None
+        return json.loads(row[0])
+
+    def put_result(self, key: str, result: Any) -> None:
+        self.__execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, json.dumps(result), time()))
+
+    def get_completed_tiles(self, key: str) -> set[tuple[int,int,int]]:
+        with self.__lock:
+            rows = self.__connection.execute('SELECT z, x, y FROM completed_tiles WHERE key = ?', (key,)).fetchall()
+        return {tuple(r) for r in rows}
+
+    def put_completed_tile(self, key: str, tile: tuple[int,int,int]) -> None:
+        self.__execute('INSERT OR IGNORE INTO completed_tiles VALUES (?, ?, ?, ?)', (key, *tile))
+
+    def discard(self, key: str) -> None:
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM pipelines WHERE key = ?', (key,))
+            self.__connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.__connection.execute('DELETE FROM completed_tiles WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        """Removes all the checkpoints."""
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM pipelines')
+            self.__connection.execute('DELETE FROM results')
+            self.__connection.execute('DELETE FROM completed_tiles')
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __fetchone(self, query: str, parameters: tuple) -> Optional[tuple]:
+        with self.__lock:
+            return self.__connection.execute(query, parameters).fetchone()
+
+    def __execute(self, query: str, parameters: tuple) -> None:
+        with self.__lock, self.__connection:
+            self.__connection.execute(query, parameters)
@@ -0,0 +1,189 @@
+from bisect import bisect_left
+from typing import Sequence
+import math
+from geojson import GeoJSON
+from spaceknow.models import DetectionBatch
+try:
+    import numpy as np
+except ImportError:
+    # Points are tested one by one in pure Python.
+    np = None
+
+OUTSIDE = 0
+INSIDE = 1
+BOUNDARY = 2
+
+
+def extent_polygons(extent: GeoJSON) -> list[list[list[tuple[float, float]]]]:
+    """Returns rings (outer ring first, holes afterwards) of every polygon of an extent, given by a Polygon or MultiPolygon (optionally wrapped in a Feature).
+
+    Raises:
+        ValueError: When the extent isn't a Polygon or MultiPolygon.
+    """
+    geometry = extent.get('geometry', extent) if extent.get('type') == 'Feature' else extent
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f"{geometry['type']} isn't supported, the extent has to be a Polygon or MultiPolygon.")
+    return [[[(p[0], p[1]) for p in ring] for ring in polygon] for polygon in polygons]
+
+
+class ExtentIndex:
+    """Uniform grid index over edges of an extent (Polygon or MultiPolygon, holes included) answering point-in-extent queries in bulk.
+    Cells of the grid are classified once as inside, outside or crossed by edges. A point in an inside or outside cell is decided by a lookup,
+    a point in a crossed cell by parity of crossings of the segment to the cell center with the few edges of the cell only."""
+
+    MAX_GRID_SIZE = 256
+
+    def __init__(self, extent: GeoJSON, grid_size: int = None):
+        """
+        Args:
+            extent (GeoJSON): Area of concern.
+            grid_size (int, optional): Number of cells per side of the grid. Defaults to twice the square root of the number of edges (at most MAX_GRID_SIZE).
+
+        Raises:
+            ValueError: When the extent isn't a Polygon or MultiPolygon.
+        """
+        edges = [(a[0], a[1], b[0], b[1]) for polygon in extent_polygons(extent) for ring in polygon for a, b in zip(ring, ring[1:] + ring[:1]) if a != b]
+        self.__edges = edges
+        self.__grid_size = grid_size or max(1, min(self.MAX_GRID_SIZE, int(2 * math.sqrt(len(edges)))))
+        xs = [c for e in edges for c in (e[0], e[2])]
+        ys = [c for e in edges for c in (e[1], e[3])]
+        self.__min_x, self.__min_y, self.__max_x, self.__max_y = min(xs), min(ys), max(xs), max(ys)
+        self.__cell_width = (self.__max_x - self.__min_x) / self.__grid_size or 1.0
+        self.__cell_height = (self.__max_y - self.__min_y) / self.__grid_size or 1.0
+        self.__build_grid()
+
+    @property
+    def grid_size(self) -> int:
+        return self.__grid_size
+
+    def contains(self, xs: Sequence[float], ys: Sequence[float]) -> Sequence[bool]:
+        """Tests which of the points (longitudes, latitudes) lie within the extent.
+
+        Returns:
+            Sequence[bool]: Numpy array if numpy is installed, list otherwise.
+        """
+        if np is None:
+            return [self.__contains_point(x, y) for x, y in zip(xs, ys)]
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        result = np.zeros(len(xs), dtype=bool)
+        in_bounds = (xs >= self.__min_x) & (xs <= self.__max_x) & (ys >= self.__min_y) & (ys <= self.__max_y)
+        points = np.flatnonzero(in_bounds)
+        cells = self.__cells_array(xs[points], ys[points])
+        states = self.__states_array[cells]
+        result[points[states == INSIDE]] = True
+        crossed = states == BOUNDARY
+        points, cells = points[crossed], cells[crossed]
+        if len(points) == 0:
+            return result
+        # Every point is paired with every edge of its cell.
+        edge_counts = self.__edge_offsets_array[cells + 1] - self.__edge_offsets_array[cells]
+        pair_points = np.repeat(np.arange(len(points)), edge_counts)
+        starts = np.repeat(self.__edge_offsets_array[cells] - np.cumsum(edge_counts) + edge_counts, edge_counts)
+        pair_edges = self.__cell_edges_array[starts + np.arange(len(pair_points))]
+        px, py = xs[points][pair_points], ys[points][pair_points]
+        cx, cy = self.__center_xs_array[cells][pair_points], self.__center_ys_array[cells][pair_points]
+        ax, ay, bx, by = self.__edges_array[pair_edges].T
+        crossings = self.__crosses_array(px, py, cx, cy, ax, ay, bx, by)
+        parity = np.bincount(pair_points, weights=crossings, minlength=len(points)).astype(int) % 2
+        result[points] = (self.__center_states_array[cells] == INSIDE) ^ (parity == 1)
+        return result
+
+    def count_within(self, detections: DetectionBatch, class_type: str = None) -> int:
+        """Sums up counts of the detections whose center (center of the bounding box of the outer ring) lies within the extent, optionally only of the given class."""
+        if len(detections) == 0:
+            return 0
+        lons, lats, offsets = detections.outer_rings()
+        if np is None:
+            xs, ys = [], []
+            for start, end in zip(offsets, offsets[1:]):
+                xs.append((min(lons[start:end]) + max(lons[start:end])) / 2)
+                ys.append((min(lats[start:end]) + max(lats[start:end])) / 2)
+            within = self.contains(xs, ys)
+            codes = range(len(detections.class_names)) if class_type is None else \
+                [detections.class_names.index(class_type)] if class_type in detections.class_names else []
+            return sum(n for w, c, n in zip(within, detections.class_codes, detections.counts) if w and c in codes)
+        lons, lats, starts = np.frombuffer(lons, dtype=float), np.frombuffer(lats, dtype=float), np.asarray(offsets[:-1])
+        xs = (np.minimum.reduceat(lons, starts) + np.maximum.reduceat(lons, starts)) / 2
+        ys = (np.minimum.reduceat(lats, starts) + np.maximum.reduceat(lats, starts)) / 2
+        within = self.contains(xs, ys)
+        if class_type is not None:
+            if class_type not in detections.class_names:
+                return 0
+            within &= np.frombuffer(detections.class_codes, dtype=np.uint16) == detections.class_names.index(class_type)
+        return int(np.asarray(detections.counts, dtype=np.int64)[within].sum())
+
+    def __build_grid(self) -> None:
+        size = self.__grid_size
+        cell_edges = [[] for _ in range(size * size)]
+        for index, (ax, ay, bx, by) in enumerate(self.__edges):
+            min_col, min_row = self.__cell(min(ax, bx), min(ay, by))
+            max_col, max_row = self.__cell(max(ax, bx), max(ay, by))
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    cell_edges[row * size + col].append(index)
+        self.__cell_edges = cell_edges
+        self.__center_xs = [self.__min_x + (col + 0.5) * self.__cell_width for col in range(size)] * size
+        self.__center_ys = [self.__min_y + (row + 0.5) * self.__cell_height for row in range(size) for _ in range(size)]
+        self.__center_states = []
+        for row in range(size):
+            # Crossings of the horizontal line through the centers of a row decide all its centers at once.
+            y = self.__center_ys[row * size]
+            crossings = sorted(ax + (y - ay) * (bx - ax) / (by - ay) for ax, ay, bx, by in self.__edges if (ay > y) != (by > y))
+            self.__center_states.extend(INSIDE if bisect_left(crossings, self.__center_xs[col]) % 2 else OUTSIDE for col in range(size))
+        self.__states = [BOUNDARY if edges else state for edges, state in zip(cell_edges, self.__center_states)]
+        if np is not None:
+            self.__states_array = np.array(self.__states, dtype=np.int8)
+            self.__center_states_array = np.array(self.__center_states, dtype=np.int8)
+            self.__center_xs_array = np.array(self.__center_xs)
+            self.__center_ys_array = np.array(self.__center_ys)
+            self.__edges_array = np.array(self.__edges, dtype=float).reshape(-1, 4)
+            self.__edge_offsets_array = np.cumsum([0] + [len(e) for e in cell_edges])
+            self.__cell_edges_array = np.array([i for e in cell_edges for i in e], dtype=np.int64)
+
+    def __cell(self, x: float, y: float) -> tuple[int, int]:
+        size = self.__grid_size
+        col = min(size - 1, max(0, int((x - self.__min_x) / self.__cell_width)))
+        row = min(size - 1, max(0, int((y - self.__min_y) / self.__cell_height)))
+        return col, row
+
+    def __cells_array(self, xs, ys):
+        size = self.__grid_size
+        cols = np.clip(((xs - self.__min_x) / self.__cell_width).astype(np.int64), 0, size - 1)
+        rows = np.clip(((ys - self.__min_y) / self.__cell_height).astype(np.int64), 0, size - 1)
+        return rows * size + cols
+
+    def __contains_point(self, x: float, y: float) -> bool:
+        if not (self.__min_x <= x <= self.__max_x and self.__min_y <= y <= self.__max_y):
+            return False
+        col, row = self.__cell(x, y)
+        cell = row * self.__grid_size + col
+        if self.__states[cell] != BOUNDARY:
+            return self.__states[cell] == INSIDE
+        cx, cy = self.__center_xs[cell], self.__center_ys[cell]
+        crossings = sum(self.__crosses(x, y, cx, cy, *self.__edges[e]) for e in self.__cell_edges[cell])
+        return (self.__center_states[cell] == INSIDE) != (crossings % 2 == 1)
+
+    @staticmethod
+    def __crosses(px, py, cx, cy, ax, ay, bx, by) -> bool:
+        """Tests whether segment from the point to the cell center crosses the edge. Vertices lying on the segment count to one side only."""
+        a_side = (cx - px) * (ay - py) - (cy - py) * (ax - px) > 0
+        b_side = (cx - px) * (by - py) - (cy - py) * (bx - px) > 0
+        if a_side == b_side:
+            return False
+        p_orientation = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        c_orientation = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        return p_orientation * c_orientation < 0
+
+    @staticmethod
+    def __crosses_array(px, py, cx, cy, ax, ay, bx, by):
+        """Vectorized '__crosses'."""
+        a_side = (cx - px) * (ay - py) - (cy - py) * (ax - px) > 0
+        b_side = (cx - px) * (by - py) - (cy - py) * (bx - px) > 0
+        p_orientation = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        c_orientation = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        return (a_side != b_side) & (p_orientation * c_orientation < 0)
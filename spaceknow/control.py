@@ -1,49 +1,299 @@
 from spaceknow.api import TaskingObject
 from spaceknow.errors import TaskingException
 from spaceknow.models import TaskingStatus
-from time import sleep
-from typing import Callable
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from heapq import heappop, heappush
+from threading import BoundedSemaphore, Event, Lock
+from time import monotonic
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+import random
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class PollingPolicy:
+    """Decides how often status of a tasking procedure is checked and how long it may take at most.
+    The server recommended interval ('nextTry') is honoured within [min_interval, max_interval]. When it is missing (or 0), 
+    the interval grows exponentially with random jitter, so many procedures polled at once don't hammer the api in lockstep."""
+
+    def __init__(self,
+     min_interval: float = 1.0,
+     max_interval: float = 60.0,
+     initial_interval: float = 1.0,
+     backoff_factor: float = 2.0,
+     jitter: float = 0.2,
+     deadline: float = None,
+     random_source: Callable[[], float] = random.random):
+        """
+        Args:
+            min_interval (float, optional): Minimal number of seconds between two checks of a procedure. Defaults to 1.
+            max_interval (float, optional): Maximal number of seconds between two checks of a procedure. Defaults to 60.
+            initial_interval (float, optional): Interval of the first backoff in seconds. Defaults to 1.
+            backoff_factor (float, optional): Multiplies the interval of every subsequent backoff. Defaults to 2.
+            jitter (float, optional): Relative amount of randomness of a backoff, e.g. 0.2 means +-20%. Defaults to 0.2.
+            deadline (float, optional): Maximal number of seconds a single procedure is waited for. Defaults to None, i.e. no deadline.
+            random_source (Callable[[], float], optional): Source of randomness in [0, 1). Defaults to random.random.
+
+        Raises:
+            ValueError: When the intervals are inconsistent.
+        """
+        if min_interval < 0 or min_interval > max_interval:
+            raise ValueError('min_interval must be between 0 and max_interval')
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+        self.__initial_interval = initial_interval
+        self.__backoff_factor = backoff_factor
+        self.__jitter = jitter
+        self.__deadline = deadline
+        self.__random_source = random_source
+
+    @property
+    def deadline(self) -> float:
+        return self.__deadline
+
+    def interval(self, attempt: int, next_try: float = None) -> float:
+        """Returns number of seconds to wait before the next check.
+
+        Args:
+            attempt (int): Number of checks of the procedure done so far, minus one (i.e. 0 after the first check).
+            next_try (float, optional): Interval recommended by the server. Defaults to None.
+        """
+        if next_try:
+            interval = next_try
+        else:
+            interval = self.__initial_interval * self.__backoff_factor ** attempt
+            interval *= 1 + self.__jitter * (2 * self.__random_source() - 1)
+        return min(max(interval, self.__min_interval), self.__max_interval)
 
 
 class TaskingManager:
     """Controls execution of TaskingObjects."""
     TASK_FAILED_ERROR = 'TASKING-FAILED'
-    def __init__(self, logger: Callable[[str, int], None] = None) -> None:
+    TASK_TIMEOUT_ERROR = 'TASKING-TIMEOUT'
+    TASK_CANCELLED_ERROR = 'TASKING-CANCELLED'
+    CANCEL_CHECK_INTERVAL = 0.1
+    """Number of seconds after which a blocked wait (for a free pipeline, see 'max_pipelines', or on a cancel token) checks the other source of cancellation."""
+    def __init__(self, logger: Callable[[str, float], None] = None, polling_policy: PollingPolicy = None, max_pipelines: int = None) -> None:
         """
         Args:
-            logger (Callable[[str, int], None]): Logs status of a TaskingObject (status: str, time_untill_next _tep: int). Defaults to None.
+            logger (Callable[[str, float], None]): Logs status of a TaskingObject (status: str, time_untill_next _tep: float). Defaults to None.
+            polling_policy (PollingPolicy, optional): Decides intervals between checks and deadline of a procedure. Defaults to PollingPolicy().
+            max_pipelines (int, optional): Maximal number of procedures being waited for at once by all the waits of the manager (from any thread).
+                Procedures given lazily (e.g. by a generator initiating them) are taken only when a pipeline is free. Defaults to None, i.e. unbounded.
         """
+        if max_pipelines is not None and max_pipelines < 1:
+            raise ValueError('max_pipelines must be at least 1')
         self.__logger = logger or (lambda s, i: None)
+        self.__polling_policy = polling_policy or PollingPolicy()
+        self.__pipelines = BoundedSemaphore(max_pipelines) if max_pipelines is not None else None
+        self.__cancelled = Event()
+        self.__cancelled_lock = Lock()
+
+    def cancel(self) -> None:
+        """Cancels all the waits being in progress (from any thread). They raise TaskingException, waits started afterwards aren't affected."""
+        with self.__cancelled_lock:
+            self.__cancelled.set()
+            self.__cancelled = Event()
 
-    def wait_untill_completed(self, tasking_object: TaskingObject):
+    def wait_untill_completed(self, tasking_object: TaskingObject, cancel_token: Event = None):
         """Waits untill the Tasking procedure is finished and returns the result
 
         Args:
-            tasking_object (TaskingObject): [description]
+            tasking_object (TaskingObject): Procedure to wait for.
+            cancel_token (Event, optional): Cancels the wait once set (see 'as_completed'). Defaults to None.
+
+        Raises:
+            TaskingException: When the procedure fails, exceeds its deadline or the wait is cancelled.
+
+        Returns:
+            Retrieved data of the procedure.
+        """
+        return self.wait_all([tasking_object], cancel_token)[0]
+
+    def as_completed(self, tasking_objects: Iterable[TaskingObject], cancel_token: Event = None) -> Iterator[Tuple[TaskingObject, Any]]:
+        """Polls all the given TaskingObjects at once, each one on its own schedule (see PollingPolicy), and yields them as they are resolved.
+        The total waiting time is therefore given by the slowest procedure, not by the sum of all of them.
+        The tasking objects are taken from the iterable only while the manager has a free pipeline (see 'max_pipelines'), so a generator initiating
+        the procedures initiates each of them only once it may be waited for.
+
+        Args:
+            tasking_objects (Iterable[TaskingObject]): Procedures to wait for.
+            cancel_token (Event, optional): Cancels only the waits it is passed to, e.g. all the waits of one job, once set. Unlike 'cancel', it cancels also waits
+                started after it was set. Defaults to None, i.e. the wait is cancelled only by 'cancel'.
+
+        Raises:
+            TaskingException: When any of the procedures fails, exceeds its deadline or the wait is cancelled.
+
+        Yields:
+            Iterator[Tuple[TaskingObject, Any]]: Resolved tasking object alongside with its retrieved data, in order of resolution.
+        """
+        with self.__cancelled_lock:
+            cancelled = self.__cancelled
+        is_cancelled = lambda: cancelled.is_set() or (cancel_token is not None and cancel_token.is_set())
+        policy = self.__polling_policy
+        tasking_objects = iter(tasking_objects)
+        exhausted = False
+        # Scheduler ordered by the time of the next check, the index breaks ties and keeps the tasking objects uncompared.
+        schedule = []
+        attempts = {}
+        deadlines = {}
+        index = 0
+        held = 0
+        try:
+            while True:
+                if is_cancelled():
+                    raise TaskingException(self.TASK_CANCELLED_ERROR, 'Waiting for tasking was cancelled.')
+                # Takes as many procedures as there are free pipelines, waits for one only when there is nothing else to poll.
+                while not exhausted and self.__acquire(not schedule, is_cancelled):
+                    try:
+                        tasking_object = next(tasking_objects)
+                    except BaseException as e:
+                        self.__release()
+                        if not isinstance(e, StopIteration):
+                            raise
+                        exhausted = True
+                        break
+                    held += 1
+                    now = monotonic()
+                    heappush(schedule, (now, index, tasking_object))
+                    attempts[index] = 0
+                    deadlines[index] = now + policy.deadline if policy.deadline is not None else float('inf')
+                    index += 1
+                if not schedule:
+                    return
+
+                next_check, i, tasking_object = heappop(schedule)
+                delay = next_check - monotonic()
+                if delay > 0 and self.__sleep(delay, cancelled, cancel_token):
+                    raise TaskingException(self.TASK_CANCELLED_ERROR, 'Waiting for tasking was cancelled.')
+                status, wait_in_seconds = tasking_object.get_status()
+                if status in [TaskingStatus.PROCESSING, TaskingStatus.NEW]:
+                    now = monotonic()
+                    if now >= deadlines[i]:
+                        raise TaskingException(self.TASK_TIMEOUT_ERROR, f'Tasking was not finished within {policy.deadline}s.')
+                    interval = policy.interval(attempts[i], wait_in_seconds)
+                    attempts[i] += 1
+                    self.__logger(status.name, interval)
+                    # The last check is done right at the deadline.
+                    heappush(schedule, (min(now + interval, deadlines[i]), i, tasking_object))
+                elif status == TaskingStatus.FAILED:
+                    raise TaskingException(self.TASK_FAILED_ERROR,'Tasking failed unexpectedly.')
+                else:
+                    self.__logger(status.name, wait_in_seconds)
+                    result = tasking_object.retrieve_data()
+                    held -= 1
+                    self.__release()
+                    yield tasking_object, result
+        finally:
+            for _ in range(held):
+                self.__release()
+
+    def wait_all(self, tasking_objects: Iterable[TaskingObject], cancel_token: Event = None) -> list:
+        """Waits untill all the Tasking procedures are finished and returns their results. The procedures are polled at once (see 'as_completed').
+
+        Args:
+            tasking_objects (Iterable[TaskingObject]): Procedures to wait for.
+            cancel_token (Event, optional): Cancels the wait once set (see 'as_completed'). Defaults to None.
 
         Raises:
-            TaskingException: [description]
+            TaskingException: When any of the procedures fails or the wait is cancelled.
 
         Returns:
-            Iterable: [description]
+            list: Results in the same order as the given tasking objects.
         """
-        status, wait_in_seconds = tasking_object.get_status()
-        if status in [TaskingStatus.PROCESSING, TaskingStatus.NEW]:
-            self.__logger(status.name, wait_in_seconds)
-            sleep(wait_in_seconds)
-            return self.wait_untill_completed(tasking_object)
-        elif status == TaskingStatus.FAILED:
-            raise TaskingException(self.TASK_FAILED_ERROR,'Tasking failed unexpectedly.')
-        self.__logger(status.name, wait_in_seconds)
-        return tasking_object.retrieve_data()
+        taken = []
+        def take():
+            # The objects are recorded as they are taken, so lazily initiated procedures are kept lazy.
+            for tasking_object in tasking_objects:
+                taken.append(tasking_object)
+                yield tasking_object
+        results = {}
+        for tasking_object, result in self.as_completed(take(), cancel_token):
+            results[id(tasking_object)] = result
+        return [results[id(t)] for t in taken]
+
+    def __acquire(self, blocking: bool, is_cancelled: Callable[[], bool]) -> bool:
+        if self.__pipelines is None:
+            return True
+        if not blocking:
+            return self.__pipelines.acquire(blocking=False)
+        while not self.__pipelines.acquire(timeout=self.CANCEL_CHECK_INTERVAL):
+            if is_cancelled():
+                raise TaskingException(self.TASK_CANCELLED_ERROR, 'Waiting for tasking was cancelled.')
+        return True
+
+    def __sleep(self, delay: float, cancelled: Event, cancel_token: Optional[Event]) -> bool:
+        """Sleeps for the delay, returns True as soon as the wait is cancelled by 'cancel' or by the cancel token."""
+        if cancel_token is None:
+            return cancelled.wait(delay)
+        deadline = monotonic() + delay
+        while not (cancelled.is_set() or cancel_token.is_set()):
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            cancel_token.wait(min(remaining, self.CANCEL_CHECK_INTERVAL))
+        return True
 
+    def __release(self) -> None:
+        if self.__pipelines is not None:
+            self.__pipelines.release()
 
 
+class ConcurrentExecutor:
+    """Executes independent blocking calls (e.g. tile fetches) on a bounded pool of worker threads."""
+    DEFAULT_MAX_WORKERS = 8
 
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        """
+        Args:
+            max_workers (int, optional): Maximal number of calls being executed at once. 1 means the calls are executed sequentially in the calling thread. Defaults to 8.
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.__max_workers = max_workers
+        self.__pool = None
+        self.__pool_lock = Lock()
 
+    @property
+    def max_workers(self) -> int:
+        return self.__max_workers
 
+    def map(self, func: Callable[[T], R], items: Iterable[T]) -> list[R]:
+        """Applies a function to all the items concurrently.
 
+        Args:
+            func (Callable[[T], R]): Function to be applied, e.g. fetch of a tile.
+            items (Iterable[T]): Arguments of the function.
 
+        Raises:
+            Exception: The first exception raised by any of the calls. Calls that haven't started yet are cancelled.
 
+        Returns:
+            list[R]: Results in the same order as the given items.
+        """
+        items = list(items)
+        if self.__max_workers == 1 or len(items) <= 1:
+            return [func(i) for i in items]
+        pool = self.__get_pool()
+        futures = [pool.submit(func, i) for i in items]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [f for f in futures if f in done and f.exception() is not None]
+        if failed:
+            for future in not_done:
+                future.cancel()
+            raise failed[0].exception()
+        return [f.result() for f in futures]
 
+    def shutdown(self) -> None:
+        """Stops worker threads. The executor may be used again afterwards."""
+        with self.__pool_lock:
+            if self.__pool is not None:
+                self.__pool.shutdown(wait=True, cancel_futures=True)
+                self.__pool = None
 
+    def __get_pool(self) -> ThreadPoolExecutor:
+        with self.__pool_lock:
+            if self.__pool is None:
+                self.__pool = ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='spaceknow')
+            return self.__pool
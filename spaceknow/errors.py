@@ -1,5 +1,5 @@
 class ApiError():   
-    NOT_AUTHORIZED = 'NOT_AUTHORIZED'
+    NOT_AUTHORIZED = 'NOT-AUTHORIZED'
     """The request is either not properly authorized or you do not have sufficient permissions"""
     
     INVALID_JWT = 'INVALID-JWT'
@@ -18,6 +18,10 @@ class TaskingError():
     PIPELINE_NOT_PROCESSED = 'PIPELINE-NOT-PROCESSED'
     """Pipeline has not been resolved yet"""
 
+class KrakenError():
+    NON_EXISTENT_MAP = 'NON-EXISTENT-MAP'
+    """Map with given ID was not found, e.g. since it expired"""
+
 class AuthenticationException(Exception):
     def __init__(self, message: str):
         super().__init__(message)  
@@ -44,4 +48,6 @@ class NoEntriesException(Exception):
 class TaskingException(SpaceknowApiException):
     pass
 
-
+class MapExpiredException(SpaceknowApiException):
+    """The map of a resolved kraken analysis no longer exists, so the analysis has to be initiated again."""
+    pass
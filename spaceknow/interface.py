@@ -1,193 +1,591 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Callable, Tuple, Union
-
-from spaceknow.api import AuthorizedSession, KrakenApi, RagnarApi
-from spaceknow.authorization import AuthorizationService
-from spaceknow.errors import AuthorizationException, NoEntriesException
-from spaceknow.models import Credentials, Feature, Observable, ExceptionObserver
-from spaceknow.control import TaskingManager
+from threading import Event
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from spaceknow.api import AuthorizedSession, ConnectionPoolStats, ConnectionSettings, KrakenApi, RagnarApi, TaskingObject
+from spaceknow.authorization import AUTH0_CLIENT_ID, AUTH0_DOMAIN, AuthorizationService, TokenProvider
+from spaceknow.cache import DetectionsCache, MemoryDetectionsCache, SearchCache, TileImageCache, extent_fingerprint, search_key, uncovered_intervals
+from spaceknow.checkpoint import CheckpointStore, checkpoint_key, resume_or_initiate
+from spaceknow.clipping import ExtentIndex
+from spaceknow.errors import MapExpiredException, NoEntriesException
+from spaceknow.models import Credentials, DetectionBatch, ExtentResult
+from spaceknow.throttling import RateLimiter, RetryPolicy
+from spaceknow.control import ConcurrentExecutor, PollingPolicy, TaskingManager
+from spaceknow.tiling import split_extent
 from geojson import GeoJSON
 from PIL.Image import Image
+import PIL.Image
+from spaceknow.visualization import build_mosaic, highlight_cars_on_tile
 import itertools
-from spaceknow.visualization import highlight_cars_on_tile, merge_images
+import json
+import os
+import re
 
 #TODO: pridas flag true/false podle toho jestli chces logging nebo ne 
 
-class SpaceknowAnalysis(Observable):  
+T = TypeVar('T')
+R = TypeVar('R')
+
+class SpaceknowAnalysis:  
     """Conducts analysis (imagery, cars) on a specified area. Encapsulates kraken api."""
-    #Save cars_analysis results per scene_id. TODO: create better data type
-    __cache: dict[str, dict[tuple[int,int,int], list[Feature]]] = {}
+    CARS = 'cars'
+    IMAGERY = 'imagery'
 
     def __init__(self,
      kraken_api: KrakenApi,
      tasking_manager: TaskingManager,
      sceneids_with_datetimes: list[tuple[datetime,str]],
-     extent: GeoJSON):
-        super().__init__()
+     extent: GeoJSON,
+     executor: ConcurrentExecutor = None,
+     detections_cache: DetectionsCache = None,
+     checkpoint_store: CheckpointStore = None,
+     max_tiles_per_pipeline: int = None,
+     cancel_token: Event = None):
+        """
+        Args:
+            executor (ConcurrentExecutor, optional): Fetches tiles concurrently. Defaults to ConcurrentExecutor with default number of workers.
+            detections_cache (DetectionsCache, optional): Stores results of cars analyses. Defaults to MemoryDetectionsCache.
+            checkpoint_store (CheckpointStore, optional): Records initiated and resolved analyses and exported tiles, so a re-run resumes them. Defaults to None, i.e. no checkpoints.
+            max_tiles_per_pipeline (int, optional): Extents covering more tiles are split into sub-extents analysed by parallel pipelines (see 'split_extent'). Defaults to None, i.e. extents aren't split.
+            cancel_token (Event, optional): Cancels waits for the analyses once set (see 'TaskingManager.as_completed'). Defaults to None.
+        """
         self.__kraken_api = kraken_api
         self.__tasking_manager = tasking_manager
         self.__sceneids_with_datetimess = sceneids_with_datetimes
         self.__extent = extent
+        self.__executor = executor or ConcurrentExecutor()
+        self.__cache = detections_cache or MemoryDetectionsCache()
+        self.__checkpoints = checkpoint_store
+        self.__max_tiles_per_pipeline = max_tiles_per_pipeline
+        self.__cancel_token = cancel_token
+        self.__extent_key = None
+        self.__parts = None
+        self.__part_keys = None
+        self.__extent_index = None
 
-    def _observe_exception(func):
-        """In special cases redirects exception to observers (i.e. AuthorizationException)."""
-        was_called_before = False
-        def wrapper(self):
-            nonlocal was_called_before
-            try:
-                return func(self)
-            except AuthorizationException as ex:
-                if was_called_before:
-                    raise
-                self.__notify_observers__(ex)
-                was_called_before = True
-                return func(self)
-            finally:
-                self.__remove_all_observers__()
-        return wrapper
-    
-
-    @_observe_exception
     def get_images(self) -> list[tuple[datetime, Image]]:
         """Get image per scene. The image contains highlighted cars found in a given extent.
         
         Returns:
             list[tuple[datetime, Image]]: Images alongside with date they were taken.
         """
-        output = []
-        for datetime, scene_id in self.__sceneids_with_datetimess:
-            output.append((datetime, self.__get_images_from_scene_id(scene_id)))
-        return output
-
-
-    def __get_images_from_scene_id(self, scene_id: str) -> Image:  
-        tiles, features = self.__get_cars_tiles_and_features(scene_id)
-        geometries = [[f.geometry for f in tile_fs] for tile_fs in features]
-        kraken_imagery_task_obj = self.__kraken_api.initiate_imagery_analysis(self.__extent, scene_id)      
-        imagery_map_id = self.__tasking_manager.wait_untill_completed(kraken_imagery_task_obj)[0]
-        images = [self.__get_image_from_tile(imagery_map_id, t) for t in tiles]
-        images_with_highlights = [highlight_cars_on_tile(*i) for i in zip(tiles, images, geometries)]
-        images_layout = self.__build_layout(tiles, images_with_highlights) 
-        return merge_images(images_layout)
-
-    def __get_cars_tiles_and_features(self,scene_id: str) -> Union[list[tuple[int,int,int]], list[list[Feature]]]:
-        """In a case of cached data, returns them. Otherwise, makes a call to the kraken api and retrives and cache them."""
-        if scene_id in self.__cache:
-            scene_cache = self.__cache[scene_id]
-            return scene_cache[0], scene_cache[1]
-
-        kraken_cars_task_obj = self.__kraken_api.initiate_car_analysis(self.__extent, scene_id)
-        cars_map_id, cars_tiles = self.__tasking_manager.wait_untill_completed(kraken_cars_task_obj)
-        features = [self.__get_features_from_tile(cars_map_id, tile) for tile in cars_tiles]
-        self.__cache[scene_id] =  (cars_tiles, features)
-        return cars_tiles, features
+        images = dict(self.__iter_images_per_scene_id(self.__get_image_from_scene_id))
+        return [(sc[0], images[sc[1]]) for sc in self.__sceneids_with_datetimess]
 
+    def iter_images(self, ordered: bool = False) -> Iterator[tuple[datetime, Image]]:
+        """Streaming variant of 'get_images'. Yields image of every scene as soon as it is rendered, so only the yet unconsumed images are held in memory.
 
-    def __get_image_from_tile(self, map_id:str, tile: Tuple[int,int,int]) -> Image:
-        return self.__kraken_api.get_satelite_image(map_id, tile)
+        Args:
+            ordered (bool, optional): If True, images are yielded in order of the dates they were taken, otherwise in order of completion. Defaults to False.
+
+        Yields:
+            Iterator[tuple[datetime, Image]]: Images alongside with date they were taken.
+        """
+        return self.__iter_per_datetime(self.__iter_images_per_scene_id(self.__get_image_from_scene_id), ordered)
 
-    def __build_layout(self, tiles: list[tuple[int,int,int]], images: list[Image]) -> list[list[Image]]:
-        """Puts together tile_images parts so they add up to a complete image.
+    def export_images(self, directory: str) -> list[tuple[datetime, str]]:
+        """Exports highlighted tiles of every scene straight to disk, so the image of a whole extent never exists in memory. 
+        Peak memory is therefore proportional to one row of tiles, no matter how large the extent is.
+        Tiles of a scene are stored as '<directory>/<scene_id>/<z>/<x>/<y>.png' alongside with 'index.json' describing them.
 
         Args:
-            tiles (list[tuple[int,int,int]]): List of tile coordinates. This acts as a sorting key.
-            images (list[Image]): List of tile images. The list must be in a same order as tiles.
+            directory (str): Output directory. It is created when it doesn't exist.
 
         Returns:
-            list[list[Image]]: Layout of images.
+            list[tuple[datetime, str]]: Paths to index files of the scenes alongside with date they were taken.
+        """
+        index_paths = dict(self.__iter_images_per_scene_id(lambda *args: self.__export_scene(directory, *args)))
+        return [(sc[0], index_paths[sc[1]]) for sc in self.__sceneids_with_datetimess]
+
+    def __iter_images_per_scene_id(self, render: Callable[[str, list[tuple[int,int,int]], list[str], list[DetectionBatch]], T]) -> Iterator[tuple[str, T]]:
+        """Initiates cars and imagery analyses of all the scenes (and all the sub-extents) at once. Each scene is rendered as soon as all of its analyses are resolved,
+        so the tiles are downloaded while the other analyses are still being processed on serverside.
+
+        Args:
+            render (Callable[[str, list[tuple[int,int,int]], list[str], list[DetectionBatch]], T]): Renders a scene given by scene_id, tiles, imagery map_id and detections per tile.
+        """
+        scene_ids = self.__get_scene_ids()
+        jobs = self.__get_jobs(scene_ids)
+        cached_jobs = self.__get_cached_jobs(jobs)
+        get_detections = lambda job, map_id, tiles: self.__get_tiles_and_detections(job, map_id, tiles)[1]
+        cars_tiles_and_detections = {j: self.__get_cached_tile_results(j, *cached_jobs[j], get_detections) for j in cached_jobs}
+        cars_tiles_and_detections = {j: result for j, result in cars_tiles_and_detections.items() if result is not None}
+        imagery_map_ids = {j: result[0] for j, result in self.__get_checkpointed_results(self.IMAGERY, jobs).items()}
+        analyses = [(t, j) for j in jobs for t, resolved in [(self.CARS, cars_tiles_and_detections), (self.IMAGERY, imagery_map_ids)] if j not in resolved]
+        started = {}
+        # Scenes, whose analyses were all resolved by a previous run, are rendered right away.
+        for scene_id in scene_ids:
+            if self.__is_scene_resolved(scene_id, imagery_map_ids, cars_tiles_and_detections):
+                yield scene_id, self.__render_scene(render, scene_id, imagery_map_ids, cars_tiles_and_detections)
+        for task_obj, result in self.__tasking_manager.as_completed(self.__start_analyses(analyses, started), self.__cancel_token):
+            analysis_type, job = started.pop(task_obj)
+            if analysis_type == self.CARS:
+                cars_tiles_and_detections[job] = self.__on_car_analysis_resolved(job, *result)
+            else:
+                self.__put_checkpointed_result(self.IMAGERY, job, list(result))
+                imagery_map_ids[job] = result[0]
+            if self.__is_scene_resolved(job[0], imagery_map_ids, cars_tiles_and_detections):
+                yield job[0], self.__render_scene(render, job[0], imagery_map_ids, cars_tiles_and_detections)
+
+    def __render_scene(self, render: Callable[[str, list[tuple[int,int,int]], list[str], list[DetectionBatch]], T], scene_id: str, 
+        imagery_map_ids: dict[tuple[str, int], str], cars_tiles_and_detections: dict[tuple[str, int], tuple[list[tuple[int,int,int]], list[DetectionBatch]]]) -> T:
+        imagery_tiles_and_detections = {}
+        for job in self.__get_jobs([scene_id]):
+            imagery_map_id = imagery_map_ids.pop(job)
+            tiles, detections = cars_tiles_and_detections.pop(job)
+            imagery_tiles_and_detections[job] = (tiles, [(imagery_map_id, d) for d in detections])
+        tiles, map_ids_and_detections = self.__merge_parts(scene_id, imagery_tiles_and_detections)
+        return render(scene_id, tiles, [m for m, _ in map_ids_and_detections], [d for _, d in map_ids_and_detections])
+
+    def __get_image_from_scene_id(self, scene_id: str, tiles: list[tuple[int,int,int]], imagery_map_ids: list[str], detections: list[DetectionBatch]) -> Image:  
+        images = self.__executor.map(lambda tile_and_map_id: self.__get_image_from_tile(tile_and_map_id[1], tile_and_map_id[0]), list(zip(tiles, imagery_map_ids)))
+        images_with_highlights = [highlight_cars_on_tile(*i) for i in zip(tiles, images, detections)]
+        return build_mosaic(tiles, images_with_highlights)
+
+    def __export_scene(self, directory: str, scene_id: str, tiles: list[tuple[int,int,int]], imagery_map_ids: list[str], detections: list[DetectionBatch]) -> str:
+        """Fetches, highlights and saves tiles of a scene row by row. Returns path to the index file of the scene."""
+        scene_directory = os.path.join(directory, re.sub(r'[^\w.-]', '_', scene_id))
+        detections_per_tile = dict(zip(tiles, detections))
+        map_id_per_tile = dict(zip(tiles, imagery_map_ids))
+        tile_path = lambda tile: os.path.join(scene_directory, *[str(c) for c in tile[:2]], f'{tile[2]}.png')
+        # Tiles exported by a previous run are skipped.
+        checkpoint_key = self.__get_checkpoint_key('export', scene_id, os.path.abspath(directory))
+        completed_tiles = {t for t in self.__checkpoints.get_completed_tiles(checkpoint_key) if os.path.exists(tile_path(t))} if self.__checkpoints is not None else set()
+        missing_tiles = [t for t in tiles if t not in completed_tiles]
+        rows = itertools.groupby(sorted(missing_tiles, key=lambda t: (t[2], t[1])), key=lambda t: t[2])
+        tile_size = None
+        for _, row in rows:
+            row = list(row)
+            images = self.__executor.map(lambda t: self.__get_image_from_tile(map_id_per_tile[t], t), row)
+            for tile, image in zip(row, images):
+                os.makedirs(os.path.dirname(tile_path(tile)), exist_ok=True)
+                highlight_cars_on_tile(tile, image, detections_per_tile[tile]).save(tile_path(tile))
+                if self.__checkpoints is not None:
+                    self.__checkpoints.put_completed_tile(checkpoint_key, tile)
+                tile_size = image.size
+        if tile_size is None and completed_tiles:
+            with PIL.Image.open(tile_path(next(iter(completed_tiles)))) as completed_image:
+                tile_size = completed_image.size
+        index = {
+            'sceneId': scene_id,
+            'mapId': imagery_map_ids[0],
+            'tileTemplate': '{z}/{x}/{y}.png',
+            'tileSize': tile_size,
+            'bounds': {
+                'minX': min(t[1] for t in tiles), 'maxX': max(t[1] for t in tiles),
+                'minY': min(t[2] for t in tiles), 'maxY': max(t[2] for t in tiles)},
+            'tiles': [list(t) for t in tiles]
+        }
+        if len(set(imagery_map_ids)) > 1:
+            # Tiles of a split extent come from imagery analyses of its sub-extents.
+            index['mapIds'] = imagery_map_ids
+        index_path = os.path.join(scene_directory, 'index.json')
+        os.makedirs(scene_directory, exist_ok=True)
+        with open(index_path, 'w') as index_file:
+            json.dump(index, index_file)
+        return index_path
+
+    def __iter_cars_tile_results(self, get_tile_results: Callable[[tuple[str, int], str, list[tuple[int,int,int]]], list[T]]) -> Iterator[tuple[str, list[T]]]:
+        """Yields results (e.g. number of objects per class) of every tile of all the scenes. Cached scenes come first, analyses of the rest are initiated at once 
+        and results of their tiles are fetched as they are resolved.
+
+        Args:
+            get_tile_results (Callable[[tuple[str, int], str, list[tuple[int,int,int]]], list[T]]): Fetches results of tiles given by job, cars map_id and tiles.
+        """
+        scene_ids = self.__get_scene_ids()
+        jobs = self.__get_jobs(scene_ids)
+        cached_jobs = self.__get_cached_jobs(jobs)
+        analyses = [(self.CARS, j) for j in jobs if j not in cached_jobs]
+        started = {}
+        tiles_and_results = {}
+        for scene_id in scene_ids:
+            for job in self.__get_jobs([scene_id]):
+                if job in cached_jobs:
+                    result = self.__get_cached_tile_results(job, *cached_jobs[job], get_tile_results)
+                    if result is None:
+                        analyses.append((self.CARS, job))
+                    else:
+                        tiles_and_results[job] = result
+            if self.__is_scene_resolved(scene_id, tiles_and_results):
+                yield scene_id, self.__merge_parts(scene_id, tiles_and_results)[1]
+        for task_obj, (cars_map_id, cars_tiles) in self.__tasking_manager.as_completed(self.__start_analyses(analyses, started), self.__cancel_token):
+            job = started.pop(task_obj)[1]
+            self.__record_car_analysis(job, cars_map_id, cars_tiles)
+            tiles_and_results[job] = (cars_tiles, get_tile_results(job, cars_map_id, cars_tiles))
+            if self.__is_scene_resolved(job[0], tiles_and_results):
+                yield job[0], self.__merge_parts(job[0], tiles_and_results)[1]
+
+    def __iter_per_datetime(self, results_per_scene_id: Iterator[tuple[str, T]], ordered: bool) -> Iterator[tuple[datetime, T]]:
+        """Pairs results of the scenes with the dates the scenes were taken.
+
+        Args:
+            results_per_scene_id (Iterator[tuple[str, T]]): Results of the scenes in order of completion.
+            ordered (bool): If True, a result is held back untill all the results of the preceding dates are yielded.
         """
-        zipped = zip(tiles, images)
-        #zipped looks like [((zoom, x_tile, y_tile), image), ...], so x[0][2] is y_tile coordinate
-        sorted_by_y_tile = sorted(zipped, key=lambda x: x[0][2])
-        grouped_by_y_tile = itertools.groupby(sorted_by_y_tile, lambda x: x[0][2])
-        sorted_by_x_tile = []
-        for key, subbiter in grouped_by_y_tile:
-            sorted_by_x_tile.append(sorted(list(subbiter), key=lambda x: x[0][1]))
-        return [[col[1] for col in row] for row in sorted_by_x_tile]
-
-    @_observe_exception
-    def get_car_counts(self) -> list[tuple[datetime, int]]:
-        """Counts cars in a prespecified area.
+        datetimes_per_scene_id = {}
+        for sc in sorted(self.__sceneids_with_datetimess, key=lambda sc: sc[0]):
+            datetimes_per_scene_id.setdefault(sc[1], []).append(sc[0])
+        if not ordered:
+            for scene_id, result in results_per_scene_id:
+                for date_time in datetimes_per_scene_id[scene_id]:
+                    yield date_time, result
+            return
+
+        pending = sorted(self.__sceneids_with_datetimess, key=lambda sc: sc[0])
+        # Number of not yet yielded dates per scene, so a result is released as soon as it was yielded for all of them.
+        remaining = {s: len(d) for s, d in datetimes_per_scene_id.items()}
+        completed = {}
+        next_index = 0
+        for scene_id, result in results_per_scene_id:
+            completed[scene_id] = result
+            while next_index < len(pending) and pending[next_index][1] in completed:
+                date_time, next_scene_id = pending[next_index]
+                yield date_time, completed[next_scene_id]
+                remaining[next_scene_id] -= 1
+                if remaining[next_scene_id] == 0:
+                    del completed[next_scene_id]
+                next_index += 1
+
+    def __get_cached_jobs(self, jobs: list[tuple[str, int]]) -> dict[tuple[str, int], tuple[str, list[tuple[int,int,int]]]]:
+        """Returns (map_id, tiles) of the jobs, whose cars analyses are cached or were resolved by a previous run."""
+        cached_jobs = {j: self.__cache.get_scene(self.__get_job_extent_key(j), j[0]) for j in jobs}
+        checkpointed_jobs = self.__get_checkpointed_results(self.CARS, [j for j, scene in cached_jobs.items() if scene is None])
+        cached_jobs.update({j: (result[0], [tuple(t) for t in result[1]]) for j, result in checkpointed_jobs.items()})
+        return {j: scene for j, scene in cached_jobs.items() if scene is not None}
+
+    def __get_cached_tile_results(self, job: tuple[str, int], cars_map_id: str, cars_tiles: list[tuple[int,int,int]],
+        get_tile_results: Callable[[tuple[str, int], str, list[tuple[int,int,int]]], list[T]]) -> Optional[tuple[list[tuple[int,int,int]], list[T]]]:
+        """Returns tiles and their results of a cars analysis resolved by a previous run, or None when its map expired meanwhile.
+        The checkpoint of an expired analysis is discarded, so the analysis is initiated again."""
+        try:
+            return cars_tiles, get_tile_results(job, cars_map_id, cars_tiles)
+        except MapExpiredException:
+            if self.__checkpoints is not None:
+                self.__checkpoints.discard(self.__get_job_checkpoint_key(self.CARS, job))
+            return None
+
+    def __get_checkpointed_results(self, analysis_type: str, jobs: list[tuple[str, int]]) -> dict[tuple[str, int], list]:
+        """Returns (map_id, tiles) of the jobs, whose analyses of a given type were resolved by a previous run."""
+        if self.__checkpoints is None:
+            return {}
+        results = {j: self.__checkpoints.get_result(self.__get_job_checkpoint_key(analysis_type, j)) for j in jobs}
+        return {j: result for j, result in results.items() if result is not None}
+
+    def __put_checkpointed_result(self, analysis_type: str, job: tuple[str, int], result: list) -> None:
+        if self.__checkpoints is not None:
+            self.__checkpoints.put_result(self.__get_job_checkpoint_key(analysis_type, job), result)
+
+    def __start_analyses(self, analyses: list[tuple[str, tuple[str, int]]], started: dict[TaskingObject, tuple[str, tuple[str, int]]]) -> Iterator[TaskingObject]:
+        """Initiates analyses given by type and job, or reattaches to the ones initiated by a previous run (see 'resume_or_initiate'). An analysis is initiated
+        only when it's taken from the generator, i.e. when the tasking manager has a free pipeline for it. Started analyses are recorded in 'started'."""
+        parts = self.__get_parts()
+        for analysis_type, job in analyses:
+            if analysis_type == self.CARS:
+                attach, initiate = self.__kraken_api.attach_car_analysis, self.__kraken_api.initiate_car_analysis
+            else:
+                attach, initiate = self.__kraken_api.attach_imagery_analysis, self.__kraken_api.initiate_imagery_analysis
+            task_obj = resume_or_initiate(self.__checkpoints, self.__get_job_checkpoint_key(analysis_type, job), attach, 
+                lambda initiate=initiate, job=job: initiate(parts[job[1]], job[0]))
+            started[task_obj] = (analysis_type, job)
+            yield task_obj
+
+    def __on_car_analysis_resolved(self, job: tuple[str, int], cars_map_id: str, cars_tiles: list[tuple[int,int,int]]) -> tuple[list[tuple[int,int,int]], list[DetectionBatch]]:
+        self.__record_car_analysis(job, cars_map_id, cars_tiles)
+        return self.__get_tiles_and_detections(job, cars_map_id, cars_tiles)
+
+    def __record_car_analysis(self, job: tuple[str, int], cars_map_id: str, cars_tiles: list[tuple[int,int,int]]) -> None:
+        self.__cache.put_scene(self.__get_job_extent_key(job), job[0], cars_map_id, cars_tiles)
+        self.__put_checkpointed_result(self.CARS, job, [cars_map_id, [list(t) for t in cars_tiles]])
+
+    def __get_tiles_and_detections(self, job: tuple[str, int], cars_map_id: str, cars_tiles: list[tuple[int,int,int]]) -> tuple[list[tuple[int,int,int]], list[DetectionBatch]]:
+        """Returns detections of every tile. Only the tiles missing in the cache are fetched from the kraken api."""
+        detections = self.__executor.map(lambda tile: self.__get_detections_from_tile(job, cars_map_id, tile), cars_tiles)
+        return cars_tiles, detections
+
+    def __merge_parts(self, scene_id: str, results: dict[tuple[str, int], tuple[list[tuple[int,int,int]], list[T]]]) -> tuple[list[tuple[int,int,int]], list[T]]:
+        """Merges tiles and their values (e.g. counts) of all the sub-extents of a scene. Tiles shared by more sub-extents are taken only once."""
+        merged = {}
+        for job in self.__get_jobs([scene_id]):
+            tiles, values = results.pop(job)
+            for tile, value in zip(tiles, values):
+                merged.setdefault(tuple(tile), value)
+        return list(merged), list(merged.values())
+
+    def __is_scene_resolved(self, scene_id: str, *results: dict[tuple[str, int], Any]) -> bool:
+        return all(j in r for r in results for j in self.__get_jobs([scene_id]))
+
+    def __get_jobs(self, scene_ids: list[str]) -> list[tuple[str, int]]:
+        """Returns (scene_id, index of the sub-extent) of every analysis, which has to be conducted."""
+        return [(s, p) for s in scene_ids for p in range(len(self.__get_parts()))]
+
+    def __get_parts(self) -> list[GeoJSON]:
+        """Returns sub-extents analysed by separate pipelines, the extent itself unless it is split (see 'split_extent')."""
+        if self.__parts is None:
+            self.__parts = split_extent(self.__extent, self.__max_tiles_per_pipeline) if self.__max_tiles_per_pipeline else [self.__extent]
+        return self.__parts
+
+    def __get_checkpoint_key(self, kind: str, *parts) -> str:
+        return checkpoint_key(kind, self.__get_extent_key(), *parts)
+
+    def __get_job_checkpoint_key(self, kind: str, job: tuple[str, int]) -> str:
+        return checkpoint_key(kind, self.__get_job_extent_key(job), job[0])
+
+    def __get_extent_key(self) -> str:
+        if self.__extent_key is None:
+            self.__extent_key = extent_fingerprint(self.__extent)
+        return self.__extent_key
+
+    def __get_job_extent_key(self, job: tuple[str, int]) -> str:
+        """Fingerprint of the sub-extent of a job. Equals the one of the extent, unless the extent is split."""
+        if len(self.__get_parts()) == 1:
+            return self.__get_extent_key()
+        if self.__part_keys is None:
+            self.__part_keys = [extent_fingerprint(p) for p in self.__get_parts()]
+        return self.__part_keys[job[1]]
+
+    def __get_scene_ids(self) -> list[str]:
+        """Returns scene ids without duplicates."""
+        return list(dict.fromkeys(sc[1] for sc in self.__sceneids_with_datetimess))
+
+    def __get_image_from_tile(self, map_id:str, tile: Tuple[int,int,int]) -> Image:
+        return self.__kraken_api.get_satelite_image(map_id, tile)
+
+    def get_car_counts(self, exact: bool = False) -> list[tuple[datetime, int]]:
+        """Counts cars in a prespecified area. Cars analyses of all the scenes are conducted at once. 
+        By default only counts of the detections are fetched and cached, their geometries are skipped entirely (unless 'exact' is True).
+
+        Args:
+            exact (bool, optional): If True, only the cars within the extent itself are counted, not all the cars of the tiles it intersects.
+                Geometries of the detections are fetched then and tested against the extent in bulk (see 'ExtentIndex'). Defaults to False.
 
         Returns:
             list[tuple[datetime, int]]: Number of cars found within given extent (GeoJSON) on paricilar date.
         """
-        return [(sc[0], self.__cars_in_scene(sc[1])) for sc in self.__sceneids_with_datetimess]
+        car_counts = dict(self.__iter_car_counts_per_scene_id(exact))
+        return [(sc[0], car_counts[sc[1]]) for sc in self.__sceneids_with_datetimess]
 
+    def iter_car_counts(self, ordered: bool = False, exact: bool = False) -> Iterator[tuple[datetime, int]]:
+        """Streaming variant of 'get_car_counts'. Yields number of cars of every scene as soon as its analysis is finished.
 
-    def __cars_in_scene(self, scene_id: str) -> int:    
-        features = self.__get_cars_tiles_and_features(scene_id)[1]
-        return sum([self.__cars_in_features(f) for f in features])
-  
-    def __cars_in_features(self, features: list[Feature]) -> int:
-        return sum([f.count for f in features])
+        Args:
+            ordered (bool, optional): If True, counts are yielded in order of the dates, otherwise in order of completion. Defaults to False.
+            exact (bool, optional): If True, only the cars within the extent itself are counted. See 'get_car_counts'. Defaults to False.
 
-    def __get_features_from_tile(self, map_id: str, tile: Tuple[int,int,int]) -> list[Feature]:
-        return self.__kraken_api.get_detections(map_id, tile)
+        Yields:
+            Iterator[tuple[datetime, int]]: Number of cars found within given extent (GeoJSON) on paricilar date.
+        """
+        return self.__iter_per_datetime(self.__iter_car_counts_per_scene_id(exact), ordered)
+
+    def __iter_car_counts_per_scene_id(self, exact: bool) -> Iterator[tuple[str, int]]:
+        if exact:
+            get_detections = lambda job, map_id, tiles: self.__get_tiles_and_detections(job, map_id, tiles)[1]
+            for scene_id, detections in self.__iter_cars_tile_results(get_detections):
+                yield scene_id, sum(self.__get_extent_index().count_within(d) for d in detections)
+            return
+        for scene_id, tile_counts in self.__iter_cars_tile_results(self.__get_tile_counts):
+            yield scene_id, self.__cars_in_scene(tile_counts)
+
+    def __get_extent_index(self) -> ExtentIndex:
+        if self.__extent_index is None:
+            self.__extent_index = ExtentIndex(self.__extent)
+        return self.__extent_index
+
+    def __cars_in_scene(self, tile_counts: list[dict[str, int]]) -> int:    
+        return sum([sum(c.values()) for c in tile_counts])
+
+    def __get_tile_counts(self, job: tuple[str, int], cars_map_id: str, cars_tiles: list[tuple[int,int,int]]) -> list[dict[str, int]]:
+        return self.__executor.map(lambda tile: self.__get_counts_from_tile(job, cars_map_id, tile), cars_tiles)
+
+    def __get_counts_from_tile(self, job: tuple[str, int], map_id: str, tile: Tuple[int,int,int]) -> dict[str, int]:
+        extent_key = self.__get_job_extent_key(job)
+        counts = self.__cache.get_tile_counts(extent_key, job[0], tile)
+        if counts is None:
+            counts = self.__kraken_api.get_detection_counts(map_id, tile)
+            self.__cache.put_tile_counts(extent_key, job[0], tile, counts)
+        return counts
+
+    def __get_detections_from_tile(self, job: tuple[str, int], map_id: str, tile: Tuple[int,int,int]) -> DetectionBatch:
+        extent_key = self.__get_job_extent_key(job)
+        detections = self.__cache.get_tile(extent_key, job[0], tile)
+        if detections is None:
+            detections = self.__kraken_api.get_detection_batch(map_id, tile)
+            self.__cache.put_tile(extent_key, job[0], tile, detections)
+            # Counting cars afterwards then doesn't need to fetch the tile again.
+            self.__cache.put_tile_counts(extent_key, job[0], tile, detections.counts_per_class())
+        return detections
 
 
 class SpaceknowActionFactory:
-    def __init__(self, kraken_api:KrakenApi, tasking_manager: TaskingManager):
+    def __init__(self, kraken_api:KrakenApi, tasking_manager: TaskingManager, executor: ConcurrentExecutor = None, detections_cache: DetectionsCache = None,
+        checkpoint_store: CheckpointStore = None, max_tiles_per_pipeline: int = None):
         self.__kraken_api = kraken_api
         self.__tasking_manager = tasking_manager
+        self.__executor = executor
+        self.__detections_cache = detections_cache or MemoryDetectionsCache()
+        self.__checkpoint_store = checkpoint_store
+        self.__max_tiles_per_pipeline = max_tiles_per_pipeline
 
-    def create(self, extent: GeoJSON, scene_ids: list[str]) -> SpaceknowAnalysis:
-        return SpaceknowAnalysis(self.__kraken_api,self.__tasking_manager,scene_ids, extent)
+    def create(self, extent: GeoJSON, scene_ids: list[str], cancel_token: Event = None) -> SpaceknowAnalysis:
+        return SpaceknowAnalysis(self.__kraken_api,self.__tasking_manager,scene_ids, extent, self.__executor, self.__detections_cache, self.__checkpoint_store,
+            self.__max_tiles_per_pipeline, cancel_token)
 
-class SpaceknowCarsAnalyser(ExceptionObserver):
+class SpaceknowCarsAnalyser:
     """By means of spaceknow apis, such as ragnar and kraken, analyses satelite images and returns number of cars in a given area. 
     The cars can be highlighted in a satelite image a returned. """
     
-    AUTH0_CLIENT_ID = 'hmWJcfhRouDOaJK2L8asREMlMrv3jFE1'
-
-    def __init__(self, username:str, password: str, logger: Callable[[str], None] = None):
+    AUTH0_CLIENT_ID = AUTH0_CLIENT_ID
+
+    def __init__(self, username:str, password: str, logger: Callable[[str], None] = None, max_workers: int = ConcurrentExecutor.DEFAULT_MAX_WORKERS,
+        detections_cache: DetectionsCache = None,
+        image_cache: TileImageCache = None,
+        polling_policy: PollingPolicy = None,
+        rate_limiter: RateLimiter = None,
+        retry_policy: RetryPolicy = None,
+        connection_settings: ConnectionSettings = None,
+        checkpoint_store: CheckpointStore = None,
+        search_cache: SearchCache = None,
+        max_tiles_per_pipeline: int = None,
+        max_pipelines: int = None,
+        api_domain: str = None,
+        auth0_domain: str = AUTH0_DOMAIN):
+        """
+        Args:
+            username (str)
+            password (str)
+            logger (Callable[[str], None], optional): Logs out activities. Defaults to None.
+            max_workers (int, optional): Maximal number of tiles being fetched at once. Defaults to 8.
+            detections_cache (DetectionsCache, optional): Stores results of cars analyses, e.g. SqliteDetectionsCache to reuse them across runs. Defaults to MemoryDetectionsCache.
+            image_cache (TileImageCache, optional): Stores downloaded satelite images on disk, so re-rendering a scene doesn't download them again. Defaults to None.
+            polling_policy (PollingPolicy, optional): Decides how often status of server side procedures is checked and how long they may take. Defaults to PollingPolicy().
+            rate_limiter (RateLimiter, optional): Limits rate of requests per endpoint family, e.g. to stay within api quota. Defaults to None, i.e. no limits.
+            retry_policy (RetryPolicy, optional): Retries idempotent requests (tile fetches) failed on transient errors. Defaults to RetryPolicy().
+            connection_settings (ConnectionSettings, optional): Connection pooling, keep-alive, timeouts and compression of all the requests. Defaults to ConnectionSettings with pool size of max_workers.
+            checkpoint_store (CheckpointStore, optional): Records searches, analyses and exported tiles, e.g. SqliteCheckpointStore to resume them after a crash. Defaults to None, i.e. no checkpoints.
+            search_cache (SearchCache, optional): Stores searched date intervals and their scenes, so only the intervals not searched yet are queried, e.g. SqliteSearchCache for a daily moving window. Defaults to None, i.e. the whole interval is searched every time.
+            max_tiles_per_pipeline (int, optional): Extents covering more tiles (at zoom 19) are split into sub-extents analysed by parallel Kraken pipelines. Defaults to None, i.e. extents aren't split.
+            max_pipelines (int, optional): Maximal number of server side procedures (searches and analyses) in flight at once across all the extents, further ones are
+                initiated only when one of them is resolved. Defaults to None, i.e. unbounded.
+            api_domain (str, optional): Domain of the spaceknow apis, e.g. of a local fake server (see benchmarks.fake_server). Defaults to None, i.e. SpaceknowApi.DOMAIN.
+            auth0_domain (str, optional): Domain of the Auth0 authorization. Defaults to AUTH0_DOMAIN.
+        """
         self.__credentials = Credentials(username, password)
-        self.__tasking_manager = TaskingManager(lambda tx, nm: logger(f'{tx}! Next try in {nm}s.')  if logger else None)
-        self.__auth_session = AuthorizedSession()
+        self.__tasking_manager = TaskingManager(lambda tx, nm: logger(f'{tx}! Next try in {nm:.1f}s.')  if logger else None, polling_policy, max_pipelines)
+        connection_settings = connection_settings or ConnectionSettings(pool_maxsize=max(max_workers, ConnectionSettings.pool_maxsize))
+        self.__auth_session = AuthorizedSession(rate_limiter=rate_limiter, retry_policy=retry_policy, connection_settings=connection_settings, domain=api_domain)
         self.__ragnar_api = RagnarApi(self.__auth_session)
-        self.__kraken_api = KrakenApi(self.__auth_session)
-        self.__auth_service = AuthorizationService(self.AUTH0_CLIENT_ID)
-        self.__sk_analysis_factory = SpaceknowActionFactory(self.__kraken_api, self.__tasking_manager)
+        self.__kraken_api = KrakenApi(self.__auth_session, image_cache)
+        self.__auth_service = AuthorizationService(self.AUTH0_CLIENT_ID, self.__auth_session, auth0_domain)
+        self.__token_provider = TokenProvider(self.__auth_service, self.__credentials)
+        self.__auth_session.token_provider = self.__token_provider
+        self.__executor = ConcurrentExecutor(max_workers)
+        self.__checkpoint_store = checkpoint_store
+        self.__search_cache = search_cache
+        self.__sk_analysis_factory = SpaceknowActionFactory(self.__kraken_api, self.__tasking_manager, self.__executor, detections_cache, self.__checkpoint_store,
+            max_tiles_per_pipeline)
         self.__is_initialized = False
 
 
-    def analyse_on(self, extent: GeoJSON, from_date: datetime, to_date: datetime) -> SpaceknowAnalysis:
+    @property
+    def connection_pool_stats(self) -> list[ConnectionPoolStats]:
+        """Statistics of connection pools shared by all the apis (see AuthorizedSession.pool_stats)."""
+        return self.__auth_session.pool_stats()
+
+    def analyse_on(self, extent: GeoJSON, from_date: datetime, to_date: datetime, cancel_token: Event = None) -> SpaceknowAnalysis:
         """Requests imagery data from a remote api and returns 'SpaceknowAnalysis' object on which futher actions may be caried out
 
         Args:
             extent (GeoJSON): The area of convern
             from_date (datetime): The earliest possible image creationg date
             to_date (datetime): The latest possible image creationg date
+            cancel_token (Event, optional): Cancels the search and the analyses of the returned object once set, other waits of the analyser aren't affected
+                (see 'TaskingManager.as_completed'). Defaults to None.
 
         Returns:
             SpaceknowAnalysis: By means of this object the analysis is conducted
         """
         self.initialize()
-        sceneids_with_datetimes = self.__get_scene_ids_with_datetimes(extent, from_date, to_date)
+        sceneids_with_datetimes = self.__get_scene_ids_with_datetimes(extent, from_date, to_date, cancel_token)
         if len(sceneids_with_datetimes) == 0:
             raise NoEntriesException('No scene ids.')      
-        sk_analysis = self.__sk_analysis_factory.create(extent, sceneids_with_datetimes)
-        sk_analysis.__add_observer__(self)
-        return sk_analysis
+        return self.__sk_analysis_factory.create(extent, sceneids_with_datetimes, cancel_token)
+
+    def analyse_many(self, extents: Iterable[GeoJSON], from_date: datetime, to_date: datetime, 
+        action: Callable[[SpaceknowAnalysis], R] = None, max_concurrent_extents: int = 4) -> Iterator[ExtentResult]:
+        """Analyses many extents within one job. Up to 'max_concurrent_extents' extents are analysed at once (searched, their analyses initiated and polled),
+        the next extent is taken from 'extents' only when one of them completes, so the extents may be generated lazily. Tiles of all the extents are fetched 
+        by the same pool of 'max_workers' workers, which bounds the tile requests in flight across the whole job, and server side procedures are bounded
+        by 'max_pipelines'. Closing the generator early (e.g. breaking out of the loop) cancels the extents not started yet and the waits of the running ones,
+        waits of other jobs of the analyser aren't affected.
+
+        Args:
+            extents (Iterable[GeoJSON]): The areas of concern.
+            from_date (datetime): The earliest possible image creationg date
+            to_date (datetime): The latest possible image creationg date
+            action (Callable[[SpaceknowAnalysis], R], optional): Carried out on the analysis of each extent, e.g. SpaceknowAnalysis.export_images. Defaults to SpaceknowAnalysis.get_car_counts.
+            max_concurrent_extents (int, optional): Maximal number of extents being analysed at once. Defaults to 4.
+
+        Yields:
+            Iterator[ExtentResult]: Result of the action or the exception raised, per extent, in order of completion. A failed extent doesn't stop the others.
+        """
+        if max_concurrent_extents < 1:
+            raise ValueError('max_concurrent_extents must be at least 1')
+        action = action or SpaceknowAnalysis.get_car_counts
+        self.initialize()
+        extents = enumerate(extents)
+        pending = {}
+        cancel_token = Event()
+        def analyse(extent: GeoJSON):
+            # Extents taken by a worker after the generator was closed aren't analysed, their results wouldn't be yielded anyway.
+            return None if cancel_token.is_set() else action(self.analyse_on(extent, from_date, to_date, cancel_token=cancel_token))
+        def submit_next(pool: ThreadPoolExecutor):
+            for index, extent in itertools.islice(extents, 1):
+                pending[pool.submit(analyse, extent)] = (index, extent)
+
+        pool = ThreadPoolExecutor(max_concurrent_extents, thread_name_prefix='spaceknow-extent')
+        try:
+            for _ in range(max_concurrent_extents):
+                submit_next(pool)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, extent = pending.pop(future)
+                    submit_next(pool)
+                    error = future.exception()
+                    yield ExtentResult(index, extent, future.result() if error is None else None, error)
+        except GeneratorExit:
+            # The running extents fail on their cancelled waits instead of being waited for, the waits started later fail right away.
+            cancel_token.set()
+            raise
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        """Closes connections of the shared HTTP session and stops the workers fetching tiles."""
+        self.__auth_session.close()
+        self.__executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def initialize(self):
+        """Authenticates the user. Afterwards the token is refreshed ahead of its expiration (see TokenProvider)."""
         if not self.__is_initialized:
-            self.__authenticate()
+            self.__token_provider.token()
             self.__is_initialized = True
 
-    def __authenticate(self) -> None:
-        auth_token = self.__auth_service.request_jwt(self.__credentials)
-        self.__auth_session.update_auth_token(auth_token)
-
-    def __get_scene_ids_with_datetimes(self, extent: GeoJSON, from_date: datetime, to_date: datetime) -> list[tuple[datetime,str]]:       
-        ragnar_task_obj = self.__ragnar_api.initiate_search(
-            extent,
-            from_date,
-            to_date)
-        return self.__tasking_manager.wait_untill_completed(ragnar_task_obj)
-
-    def __anounce_exception__(self, ex: Exception):
-        if isinstance(ex, AuthorizationException):
-            self.__authenticate()
-        else:
-            raise ex
+    def __get_scene_ids_with_datetimes(self, extent: GeoJSON, from_date: datetime, to_date: datetime, cancel_token: Event = None) -> list[tuple[datetime,str]]:       
+        key = search_key(extent, RagnarApi.DEFAULT_PROVIDER, RagnarApi.DEFAULT_DATASET)
+        covered = self.__search_cache.get_intervals(key) if self.__search_cache is not None else []
+        intervals = uncovered_intervals(covered, from_date, to_date)
+        ragnar_task_objs = (resume_or_initiate(self.__checkpoint_store, checkpoint_key('search', key, f.isoformat(), t.isoformat()), 
+            self.__ragnar_api.attach_search, lambda f=f, t=t: self.__ragnar_api.initiate_search(extent, f, t)) for f, t in intervals)
+        searched = self.__tasking_manager.wait_all(ragnar_task_objs, cancel_token)
+        if self.__search_cache is None:
+            return searched[0]
+        for (f, t), sceneids_with_datetimes in zip(intervals, searched):
+            self.__search_cache.put(key, f, t, sceneids_with_datetimes)
+        return self.__search_cache.get_results(key, from_date, to_date)
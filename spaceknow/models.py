@@ -1,4 +1,8 @@
-from abc import ABC, abstractmethod
+from array import array
+from typing import Any, Iterator, Optional, Tuple
+import json
+import struct
+import sys
 from geojson import GeoJSON
 from enum import Enum, auto
 from area import area
@@ -19,12 +23,203 @@ class Feature:
     def __str__(self) -> str:
         return f'class: {self.class_type}, count: {self.count}, geometry: {str(self.geometry)}'
 
+class DetectionBatch:
+    """Compact columnar storage of detections (e.g. all the cars found in a tile). Much lighter than list of Features in both memory and GC pressure.
+    Class types are interned into a table and referred by codes, geometries (polygons) are stored as flat coordinates delimited by offsets.
+    Features or GeoJSON are built only on demand."""
+    POLYGON = 'Polygon'
+
+    def __init__(self,
+     class_names: list[str],
+     class_codes: array,
+     counts: array,
+     polygon_offsets: array,
+     ring_offsets: array,
+     coordinates: array):
+        """
+        Args:
+            class_names (list[str]): Table of interned class types.
+            class_codes (array): Index into 'class_names' per detection.
+            counts (array): Number of objects per detection.
+            polygon_offsets (array): Detection i consists of rings polygon_offsets[i]..polygon_offsets[i+1] (the first one is the outer ring).
+            ring_offsets (array): Ring j consists of vertices ring_offsets[j]..ring_offsets[j+1].
+            coordinates (array): Flat vertices [lon0, lat0, lon1, lat1, ...].
+        """
+        self.class_names = class_names
+        self.class_codes = class_codes
+        self.counts = counts
+        self.polygon_offsets = polygon_offsets
+        self.ring_offsets = ring_offsets
+        self.coordinates = coordinates
+
+    @classmethod
+    def builder(cls) -> 'DetectionBatchBuilder':
+        return DetectionBatchBuilder()
+
+    @classmethod
+    def from_features(cls, features: list[Feature]) -> 'DetectionBatch':
+        """
+        Raises:
+            ValueError: When a geometry of any feature isn't a polygon.
+        """
+        builder = cls.builder()
+        for f in features:
+            builder.append(f.class_type, f.count, f.geometry)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __getitem__(self, index: int) -> Feature:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('detection index out of range')
+        return Feature(self.class_names[self.class_codes[index]], self.counts[index], Polygon(self.__rings(index)))
+
+    def __iter__(self) -> Iterator[Feature]:
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, o: object) -> bool:
+        return isinstance(o, DetectionBatch) and self.to_features() == o.to_features()
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(sys.getsizeof(a) for a in 
+            (self.class_names, self.class_codes, self.counts, self.polygon_offsets, self.ring_offsets, self.coordinates)) \
+            + sum(sys.getsizeof(n) for n in self.class_names)
+
+    def to_features(self) -> list[Feature]:
+        return list(self)
+
+    def to_geojson(self) -> dict:
+        """Returns GeoJSON FeatureCollection in the same format as the one returned by Kraken api."""
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': self.POLYGON, 'coordinates': self.__rings(i)},
+                'properties': {'class': self.class_names[self.class_codes[i]], 'count': self.counts[i]}
+            } for i in range(len(self))]
+        }
+
+    def total_count(self, class_type: str = None) -> int:
+        """Sums up counts of all the detections, optionally only of the given class."""
+        if class_type is None:
+            return sum(self.counts)
+        if class_type not in self.class_names:
+            return 0
+        code = self.class_names.index(class_type)
+        return sum(n for c, n in zip(self.class_codes, self.counts) if c == code)
+
+    def counts_per_class(self) -> dict[str, int]:
+        """Sums up counts of the detections per class. See 'KrakenApi.get_detection_counts'."""
+        counts = dict.fromkeys(self.class_names, 0)
+        for code, count in zip(self.class_codes, self.counts):
+            counts[self.class_names[code]] += count
+        return counts
+
+    def outer_rings(self) -> Tuple[array, array, list[int]]:
+        """Returns vertices of outer rings of all the polygons at once.
+
+        Returns:
+            Tuple[array, array, list[int]]: Longitudes, latitudes and offsets, i.e. polygon i consists of vertices offsets[i]..offsets[i+1].
+        """
+        lons = array('d')
+        lats = array('d')
+        offsets = [0]
+        for i in range(len(self)):
+            ring = self.polygon_offsets[i]
+            start, end = self.ring_offsets[ring], self.ring_offsets[ring + 1]
+            lons.extend(self.coordinates[2 * start:2 * end:2])
+            lats.extend(self.coordinates[2 * start + 1:2 * end:2])
+            offsets.append(offsets[-1] + end - start)
+        return lons, lats, offsets
+
+    def to_bytes(self) -> bytes:
+        """Serializes the batch into compact binary form (see 'from_bytes')."""
+        columns = [self.class_codes, self.counts, self.polygon_offsets, self.ring_offsets, self.coordinates]
+        header = json.dumps({'classNames': self.class_names, 'lengths': [len(c) for c in columns]}).encode('utf-8')
+        return struct.pack('<I', len(header)) + header + b''.join(c.tobytes() for c in columns)
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> 'DetectionBatch':
+        header_length = struct.unpack_from('<I', content)[0]
+        header = json.loads(content[4:4 + header_length])
+        offset = 4 + header_length
+        columns = []
+        for typecode, length in zip(DetectionBatchBuilder.TYPECODES, header['lengths']):
+            column = array(typecode)
+            size = length * column.itemsize
+            column.frombytes(content[offset:offset + size])
+            offset += size
+            columns.append(column)
+        return cls(header['classNames'], *columns)
+
+    def __rings(self, index: int) -> list[list[list[float]]]:
+        rings = []
+        for ring in range(self.polygon_offsets[index], self.polygon_offsets[index + 1]):
+            start, end = self.ring_offsets[ring], self.ring_offsets[ring + 1]
+            rings.append([[self.coordinates[2 * v], self.coordinates[2 * v + 1]] for v in range(start, end)])
+        return rings
+
+
+class DetectionBatchBuilder:
+    """Builds DetectionBatch detection by detection."""
+    TYPECODES = ('H', 'I', 'I', 'I', 'd')
+    """Typecodes of class_codes, counts, polygon_offsets, ring_offsets and coordinates arrays."""
+
+    def __init__(self):
+        self.__class_names = []
+        self.__class_code_per_name = {}
+        self.__columns = [array(t) for t in self.TYPECODES]
+        self.__columns[2].append(0)
+        self.__columns[3].append(0)
+
+    def append(self, class_type: str, count: int, geometry: dict) -> None:
+        """
+        Raises:
+            ValueError: When the geometry isn't a polygon.
+        """
+        if geometry.get('type') != DetectionBatch.POLYGON:
+            raise ValueError(f"Only polygons are supported, got {geometry.get('type')}.")
+        class_codes, counts, polygon_offsets, ring_offsets, coordinates = self.__columns
+        class_codes.append(self.__get_class_code(class_type))
+        counts.append(count)
+        for ring in geometry['coordinates']:
+            coordinates.extend([c for vertex in ring for c in vertex[:2]])
+            ring_offsets.append(len(coordinates) // 2)
+        polygon_offsets.append(len(ring_offsets) - 1)
+
+    def build(self) -> DetectionBatch:
+        return DetectionBatch(self.__class_names, *self.__columns)
+
+    def __get_class_code(self, class_type: str) -> int:
+        code = self.__class_code_per_name.get(class_type)
+        if code is None:
+            code = len(self.__class_names)
+            self.__class_names.append(class_type)
+            self.__class_code_per_name[class_type] = code
+        return code
+
+
 @dataclass
 class Credentials:
     username: str
     password: str
 
 
+@dataclass
+class ExtentResult:
+    """Dataclass being yielded by SpaceknowCarsAnalyser.analyse_many, one per extent."""
+    index: int
+    """Position of the extent among the given extents"""
+    extent: GeoJSON
+    result: Any = None
+    """Value returned by the action, e.g. car counts. None when the analysis failed"""
+    error: Optional[Exception] = None
+    """Exception raised while analysing the extent, e.g. NoEntriesException"""
+
+
 class TaskingStatus(Enum):
     NEW = auto()
     PROCESSING = auto()
@@ -43,38 +238,3 @@ class GeoJSONExtentValidator:
         """
         if area(extent) <= self.__minArea:
             raise ValueError("Extent's area can't be 0!")
-
-
-
-class ExceptionObserver(ABC):
-    """Reacts on exceptions raised by observable."""
-    @abstractmethod
-    def __anounce_exception__(self, ex: Exception):
-        pass
-
-
-# Part of a observer pattern
-class Observable():
-    __observers__: list[ExceptionObserver]
-
-    def __init__(self):
-        self.__observers__ = []
-        
-    def __add_observer__(self, observer: ExceptionObserver) -> None:
-        self.__observers__.append(observer)
-
-    def __remove_observer__(self, observer: ExceptionObserver) -> None:
-        self.__observers__.remove(observer)
-
-    def __remove_all_observers__(self):
-        self.__observers__.clear()
-
-    def __notify_observers__(self, ex: Exception) -> None:
-        for observer in self.__observers__:
-            observer.__anounce_exception__(ex)
-
-
-
-
-
-
@@ -0,0 +1,143 @@
+from threading import Lock
+from time import monotonic
+from typing import Callable, Iterable, Optional
+import random
+import requests
+
+
+class TokenBucket:
+    """Thread safe token bucket. Allows 'rate' requests per second on average and bursts of up to 'capacity' requests."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Args:
+            rate (float): Number of tokens refilled per second.
+            capacity (float, optional): Maximal number of tokens, i.e. size of a burst. Defaults to 1.
+
+        Raises:
+            ValueError: When rate or capacity isn't positive.
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError('rate and capacity must be positive')
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = capacity
+        self.__updated = monotonic()
+        self.__lock = Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns number of seconds the caller has to wait before using it.
+        Tokens are reserved in advance, so concurrent callers are served in order and never exceed the rate together."""
+        with self.__lock:
+            now = monotonic()
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+            self.__updated = now
+            self.__tokens -= 1
+            return 0.0 if self.__tokens >= 0 else -self.__tokens / self.__rate
+
+
+class RateLimiter:
+    """Limits rate of requests per family of spaceknow endpoints. Every family has its own TokenBucket, families without one aren't limited.
+    Share one instance by all the apis (i.e. sessions) using the same quota."""
+    RAGNAR = 'ragnar'
+    KRAKEN_RELEASE = 'kraken-release'
+    KRAKEN_GRID = 'kraken-grid'
+    TASKING = 'tasking'
+
+    FAMILY_PREFIXES = (
+        ('/imagery/', RAGNAR),
+        ('/kraken/release/', KRAKEN_RELEASE),
+        ('/kraken/grid/', KRAKEN_GRID),
+        ('/tasking/', TASKING))
+    """Endpoint prefix per family."""
+
+    def __init__(self, buckets: dict[str, TokenBucket]):
+        """
+        Args:
+            buckets (dict[str, TokenBucket]): Token bucket per family, e.g. {RateLimiter.KRAKEN_GRID: TokenBucket(20, 40)}.
+        """
+        self.__buckets = dict(buckets)
+
+    @classmethod
+    def family(cls, endpoint: str) -> Optional[str]:
+        """Returns family of an endpoint or None when it doesn't belong to any."""
+        for prefix, family in cls.FAMILY_PREFIXES:
+            if endpoint.startswith(prefix):
+                return family
+        return None
+
+    def reserve(self, endpoint: str) -> float:
+        """Reserves a request to an endpoint and returns number of seconds to wait before sending it."""
+        bucket = self.__buckets.get(self.family(endpoint))
+        return bucket.reserve() if bucket is not None else 0.0
+
+
+class RetryPolicy:
+    """Decides whether a failed request is sent again and how long to wait before it. Only idempotent methods are retried,
+    the delay grows exponentially with random jitter and is capped by 'max_delay'."""
+    RETRIED_STATUS_CODES = (429, 500, 502, 503, 504)
+    RETRIED_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+
+    def __init__(self,
+     max_retries: int = 3,
+     initial_delay: float = 0.5,
+     max_delay: float = 10.0,
+     backoff_factor: float = 2.0,
+     methods: Iterable[str] = ('GET',),
+     status_codes: Iterable[int] = RETRIED_STATUS_CODES,
+     exceptions: tuple = RETRIED_EXCEPTIONS,
+     random_source: Callable[[], float] = random.random):
+        """
+        Args:
+            max_retries (int, optional): Maximal number of retries of a request. Defaults to 3.
+            initial_delay (float, optional): Delay before the first retry in seconds. Defaults to 0.5.
+            max_delay (float, optional): Upper bound of a delay in seconds, also of the one requested by server ('Retry-After'). Defaults to 10.
+            backoff_factor (float, optional): Multiplies the delay of every subsequent retry. Defaults to 2.
+            methods (Iterable[str], optional): Retried HTTP methods. Defaults to ('GET',).
+            status_codes (Iterable[int], optional): Retried HTTP status codes. Defaults to RETRIED_STATUS_CODES.
+            exceptions (tuple, optional): Retried exceptions raised while sending a request. Defaults to RETRIED_EXCEPTIONS.
+            random_source (Callable[[], float], optional): Source of randomness in [0, 1). Defaults to random.random.
+        """
+        self.__max_retries = max_retries
+        self.__initial_delay = initial_delay
+        self.__max_delay = max_delay
+        self.__backoff_factor = backoff_factor
+        self.__methods = frozenset(methods)
+        self.__status_codes = frozenset(status_codes)
+        self.__exceptions = exceptions
+        self.__random_source = random_source
+
+    def should_retry(self, method: str, attempt: int, status_code: int = None, exception: Exception = None) -> bool:
+        """
+        Args:
+            method (str): HTTP method of the request.
+            attempt (int): Number of retries done so far.
+            status_code (int, optional): Status code of the response. Defaults to None.
+            exception (Exception, optional): Exception raised while sending the request. Defaults to None.
+        """
+        if attempt >= self.__max_retries or method not in self.__methods:
+            return False
+        if exception is not None:
+            return isinstance(exception, self.__exceptions)
+        return status_code in self.__status_codes
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """Returns number of seconds to wait before the retry.
+
+        Args:
+            attempt (int): Number of retries done so far.
+            retry_after (float, optional): Delay requested by server. Defaults to None.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.__max_delay)
+        delay = self.__initial_delay * self.__backoff_factor ** attempt
+        return min(delay * (0.5 + self.__random_source() / 2), self.__max_delay)
+
+
+def retry_after(headers) -> Optional[float]:
+    """Parses 'Retry-After' header given in seconds. HTTP dates aren't supported and are ignored."""
+    value = (headers or {}).get('Retry-After')
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,253 @@
+import math
+from typing import Iterator, Tuple
+from geojson import GeoJSON, MultiPolygon, Polygon
+from spaceknow.clipping import extent_polygons
+from spaceknow.visualization import deg_to_tile_coords, tile_to_deg_coords
+
+DEFAULT_ZOOM = 19
+"""Zoom of the tiles Kraken serves detections of cars on."""
+
+EDGE_TOLERANCE = 1e-6
+"""Distance (in tiles) within which an edge is considered to lie on a tile edge. Smaller overlaps are rounding noise of the transformation to tile coordinates."""
+
+Ring = list[tuple[float, float]]
+TileRange = Tuple[int, int, int, int]
+"""Tiles (min_x, min_y, max_x, max_y), both ends inclusive."""
+
+
+def tile_cover(extent: GeoJSON, zoom: int = DEFAULT_ZOOM) -> list[tuple[int,int,int]]:
+    """Computes locally which tiles of a given zoom an extent (Polygon or MultiPolygon) intersects,
+    so the tiles may be planned before Kraken analyses return them.
+
+    Args:
+        extent (GeoJSON): Area of concern.
+        zoom (int, optional): Zoom of the tiles. Defaults to DEFAULT_ZOOM.
+
+    Returns:
+        list[tuple[int,int,int]]: Tile coordinates (zoom, x_tile, y_tile) ordered by rows.
+    """
+    tiles = set()
+    for rings in _polygons_in_tile_coords(extent, zoom):
+        tiles.update(_covered_tiles(rings))
+    return sorted(((zoom, x, y) for x, y in tiles), key=lambda t: (t[2], t[1]))
+
+
+def split_extent(extent: GeoJSON, max_tiles: int, zoom: int = DEFAULT_ZOOM) -> list[GeoJSON]:
+    """Splits an extent covering more than 'max_tiles' tiles into sub-extents covering at most 'max_tiles' tiles each,
+    so they may be analysed by parallel Kraken pipelines. Sub-extents are bounded by tile edges, therefore each tile
+    belongs to a single sub-extent (up to the tiles the extent only touches) and their tile covers add up to the cover of the extent.
+
+    Args:
+        extent (GeoJSON): Area of concern, Polygon or MultiPolygon.
+        max_tiles (int): Maximal number of tiles covered by a sub-extent.
+        zoom (int, optional): Zoom of the tiles. Defaults to DEFAULT_ZOOM.
+
+    Raises:
+        ValueError: When max_tiles isn't positive or the extent has self-intersecting rings.
+
+    Returns:
+        list[GeoJSON]: The extent itself when it is small enough, Polygons otherwise (MultiPolygons where a concave extent falls apart within a sub-extent).
+    """
+    if max_tiles < 1:
+        raise ValueError('max_tiles must be at least 1')
+    polygons = _polygons_in_tile_coords(extent, zoom)
+    covers = [_covered_tiles(rings) for rings in polygons]
+    if sum(len(cover) for cover in covers) <= max_tiles:
+        return [extent]
+    return [_to_extent(parts, zoom) for rings, cover in zip(polygons, covers) for parts in _split(rings, list(cover), _bounding_range(rings), max_tiles)]
+
+
+def _split(rings: list[Ring], tiles: list[tuple[int,int]], tile_range: TileRange, max_tiles: int) -> Iterator[list[list[Ring]]]:
+    """Bisects the tile range along its longer side untill it contains at most 'max_tiles' of the tiles covered by the polygon (see '_covered_tiles').
+    Only then the polygon is clipped by the range. A concave polygon may fall apart into more parts within a range, those are kept together as one sub-extent."""
+    min_x, min_y, max_x, max_y = tile_range
+    if len(tiles) <= max_tiles or (min_x == max_x and min_y == max_y):
+        parts = _clip_polygon(rings, _range_bounds(tile_range))
+        if parts:
+            yield parts
+        return
+    if max_x - min_x >= max_y - min_y:
+        axis, middle = 0, (min_x + max_x + 1) // 2
+        halves = [(min_x, min_y, middle - 1, max_y), (middle, min_y, max_x, max_y)]
+    else:
+        axis, middle = 1, (min_y + max_y + 1) // 2
+        halves = [(min_x, min_y, max_x, middle - 1), (min_x, middle, max_x, max_y)]
+    for half, half_tiles in zip(halves, ([t for t in tiles if t[axis] < middle], [t for t in tiles if t[axis] >= middle])):
+        if half_tiles:
+            yield from _split(rings, half_tiles, half, max_tiles)
+
+
+def _polygons_in_tile_coords(extent: GeoJSON, zoom: int) -> list[list[Ring]]:
+    """Returns rings of every polygon of an extent transformed to (fractional) tile coordinates."""
+    return [[[deg_to_tile_coords(lon, lat, zoom) for lon, lat in ring] for ring in polygon] for polygon in extent_polygons(extent)]
+
+
+def _to_extent(polygons: list[list[Ring]], zoom: int) -> GeoJSON:
+    polygons_in_degs = []
+    for rings in polygons:
+        rings_in_degs = []
+        for ring in rings:
+            coordinates = [tuple(reversed(tile_to_deg_coords(x, y, zoom))) for x, y in ring]
+            rings_in_degs.append(coordinates + coordinates[:1])
+        polygons_in_degs.append(rings_in_degs)
+    # Edges of the sub-extents have to stay on the tile edges, geojson would round them to 6 decimal places (~0.1 m) otherwise.
+    if len(polygons_in_degs) == 1:
+        return Polygon(polygons_in_degs[0], precision=15)
+    return MultiPolygon(polygons_in_degs, precision=15)
+
+
+def _bounding_range(rings: list[Ring]) -> TileRange:
+    xs = [x for x, _ in rings[0]]
+    ys = [y for _, y in rings[0]]
+    # Upper edges belong to the next tile, yet an edge lying exactly on them shouldn't add a row or column of tiles.
+    return (math.floor(min(xs)), math.floor(min(ys)), math.ceil(max(xs)) - 1, math.ceil(max(ys)) - 1)
+
+
+def _range_bounds(tile_range: TileRange) -> Tuple[float, float, float, float]:
+    min_x, min_y, max_x, max_y = tile_range
+    return (min_x, min_y, max_x + 1, max_y + 1)
+
+
+def _covered_tiles(rings: list[Ring]) -> set[tuple[int,int]]:
+    """Returns (x, y) of the tiles whose interior intersects the polygon given by its rings, row by row in a single pass over the edges (scanline).
+    A tile is covered when an edge runs through its interior. Otherwise its interior lies either entirely within the polygon or entirely outside of it,
+    which is decided by its center. Centers of a row are decided at once by the crossings of the edges with the center line of the row."""
+    tiles = set()
+    crossings = {}
+    for ring in rings:
+        for (ax, ay), (bx, by) in zip(ring, ring[1:] + ring[:1]):
+            if (ax, ay) == (bx, by):
+                continue
+            low, high = min(ay, by), max(ay, by)
+            for row in range(math.floor(low + EDGE_TOLERANCE), math.ceil(high - EDGE_TOLERANCE)):
+                if ay == by:
+                    xs = (ax, bx)
+                else:
+                    xs = (_intersection_y((ax, ay), (bx, by), max(low, row))[0], _intersection_y((ax, ay), (bx, by), min(high, row + 1))[0])
+                tiles.update((x, row) for x in range(math.floor(min(xs) + EDGE_TOLERANCE), math.ceil(max(xs) - EDGE_TOLERANCE)))
+                center = row + 0.5
+                if (ay > center) != (by > center):
+                    crossings.setdefault(row, []).append(_intersection_y((ax, ay), (bx, by), center)[0])
+    for row, xs in crossings.items():
+        xs.sort()
+        # Centers (x + 0.5) between every other crossing lie within the polygon, holes included.
+        for enter, leave in zip(xs[::2], xs[1::2]):
+            tiles.update((x, row) for x in range(math.ceil(enter - 0.5), math.ceil(leave - 0.5)))
+    return tiles
+
+
+def _clip_polygon(rings: list[Ring], bounds: Tuple[float, float, float, float]) -> list[list[Ring]]:
+    """Clips a polygon (outer ring and holes) by a rectangle, one side after another (see '_clip_by_line').
+    Returns the parts of the polygon within the rectangle, none when nothing is left."""
+    min_x, min_y, max_x, max_y = bounds
+    rings = [_oriented(ring, index == 0) for index, ring in enumerate(rings)]
+    parts = [rings] if _ring_area(rings[0]) > 0 else []
+    for axis, value, side in ((0, min_x, 1), (0, max_x, -1), (1, min_y, 1), (1, max_y, -1)):
+        parts = [clipped for part in parts for clipped in _clip_by_line(part, axis, value, side)]
+    return parts
+
+
+def _clip_by_line(rings: list[Ring], axis: int, value: float, side: int) -> list[list[Ring]]:
+    """Clips a polygon with consistently oriented rings (see '_oriented') by the half-plane side * (p[axis] - value) >= 0.
+    Rings are cut into chains running within the half-plane from a crossing of the line to the next one. Interior of the polygon on the line
+    lies between every other crossing (sorted along the line), so each chain is continued by the chain starting at the other end of its interval.
+    Unlike Sutherland–Hodgman, disconnected parts therefore end up in separate rings instead of being bridged by edges along the line."""
+    inside = lambda p: side * (p[axis] - value) >= 0
+    on_line = lambda p: p[axis] == value
+    crossing = lambda p, q: q if on_line(q) else p if on_line(p) else (_intersection_x if axis == 0 else _intersection_y)(p, q, value)
+    if all(inside(p) for p in rings[0]):
+        return [rings]
+    if not any(inside(p) for p in rings[0]):
+        return []
+    chains, holes = [], []
+    for ring in rings:
+        flags = [inside(p) for p in ring]
+        if all(flags):
+            # The outer ring crosses the line, so only holes may lie within the half-plane entirely.
+            holes.append(ring)
+            continue
+        if not any(flags):
+            continue
+        # The ring is walked from a point outside, so every chain is complete.
+        start = flags.index(False)
+        ring, flags = ring[start:] + ring[:start], flags[start:] + flags[:start]
+        chain = None
+        for i in range(1, len(ring) + 1):
+            previous, current, current_inside = ring[i - 1], ring[i % len(ring)], flags[i % len(ring)]
+            if current_inside and chain is None:
+                chain = [crossing(previous, current), current]
+            elif current_inside:
+                chain.append(current)
+            elif chain is not None:
+                chain.append(crossing(previous, current))
+                # Chains running along the line only are touches of the line, which don't enclose any area.
+                if not all(on_line(p) for p in chain):
+                    chains.append(_without_duplicates(chain))
+                chain = None
+    crossings = sorted([(c[0][1 - axis], i, True) for i, c in enumerate(chains)] + [(c[-1][1 - axis], i, False) for i, c in enumerate(chains)])
+    next_chain = {}
+    for (_, first, first_is_entry), (_, second, second_is_entry) in zip(crossings[::2], crossings[1::2]):
+        if first_is_entry == second_is_entry:
+            raise ValueError('Extent has self-intersecting or inconsistent rings.')
+        next_chain[second if first_is_entry else first] = first if first_is_entry else second
+    outer_rings, remaining = [], set(range(len(chains)))
+    while remaining:
+        index = min(remaining)
+        ring = []
+        while index in remaining:
+            remaining.remove(index)
+            ring.extend(chains[index])
+            index = next_chain[index]
+        ring = _without_duplicates(ring)
+        if _ring_area(ring) > 0:
+            outer_rings.append(ring)
+    parts = [[ring] for ring in outer_rings]
+    for hole in holes:
+        # Holes not crossing the line belong to the part they lie in, tested by their point farthest from the line.
+        point = max(hole, key=lambda p: side * (p[axis] - value))
+        for part in parts:
+            if _contains(part[0], point):
+                part.append(hole)
+                break
+    return parts
+
+
+def _oriented(ring: Ring, counterclockwise: bool) -> Ring:
+    """Returns the ring without the closing point, oriented counterclockwise (outer rings) or clockwise (holes)."""
+    points = ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else list(ring)
+    return points if (_signed_area(points) >= 0) == counterclockwise else points[::-1]
+
+
+def _without_duplicates(ring: Ring) -> Ring:
+    points = [p for p, q in zip(ring, ring[1:] + ring[:1]) if p != q]
+    return points if points else ring[:1]
+
+
+def _contains(ring: Ring, point: tuple[float, float]) -> bool:
+    """Point in ring test (ray casting)."""
+    x, y = point
+    inside = False
+    for (ax, ay), (bx, by) in zip(ring, ring[1:] + ring[:1]):
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
+
+
+def _intersection_x(p: tuple[float, float], q: tuple[float, float], x: float) -> tuple[float, float]:
+    return (x, p[1] + (q[1] - p[1]) * (x - p[0]) / (q[0] - p[0]))
+
+
+def _intersection_y(p: tuple[float, float], q: tuple[float, float], y: float) -> tuple[float, float]:
+    return (p[0] + (q[0] - p[0]) * (y - p[1]) / (q[1] - p[1]), y)
+
+
+def _signed_area(ring: Ring) -> float:
+    """Area of a ring (shoelace formula), positive when the ring is counterclockwise. Coordinates are taken relative to the first point,
+    products of absolute tile coordinates (~10^5 at zoom 19) would cancel out areas of slivers otherwise."""
+    ox, oy = ring[0]
+    return sum((p[0] - ox) * (q[1] - oy) - (q[0] - ox) * (p[1] - oy) for p, q in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _ring_area(ring: Ring) -> float:
+    return abs(_signed_area(ring))
+
@@ -1,8 +1,15 @@
+import itertools
 import math
-from typing import Tuple
+from typing import Sequence, Tuple, Union
 from geojson import Polygon
+from spaceknow.models import DetectionBatch
 from PIL import Image
 from PIL import ImageDraw
+try:
+    import numpy as np
+except ImportError:
+    # Batched transformations fall back to pure Python.
+    np = None
 
 def tile_to_deg_coords(x_tile, y_tile, zoom) -> float:
     """Transforms presented tile coordinate to latitude, longitude degrees.
@@ -40,29 +47,91 @@ def deg_to_tile_coords(lon_deg, lat_deg, zoom):
     return (x_tile, y_tile)
 
 
-def highlight_cars_on_tile(tile: tuple[int,int,int], tile_image: Image.Image, car_features: list[Polygon], fill_color: str = "Red") -> Image.Image:
+def tile_to_deg_coords_array(x_tiles: Sequence[float], y_tiles: Sequence[float], zoom: int) -> Tuple[Sequence[float], Sequence[float]]:
+    """Batched version of 'tile_to_deg_coords'. Transforms all the presented tile coordinates at once.
+
+    Args:
+        x_tiles (Sequence[float])
+        y_tiles (Sequence[float])
+        zoom (int)
+
+    Returns:
+        Tuple[Sequence[float], Sequence[float]]: Latitude, longitude degrees. Numpy arrays if numpy is installed, lists otherwise.
+    """
+    n = 2.0 ** zoom
+    if np is None:
+        lon_degs = [x / n * 360.0 - 180.0 for x in x_tiles]
+        lat_degs = [math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n)))) for y in y_tiles]
+        return (lat_degs, lon_degs)
+    x_tiles = np.asarray(x_tiles, dtype=float)
+    y_tiles = np.asarray(y_tiles, dtype=float)
+    lon_degs = x_tiles / n * 360.0 - 180.0
+    lat_degs = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y_tiles / n))))
+    return (lat_degs, lon_degs)
+
+
+def deg_to_tile_coords_array(lon_degs: Sequence[float], lat_degs: Sequence[float], zoom: int) -> Tuple[Sequence[float], Sequence[float]]:
+    """Batched version of 'deg_to_tile_coords'. Transforms all the presented longitudial, latitudial coordinates at once.
+
+    Args:
+        lon_degs (Sequence[float]): Longitudial degrees
+        lat_degs (Sequence[float]): Latitudial degrees
+        zoom (int): Zoom of final tiles
+
+    Returns:
+        Tuple[Sequence[float], Sequence[float]]: (x_tiles, y_tiles). Numpy arrays if numpy is installed, lists otherwise.
+    """
+    n = 2.0 ** zoom
+    if np is None:
+        x_tiles = [(lon + 180.0) / 360.0 * n for lon in lon_degs]
+        y_tiles = [(1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n for lat in lat_degs]
+        return (x_tiles, y_tiles)
+    lon_degs = np.asarray(lon_degs, dtype=float)
+    lat_rads = np.radians(np.asarray(lat_degs, dtype=float))
+    x_tiles = (lon_degs + 180.0) / 360.0 * n
+    y_tiles = (1.0 - np.arcsinh(np.tan(lat_rads)) / np.pi) / 2.0 * n
+    return (x_tiles, y_tiles)
+
+
+def highlight_cars_on_tile(tile: tuple[int,int,int], tile_image: Image.Image, car_features: Union[list[Polygon], DetectionBatch], fill_color: str = "Red") -> Image.Image:
     """Highlights cars in given tile (given image) and returns the result.
 
     Args:
         tile (tuple[int,int,int]): Geographical boundaries of concern. 
         tile_image (Image.Image): Coresponds to a given tile.
-        car_features (list[Polygon]): Each polygon represents area taken up by a car. Coordinates are expressed in longitudial, latitudial cooridnates.
+        car_features (Union[list[Polygon], DetectionBatch]): Each polygon represents area taken up by a car. Coordinates are expressed in longitudial, latitudial cooridnates.
         fill_color (str, optional): Highlighting color. Defaults to "Red".
 
     Returns:
         Image.Image
     """
-    # "polygon['coordinates']" are represented by [[[lon_deg0, lat_deg0], [lon_deg1, lat_deg1], ...]]
-    highlight_coords_tuples = [[tuple(coords) for coords in polygon['coordinates'][0]] for polygon in car_features]
-    highlight_tile_coords = [[deg_to_tile_coords(*coords, tile[0]) for coords in coords_list] for coords_list in highlight_coords_tuples]
-    highlight_pixel_coords = [[tile_to_pixel_coords((tile[1], tile[2]), tile_image.size, coords ) for coords in coords_list] for coords_list in highlight_tile_coords]
-    
+    # All the vertices of all the polygons are transformed at once, offsets delimit the polygons.
+    if isinstance(car_features, DetectionBatch):
+        lon_degs, lat_degs, offsets = car_features.outer_rings()
+    else:
+        # "polygon['coordinates']" are represented by [[[lon_deg0, lat_deg0], [lon_deg1, lat_deg1], ...]]
+        rings = [polygon['coordinates'][0] for polygon in car_features]
+        offsets = list(itertools.accumulate((len(r) for r in rings), initial=0))
+        lon_degs = [coords[0] for ring in rings for coords in ring]
+        lat_degs = [coords[1] for ring in rings for coords in ring]
+    x_tiles, y_tiles = deg_to_tile_coords_array(lon_degs, lat_degs, tile[0])
+    x_pixels, y_pixels = tile_to_pixel_coords_array((tile[1], tile[2]), tile_image.size, x_tiles, y_tiles)
+    pixel_coords = __interleave(x_pixels, y_pixels)
+
     draw = ImageDraw.Draw(tile_image)
-    for polygon_coords in highlight_pixel_coords:
-        draw.polygon(polygon_coords,fill=fill_color)
+    for start, end in zip(offsets, offsets[1:]):
+        # Flat sequence [x0, y0, x1, y1, ...] is accepted by ImageDraw.polygon
+        draw.polygon(pixel_coords[2 * start:2 * end], fill=fill_color)
     return tile_image
 
 
+def __interleave(xs: Sequence[float], ys: Sequence[float]) -> list[float]:
+    """Returns flat list [x0, y0, x1, y1, ...]."""
+    if np is None:
+        return [c for xy in zip(xs, ys) for c in xy]
+    return np.column_stack((xs, ys)).ravel().tolist()
+
+
 def tile_to_pixel_coords(origin: Tuple[int,int], image_size: Tuple[int,int], abs_coords: Tuple[int,int]) -> Tuple[int, int]:
     """Transforms absolute geographical tile coordinates to pixel coordinates relative to the origin.
 
@@ -83,9 +152,48 @@ def tile_to_pixel_coords(origin: Tuple[int,int], image_size: Tuple[int,int], abs
     return (x, y)
 
 
+def tile_to_pixel_coords_array(origin: Tuple[int,int], image_size: Tuple[int,int], x_tiles: Sequence[float], y_tiles: Sequence[float]) -> Tuple[Sequence[float], Sequence[float]]:
+    """Batched version of 'tile_to_pixel_coords'. Transforms all the presented absolute tile coordinates at once.
+
+    Args:
+        origin (Tuple[int,int])
+        image_size (Tuple[int,int])
+        x_tiles (Sequence[float])
+        y_tiles (Sequence[float])
+
+    Returns:
+        Tuple[Sequence[float], Sequence[float]]: Relative pixel coordinates (xs, ys). Numpy arrays if numpy is installed, lists otherwise.
+    """
+    width = image_size[0]
+    height = image_size[1]
+    if np is None:
+        return ([(x - origin[0]) * width for x in x_tiles], [(y - origin[1]) * height for y in y_tiles])
+    return ((np.asarray(x_tiles, dtype=float) - origin[0]) * width, (np.asarray(y_tiles, dtype=float) - origin[1]) * height)
+
+
+
+def build_layout(tiles: list[tuple[int,int,int]], images: list[Image.Image]) -> list[list[Image.Image]]:
+    """Puts together tile_images parts so they add up to a complete image.
+
+    Args:
+        tiles (list[tuple[int,int,int]]): List of tile coordinates. This acts as a sorting key.
+        images (list[Image.Image]): List of tile images. The list must be in a same order as tiles.
+
+    Returns:
+        list[list[Image.Image]]: Layout of images.
+    """
+    zipped = zip(tiles, images)
+    #zipped looks like [((zoom, x_tile, y_tile), image), ...], so x[0][2] is y_tile coordinate
+    sorted_by_y_tile = sorted(zipped, key=lambda x: x[0][2])
+    grouped_by_y_tile = itertools.groupby(sorted_by_y_tile, lambda x: x[0][2])
+    sorted_by_x_tile = []
+    for key, subbiter in grouped_by_y_tile:
+        sorted_by_x_tile.append(sorted(list(subbiter), key=lambda x: x[0][1]))
+    return [[col[1] for col in row] for row in sorted_by_x_tile]
+
 
 def merge_images(images: list[list[Image.Image]]) -> Image.Image:
-    """Merge images in give layout to a one image.
+    """Merge images in give layout to a one image. The final canvas is allocated once and every image is pasted at its offset.
 
     Args:
         images (list[list[Image.Image]]): Images if desired layout.
@@ -93,33 +201,40 @@ def merge_images(images: list[list[Image.Image]]) -> Image.Image:
     Returns:
         Image.Image
     """ 
-    horizontally_merged_images = []
-    for hor_images in images:
-       horizontally_merged_images.append(__merge_horizontally(hor_images))
-    return __merge_vertically(horizontally_merged_images)
-
-def __merge_horizontally(images: list[Image.Image]) -> Image.Image:
-    widths, heights = zip(*[i.size for i in images])
-    total_width = sum(widths)
-    total_height = max(heights)
-
-    new_im = Image.new('RGB', (total_width,total_height))
-    x_offset = 0
-    for im in images:
-        new_im.paste(im,(x_offset,0))
-        x_offset += im.size[0]
-    return new_im
+    row_heights = [max(i.size[1] for i in row) for row in images]
+    total_width = max(sum(i.size[0] for i in row) for row in images)
+    total_height = sum(row_heights)
 
-def __merge_vertically(images: list[Image.Image]) -> Image.Image:
-    widths, heights = zip(*[i.size for i in images])   
-    total_width = max(widths)
-    total_height = sum(heights)
-    
     new_im = Image.new('RGB', (total_width, total_height))
     y_offset = 0
-    for im in images:
-        new_im.paste(im,(0,y_offset))
-        y_offset += im.size[1]
+    for row, row_height in zip(images, row_heights):
+        x_offset = 0
+        for im in row:
+            new_im.paste(im, (x_offset, y_offset))
+            x_offset += im.size[0]
+        y_offset += row_height
     return new_im
 
-    
\ No newline at end of file
+
+def build_mosaic(tiles: list[tuple[int,int,int]], images: list[Image.Image]) -> Image.Image:
+    """Puts tile images together into one image. The canvas is allocated once from the bounding box of the tiles and every image is pasted at the offset given by its tile coordinates.
+    Cells of missing tiles are left empty (black).
+
+    Args:
+        tiles (list[tuple[int,int,int]]): List of tile coordinates (zoom, x_tile, y_tile).
+        images (list[Image.Image]): List of tile images. The list must be in a same order as tiles.
+
+    Returns:
+        Image.Image
+    """
+    tile_width = max(i.size[0] for i in images)
+    tile_height = max(i.size[1] for i in images)
+    min_x = min(t[1] for t in tiles)
+    min_y = min(t[2] for t in tiles)
+    columns = max(t[1] for t in tiles) - min_x + 1
+    rows = max(t[2] for t in tiles) - min_y + 1
+
+    new_im = Image.new('RGB', (columns * tile_width, rows * tile_height))
+    for tile, im in zip(tiles, images):
+        new_im.paste(im, ((tile[1] - min_x) * tile_width, (tile[2] - min_y) * tile_height))
+    return new_im
@@ -0,0 +1,218 @@
+from datetime import datetime
+from io import BytesIO
+import asyncio
+import json
+import unittest
+import geojson
+from PIL import Image
+from spaceknow.aio.api import AsyncAuthorizedSession, AsyncKrakenApi, AsyncRagnarApi, AsyncTaskingObject
+from spaceknow.aio.control import AsyncTaskingManager, gather
+from spaceknow.aio.interface import AsyncSpaceknowCarsAnalyser
+from spaceknow.aio.transport import AsyncTransport, TransportResponse
+from spaceknow.cache import MemorySearchCache
+from spaceknow.control import PollingPolicy
+from spaceknow.errors import SpaceknowApiException, TaskingException
+
+EXTENT = geojson.Polygon([[(153.1047, -27.3903), (153.1066, -27.3911), (153.1053, -27.3934), (153.1047, -27.3903)]])
+TILES = [[19, 482233, 297428], [19, 482234, 297428]]
+DETECTIONS = {'features': [
+    {'geometry': {'type': 'Polygon', 'coordinates': [[[153.1050, -27.3910], [153.1051, -27.3910], [153.1051, -27.3911], [153.1050, -27.3910]]]},
+     'properties': {'class': 'cars', 'count': 2}}
+]}
+IMMEDIATE_POLLING = PollingPolicy(min_interval=0, initial_interval=0)
+
+
+def png_bytes() -> bytes:
+    buffer = BytesIO()
+    Image.new('RGB', (256, 256)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FakeTransport(AsyncTransport):
+    """Answers requests by url suffix. Pipelines are resolved on their second status check."""
+    def __init__(self, routes: dict = None):
+        self.requests = []
+        self.searches = []
+        self.__status_checks = {}
+        self.__routes = {
+            '/oauth/ro': {'id_token': 'valid-token'},
+            '/imagery/search/initiate': {'pipelineId': 'ragnar'},
+            '/imagery/search/retrieve': {'results': [
+                {'sceneId': 'scene-1', 'datetime': '2018-01-06 10:00:00'},
+                {'sceneId': 'scene-2', 'datetime': '2018-01-16 10:00:00'}]},
+            '/kraken/release/cars/geojson/initiate': {'pipelineId': 'cars'},
+            '/kraken/release/cars/geojson/retrieve': {'mapId': 'cars-map', 'tiles': TILES},
+            '/kraken/release/imagery/geojson/initiate': {'pipelineId': 'imagery'},
+            '/kraken/release/imagery/geojson/retrieve': {'mapId': 'imagery-map', 'tiles': TILES},
+            '/detections.geojson': DETECTIONS,
+        }
+        self.__routes.update(routes or {})
+
+    async def request(self, method, url, headers=None, json=None):
+        self.requests.append((method, url, headers))
+        if url.endswith('/imagery/search/initiate'):
+            self.searches.append(json)
+        if url.endswith('/tasking/get-status'):
+            pipeline_id = json['pipelineId']
+            self.__status_checks[pipeline_id] = self.__status_checks.get(pipeline_id, 0) + 1
+            status = 'PROCESSING' if self.__status_checks[pipeline_id] == 1 else 'RESOLVED'
+            return self.__json_response({'status': status, 'nextTry': 0})
+        if url.endswith('/truecolor.png'):
+            return TransportResponse(200, png_bytes())
+        for suffix, body in self.__routes.items():
+            if url.endswith(suffix):
+                return self.__json_response(body)
+        return self.__json_response({'error': 'NON-EXISTENT-ENDPOINT'})
+
+    def __json_response(self, body) -> TransportResponse:
+        return TransportResponse(200, bytes(json.dumps(body), 'utf-8'))
+
+
+class TestAsyncApi(unittest.IsolatedAsyncioTestCase):
+    async def test_retrieve_results_should_equal(self):
+        ragnar = AsyncRagnarApi(AsyncAuthorizedSession('valid-token', FakeTransport()))
+
+        actual = await ragnar.retrieve_results('ragnar')
+
+        self.assertListEqual([(datetime(2018,1,6,10), 'scene-1'), (datetime(2018,1,16,10), 'scene-2')], actual)
+
+    async def test_get_failed_on_transient_error_should_be_retried(self):
+        class FlakyTransport(FakeTransport):
+            failures = 2
+            async def request(self, method, url, headers=None, json=None):
+                if url.endswith('/detections.geojson') and self.failures > 0:
+                    self.failures -= 1
+                    return TransportResponse(503, b'Service Unavailable', {'Retry-After': '0'})
+                return await super().request(method, url, headers, json)
+        transport = FlakyTransport()
+        kraken = AsyncKrakenApi(AsyncAuthorizedSession('valid-token', transport))
+
+        actual = await kraken.get_detection_counts('cars-map', TILES[0])
+
+        self.assertDictEqual({'cars': 2}, actual)
+        self.assertEqual(0, transport.failures)
+
+    async def test_call_failed_response_should_throw_SpaceknowException(self):
+        transport = FakeTransport({'/imagery/search/retrieve': {'error': 'NOT-AUTHORIZED', 'errorMessage': 'You are not authorized.'}})
+        ragnar = AsyncRagnarApi(AsyncAuthorizedSession('valid-token', transport))
+
+        with self.assertRaises(SpaceknowApiException) as ctx:
+            await ragnar.retrieve_results('ragnar')
+        self.assertNotIsInstance(ctx.exception, TaskingException)
+
+    async def test_session_should_send_authorization_header(self):
+        transport = FakeTransport()
+        session = AsyncAuthorizedSession('valid-token', transport)
+
+        await session.request('GET', 'https://api.spaceknow.com/detections.geojson')
+
+        self.assertEqual('Bearer valid-token', transport.requests[0][2]['authorization'])
+
+
+class TestAsyncTaskingManager(unittest.IsolatedAsyncioTestCase):
+    async def test_wait_all_should_keep_order_of_tasking_objects(self):
+        session = AsyncAuthorizedSession('valid-token', FakeTransport())
+        async def result(value):
+            return value
+        task_objs = [AsyncTaskingObject(session, str(i), lambda i=i: result(i)) for i in range(5)]
+
+        actual = await AsyncTaskingManager(polling_policy=IMMEDIATE_POLLING).wait_all(task_objs)
+
+        self.assertListEqual(list(range(5)), actual)
+
+    async def test_wait_untill_completed_fail_tasking_response_should_throw(self):
+        class FailingTransport(FakeTransport):
+            async def request(self, method, url, headers=None, json=None):
+                return TransportResponse(200, b'{"status": "FAILED"}')
+        task_obj = AsyncTaskingObject(AsyncAuthorizedSession('valid-token', FailingTransport()), 'id', None)
+
+        with self.assertRaises(TaskingException) as ctx:
+            await AsyncTaskingManager().wait_untill_completed(task_obj)
+        self.assertEqual(ctx.exception.error_type, AsyncTaskingManager.TASK_FAILED_ERROR)
+
+    async def test_exceeded_deadline_should_throw(self):
+        class ProcessingTransport(FakeTransport):
+            async def request(self, method, url, headers=None, json=None):
+                return TransportResponse(200, b'{"status": "PROCESSING", "nextTry": 1}')
+        task_obj = AsyncTaskingObject(AsyncAuthorizedSession('valid-token', ProcessingTransport()), 'id', None)
+        policy = PollingPolicy(min_interval=0, deadline=0.05)
+
+        with self.assertRaises(TaskingException) as ctx:
+            await AsyncTaskingManager(polling_policy=policy).wait_untill_completed(task_obj)
+        self.assertEqual(ctx.exception.error_type, AsyncTaskingManager.TASK_TIMEOUT_ERROR)
+
+
+    async def test_gather_failed_awaitable_should_cancel_others(self):
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+        async def pending():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        async def failing():
+            await started.wait()
+            raise TaskingException('FAILED', 'Failed.')
+
+        with self.assertRaises(TaskingException):
+            await gather([pending(), failing()])
+        self.assertTrue(cancelled.is_set())
+
+
+class TestAsyncSpaceknowCarsAnalyser(unittest.IsolatedAsyncioTestCase):
+    async def test_get_car_counts_should_equal(self):
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=FakeTransport(), polling_policy=IMMEDIATE_POLLING) as analyser:
+            analysis = await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,30))
+            actual = await analysis.get_car_counts()
+
+        self.assertListEqual([(datetime(2018,1,6,10), 4), (datetime(2018,1,16,10), 4)], actual)
+
+    async def test_get_images_should_merge_tiles(self):
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=FakeTransport(), polling_policy=IMMEDIATE_POLLING) as analyser:
+            analysis = await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,30))
+            actual = await analysis.get_images()
+
+        self.assertEqual(2, len(actual))
+        self.assertEqual((512, 256), actual[0][1].size)
+
+    async def test_analyse_on_moved_window_should_search_only_new_interval(self):
+        transport = FakeTransport()
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=transport, polling_policy=IMMEDIATE_POLLING, search_cache=MemorySearchCache()) as analyser:
+            await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,20))
+            await analyser.analyse_on(EXTENT, datetime(2018,1,6), datetime(2018,1,21))
+
+        self.assertEqual(2, len(transport.searches))
+        self.assertEqual('2018-01-20 00:00:00', transport.searches[1]['startDatetime'])
+        self.assertEqual('2018-01-21 00:00:00', transport.searches[1]['endDatetime'])
+
+    async def test_analyse_on_without_search_cache_should_search_whole_window(self):
+        transport = FakeTransport()
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=transport, polling_policy=IMMEDIATE_POLLING) as analyser:
+            await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,20))
+            await analyser.analyse_on(EXTENT, datetime(2018,1,6), datetime(2018,1,21))
+
+        self.assertEqual(2, len(transport.searches))
+        self.assertEqual('2018-01-06 00:00:00', transport.searches[1]['startDatetime'])
+
+    async def test_concurrent_analysis_calls_should_initiate_one_cars_pipeline_per_scene(self):
+        transport = FakeTransport()
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=transport, polling_policy=IMMEDIATE_POLLING) as analyser:
+            analysis = await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,30))
+            await asyncio.gather(analysis.get_images(), analysis.get_images(), analysis.get_car_counts())
+
+        initiations = [r for r in transport.requests if r[1].endswith('/kraken/release/cars/geojson/initiate')]
+        self.assertEqual(2, len(initiations))
+
+    async def test_duplicate_scene_ids_should_be_analysed_once(self):
+        transport = FakeTransport({'/imagery/search/retrieve': {'results': [
+            {'sceneId': 'scene-1', 'datetime': '2018-01-06 10:00:00'},
+            {'sceneId': 'scene-1', 'datetime': '2018-01-16 10:00:00'}]}})
+        async with AsyncSpaceknowCarsAnalyser('username', 'password', transport=transport, polling_policy=IMMEDIATE_POLLING) as analyser:
+            analysis = await analyser.analyse_on(EXTENT, datetime(2018,1,5), datetime(2018,1,30))
+            actual = await analysis.get_car_counts()
+
+        initiations = [r for r in transport.requests if r[1].endswith('/kraken/release/cars/geojson/initiate')]
+        self.assertEqual(1, len(initiations))
+        self.assertListEqual([(datetime(2018,1,6,10), 4), (datetime(2018,1,16,10), 4)], actual)
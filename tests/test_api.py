@@ -3,14 +3,21 @@ from unittest .mock import patch
 import random
 from requests.models import Response
 import spaceknow
-from spaceknow.api import AuthorizedSession, RagnarApi, SpaceknowApi, TaskingObject, TaskingStatus
+from spaceknow.api import AuthorizedSession, ConnectionSettings, KrakenApi, RagnarApi, SpaceknowApi, TaskingObject, TaskingStatus
+from spaceknow.cache import TileImageCache
+from spaceknow.throttling import RateLimiter, RetryPolicy, TokenBucket
+from io import BytesIO
+from PIL import Image
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
 from requests.utils import default_headers
 import unittest 
 import json
 import geojson
 from shared import generate_mocked_session_request
 
-from spaceknow.errors import SpaceknowApiException, TaskingException, UnexpectedResponseException
+from spaceknow.errors import MapExpiredException, SpaceknowApiException, TaskingException, UnexpectedResponseException
 
 class TestAuthorizedSession(unittest.TestCase):
     VALID_TOKEN = 'abcdefghijklmnopqrzstuv.123456789'
@@ -36,6 +43,42 @@ class TestAuthorizedSession(unittest.TestCase):
 
 
 
+    def test_connection_settings_should_configure_headers_and_timeout(self):
+        session = AuthorizedSession(self.VALID_TOKEN, connection_settings=ConnectionSettings(keep_alive=False, compression=False, timeout=3))
+
+        with patch('requests.Session.request') as request:
+            session.request('GET', 'https://api.spaceknow.com/endpoint')
+
+        self.assertEqual('close', session.headers['Connection'])
+        self.assertEqual('identity', session.headers['Accept-Encoding'])
+        self.assertEqual(3, request.call_args.kwargs['timeout'])
+
+    def test_pool_stats_should_show_reused_connections(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+            def log_message(self, *args):
+                pass
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        session = AuthorizedSession(self.VALID_TOKEN)
+        try:
+            for _ in range(3):
+                session.get(f'http://127.0.0.1:{server.server_port}/endpoint')
+            stats = session.pool_stats()
+        finally:
+            session.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(1, len(stats))
+        self.assertEqual((1, 3), (stats[0].connections, stats[0].requests))
+
+
 class TestSpaceknowApi(unittest.TestCase):
     VALID_RESPONSE_BODY = '{"type": "json", "color": "red", "name": "John"}'
     AUTH_ERROR_RESPONSE_BODY = '{"error": "NOT-AUTHORIZED", "errorMessage": "You are not authorized."}'
@@ -185,4 +228,144 @@ class TestRagnarApi(unittest.TestCase):
 class TestKrakenApi(unittest.TestCase):
     def test_get_image_when_wrong_map_id_is_presented_should_throw_error(self):
         #např pokus si ziskato brazky z analyzy aut
-        pass
\ No newline at end of file
+        pass
+
+    def test_get_satelite_image_cached_should_not_call_api(self):
+        buffer = BytesIO()
+        Image.new('RGB', (256, 256)).save(buffer, format='PNG')
+        png = buffer.getvalue()
+        tile = (19, 482233, 297428)
+        with tempfile.TemporaryDirectory() as directory:
+            kraken = KrakenApi(AuthorizedSession('valid-token'), TileImageCache(directory))
+            response = Response()
+            response._content = png
+            with patch('requests.Session.request', return_value=response) as request:
+                first = kraken.get_satelite_image('map-id', tile)
+                second = kraken.get_satelite_image('map-id', tile)
+
+            self.assertEqual(1, request.call_count)
+            self.assertEqual(first.size, second.size)
+
+    DETECTIONS_RESPONSE_BODY = json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [0.0, 0.0]]]}, 'properties': {'class': 'cars', 'count': 2}},
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[2.0, 2.0], [2.0, 3.0], [3.0, 3.0], [2.0, 2.0]]]}, 'properties': {'class': 'trucks', 'count': '1'}}]})
+
+    @patch('requests.Session.request', generate_mocked_session_request(DETECTIONS_RESPONSE_BODY))
+    def test_get_detection_batch_should_equal_get_detections(self):
+        kraken = KrakenApi(AuthorizedSession('valid-token'))
+
+        batch = kraken.get_detection_batch('map-id', (19, 0, 0))
+
+        self.assertEqual(3, batch.total_count())
+        self.assertListEqual(kraken.get_detections('map-id', (19, 0, 0)), batch.to_features())
+
+    @patch('requests.Session.request', generate_mocked_session_request('{"features": [{"type": "Feature", "geometry": null, "properties": {"class": "cars", "count": 1}}]}'))
+    def test_get_detection_batch_invalid_response_should_throw(self):
+        kraken = KrakenApi(AuthorizedSession('valid-token'))
+
+        with self.assertRaises(UnexpectedResponseException):
+            kraken.get_detection_batch('map-id', (19, 0, 0))
+        with self.assertRaises(UnexpectedResponseException):
+            kraken.get_detections('map-id', (19, 0, 0))
+
+    @patch('requests.Session.request', generate_mocked_session_request(DETECTIONS_RESPONSE_BODY))
+    def test_get_detection_counts_should_equal_counts_per_class_of_batch(self):
+        kraken = KrakenApi(AuthorizedSession('valid-token'))
+
+        counts = kraken.get_detection_counts('map-id', (19, 0, 0))
+
+        self.assertDictEqual({'cars': 2, 'trucks': 1}, counts)
+        self.assertDictEqual(kraken.get_detection_batch('map-id', (19, 0, 0)).counts_per_class(), counts)
+
+
+    @patch('requests.Session.request', generate_mocked_session_request('{"error": "NON-EXISTENT-MAP", "errorMessage": "Map was not found."}'))
+    def test_get_detection_counts_of_missing_map_should_throw_MapExpiredException(self):
+        kraken = KrakenApi(AuthorizedSession('valid-token'))
+
+        with self.assertRaises(MapExpiredException):
+            kraken.get_detection_counts('expired-map-id', (19, 0, 0))
+
+
+class TestSpaceknowApiRetries(unittest.TestCase):
+    @staticmethod
+    def response(status_code: int, content: bytes = b'{}') -> Response:
+        response = Response()
+        response.status_code = status_code
+        response._content = content
+        return response
+
+    def test_get_failed_on_transient_error_should_be_retried(self):
+        api = SpaceknowApi(AuthorizedSession('valid-token', retry_policy=RetryPolicy(initial_delay=0)))
+        responses = [self.response(503), self.response(200, b'{"ok": true}')]
+
+        with patch('requests.Session.request', side_effect=responses) as request:
+            actual = api._call('GET', '/kraken/grid/endpoint', None)
+
+        self.assertEqual(2, request.call_count)
+        self.assertDictEqual({'ok': True}, actual)
+
+    def test_post_should_not_be_retried(self):
+        api = SpaceknowApi(AuthorizedSession('valid-token', retry_policy=RetryPolicy(initial_delay=0)))
+
+        with patch('requests.Session.request', side_effect=[self.response(503), self.response(200)]) as request:
+            response = api._request('POST', '/kraken/release/cars/geojson/initiate', {})
+
+        self.assertEqual(1, request.call_count)
+        self.assertEqual(503, response.status_code)
+
+    def test_requests_should_wait_for_rate_limiter(self):
+        limiter = RateLimiter({RateLimiter.KRAKEN_GRID: TokenBucket(rate=10, capacity=1)})
+        api = SpaceknowApi(AuthorizedSession('valid-token', rate_limiter=limiter))
+        slept = []
+
+        with patch('requests.Session.request', return_value=self.response(200)), patch('spaceknow.api.sleep', slept.append):
+            for _ in range(3):
+                api._request('GET', '/kraken/grid/endpoint')
+
+        self.assertEqual(2, len(slept))
+
+    def test_rejected_token_should_be_refreshed_and_only_failed_request_sent_again(self):
+        class Provider:
+            tokens = ['expired-token', 'fresh-token']
+            def token(self):
+                return self.tokens[0]
+            def invalidate(self, token):
+                self.tokens.remove(token)
+        api = SpaceknowApi(AuthorizedSession(token_provider=Provider()))
+        responses = [self.response(200, b'{"error": "INVALID-JWT", "errorMessage": "Token expired."}'), self.response(200, b'{"ok": true}')]
+
+        with patch('requests.Session.request', side_effect=responses) as request:
+            actual = api._call('POST', '/kraken/release/cars/geojson/initiate', {})
+
+        self.assertDictEqual({'ok': True}, actual)
+        self.assertListEqual(['Bearer expired-token', 'Bearer fresh-token'], [c.kwargs['headers']['authorization'] for c in request.call_args_list])
+
+    def test_call_with_token_provider_should_decode_body_once(self):
+        class Provider:
+            def token(self):
+                return 'token'
+            def invalidate(self, token):
+                pass
+        api = SpaceknowApi(AuthorizedSession(token_provider=Provider()))
+
+        with patch('requests.Session.request', return_value=self.response(200, b'{"ok": true}')), \
+                patch('spaceknow.api.orjson', None), patch('json.loads', wraps=json.loads) as loads:
+            actual = api._call('POST', '/kraken/release/cars/geojson/initiate', {})
+
+        self.assertDictEqual({'ok': True}, actual)
+        self.assertEqual(1, loads.call_count)
+
+    def test_token_rejected_twice_should_throw(self):
+        class Provider:
+            def token(self):
+                return 'token'
+            def invalidate(self, token):
+                pass
+        api = SpaceknowApi(AuthorizedSession(token_provider=Provider()))
+        rejected = self.response(401, b'{"error": "NOT-AUTHORIZED", "errorMessage": "You are not authorized."}')
+
+        with patch('requests.Session.request', return_value=rejected) as request:
+            with self.assertRaises(SpaceknowApiException):
+                api._call('POST', '/kraken/release/cars/geojson/initiate', {})
+        self.assertEqual(2, request.call_count)
+
@@ -1,8 +1,12 @@
 from unittest.mock import patch
+from threading import Barrier, Thread
+import base64
+import json
 import unittest 
-from spaceknow.authorization import AuthorizationService, UnexpectedResponseException
+from spaceknow.authorization import AuthorizationService, TokenProvider, UnexpectedResponseException, jwt_expiration
 import spaceknow.errors as errors
 from requests import Response
+from spaceknow.api import AuthorizedSession
 from spaceknow.models import Credentials
 
 VALID_USERNAME = 'valid-username'
@@ -49,4 +53,88 @@ class TestAuthorization(unittest.TestCase):
     def test_not_json_response_should_throw_unexpectetException(self):
         authService = AuthorizationService(VALID_CLIENTID)
         with self.assertRaises(UnexpectedResponseException):
-            authService.request_jwt(Credentials(VALID_USERNAME, VALID_PASSWORD))
\ No newline at end of file
+            authService.request_jwt(Credentials(VALID_USERNAME, VALID_PASSWORD))
+    def test_shared_session_should_not_send_api_authorization_header(self):
+        session = AuthorizedSession('api-token')
+        authService = AuthorizationService(VALID_CLIENTID, session)
+        sent_headers = []
+        def send(self, request, **kwargs):
+            sent_headers.append(request.headers)
+            return mocked_request_post_with_valid_response(self, request.url, json={'username': VALID_USERNAME, 'password': VALID_PASSWORD})
+
+        with patch('requests.Session.send', send):
+            token = authService.request_jwt(Credentials(VALID_USERNAME, VALID_PASSWORD))
+
+        self.assertEqual(VALID_TOKEN, token)
+        self.assertNotIn('authorization', sent_headers[0])
+
+
+def jwt(exp: float) -> str:
+    """Builds unsigned JWT expiring at a given unix time."""
+    def encode(value: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{encode({'alg': 'none'})}.{encode({'exp': exp, 'sub': VALID_USERNAME})}.signature"
+
+
+class CountingAuthorizationService:
+    """Stand-in for AuthorizationService issuing tokens valid for an hour."""
+    def __init__(self, clock):
+        self.calls = 0
+        self.__clock = clock
+
+    def request_jwt(self, credentials):
+        self.calls += 1
+        return jwt(self.__clock() + 3600 + self.calls)
+
+
+class TestTokenProvider(unittest.TestCase):
+    def setUp(self):
+        self.now = 1_600_000_000.0
+        self.service = CountingAuthorizationService(lambda: self.now)
+        self.provider = TokenProvider(self.service, Credentials(VALID_USERNAME, VALID_PASSWORD), refresh_margin=60, clock=lambda: self.now)
+
+    def test_jwt_expiration(self):
+        self.assertEqual(1234.0, jwt_expiration(jwt(1234)))
+        self.assertIsNone(jwt_expiration('not-a-jwt'))
+
+    def test_token_should_be_reused_untill_refresh_margin(self):
+        token = self.provider.token()
+        self.now += 3600 - 61
+
+        self.assertEqual(token, self.provider.token())
+        self.assertEqual(1, self.service.calls)
+
+    def test_token_should_be_refreshed_ahead_of_expiration(self):
+        token = self.provider.token()
+        self.now += 3600 - 30
+
+        self.assertNotEqual(token, self.provider.token())
+        self.assertEqual(2, self.service.calls)
+
+    def test_invalidate_should_refresh_only_rejected_token(self):
+        rejected = self.provider.token()
+        self.provider.invalidate(rejected)
+        refreshed = self.provider.token()
+
+        self.provider.invalidate(rejected)
+
+        self.assertEqual(refreshed, self.provider.token())
+        self.assertEqual(2, self.service.calls)
+
+    def test_concurrent_refresh_should_request_token_once(self):
+        self.provider.token()
+        self.now += 3600
+        barrier = Barrier(8)
+        tokens = []
+        def get_token():
+            barrier.wait()
+            tokens.append(self.provider.token())
+        threads = [Thread(target=get_token) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(set(tokens)))
+        self.assertEqual(2, self.service.calls)
+
@@ -0,0 +1,79 @@
+import unittest
+from benchmarks.runner import Measurement, find_regressions, measure, to_baseline
+from benchmarks.suite import Benchmark, benchmarks
+from benchmarks import load
+from benchmarks.fake_server import FakeServerConfig, FakeSpaceknowServer
+from spaceknow.control import PollingPolicy
+from spaceknow.interface import SpaceknowCarsAnalyser
+from spaceknow.throttling import RetryPolicy
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_measure_should_report_time_and_peak_memory(self):
+        benchmark = Benchmark('allocate', lambda: lambda: bytearray(100000))
+
+        actual = measure(benchmark, repeat=2, min_time=0.001)
+
+        self.assertGreater(actual.seconds, 0)
+        self.assertGreaterEqual(actual.peak_bytes, 100000)
+
+    def test_measure_untraced_memory_should_not_report_peak_memory(self):
+        benchmark = Benchmark('image', lambda: lambda: bytearray(100000), traced_memory=False)
+
+        actual = measure(benchmark, repeat=2, min_time=0.001)
+
+        self.assertIsNone(actual.peak_bytes)
+
+    def test_find_regressions_should_report_only_exceeded_tolerance(self):
+        baseline = to_baseline([Measurement('fast', 1.0, 1.0, 1000, 1), Measurement('slow', 1.0, 1.0, 1000, 1)])
+        measurements = [Measurement('fast', 1.4, 1.4, 1000, 1), Measurement('slow', 1.6, 1.6, 1000, 1), Measurement('new', 9.0, 9.0, 1000, 1)]
+
+        actual = find_regressions(measurements, baseline, time_tolerance=0.5)
+
+        self.assertEqual(1, len(actual))
+        self.assertTrue(actual[0].startswith('slow'))
+
+    def test_benchmarks_should_have_unique_names(self):
+        names = [b.name for b in benchmarks()]
+
+        self.assertEqual(len(names), len(set(names)))
+
+
+class TestLoad(unittest.TestCase):
+    FAST_POLLING = PollingPolicy(min_interval=0.01, initial_interval=0.01)
+
+    def test_run_should_analyse_all_extents_against_fake_server(self):
+        config = FakeServerConfig(processing_time=0.05, next_try=0, scenes=2, cars_per_tile=5)
+
+        actual = load.run(config, extent_count=3, concurrency=2, extent_side=1, polling_policy=self.FAST_POLLING)
+
+        self.assertEqual(0, actual.failed)
+        self.assertEqual(3, len(actual.latencies))
+        self.assertEqual(1, actual.requests['oauth'])
+        self.assertEqual(3 * 2, actual.requests['detections'])
+        self.assertLess(sum(p.connections for p in actual.pools), sum(p.requests for p in actual.pools))
+
+    def test_run_should_report_failed_pipelines(self):
+        config = FakeServerConfig(processing_time=0.0, next_try=0, failure_rate=1.0)
+
+        actual = load.run(config, extent_count=2, extent_side=1, polling_policy=self.FAST_POLLING)
+
+        self.assertEqual(2, actual.failed)
+        self.assertIsNone(actual.percentile(50))
+
+    def test_fake_server_should_retry_injected_errors(self):
+        config = FakeServerConfig(processing_time=0.0, next_try=0, scenes=1, cars_per_tile=5, error_rate=0.5, seed=1)
+        with FakeSpaceknowServer(config) as server, SpaceknowCarsAnalyser('user', 'password', polling_policy=self.FAST_POLLING,
+                retry_policy=RetryPolicy(max_retries=10, initial_delay=0.0), api_domain=server.url, auth0_domain=server.url) as analyser:
+            actual = analyser.analyse_on(next(load.extents(1, 1)), load.FROM_DATE, load.TO_DATE).get_car_counts()
+
+            self.assertEqual(1, len(actual))
+            self.assertGreaterEqual(actual[0][1], 5)
+            self.assertGreater(server.requests['detections'], 1)
+
+    def test_percentile_should_use_nearest_rank(self):
+        result = load.LoadResult(4, 0, 1.0, [0.4, 0.1, 0.3, 0.2])
+
+        self.assertEqual(0.2, result.percentile(50))
+        self.assertEqual(0.4, result.percentile(99))
+        self.assertEqual(4.0, result.throughput)
@@ -0,0 +1,319 @@
+from datetime import datetime
+import os
+from threading import Thread
+from time import sleep
+import tempfile
+import unittest
+from unittest.mock import patch
+from geojson import Polygon
+from spaceknow.cache import CacheStats, LRUCache, MemoryDetectionsCache, MemorySearchCache, SqliteDetectionsCache, SqliteSearchCache, TileImageCache, extent_fingerprint, uncovered_intervals
+from spaceknow.models import DetectionBatch, Feature
+
+EXTENT_KEY = 'extent'
+SCENE_ID = 'scene'
+TILE = (19, 482233, 297428)
+
+
+def detections(count: int = 1) -> DetectionBatch:
+    return DetectionBatch.from_features([Feature('cars', i + 1, Polygon([[(0.0, 0.0), (0.0, 1.0), (1.0, 1.0), (0.0, 0.0)]])) for i in range(count)])
+
+
+class TestExtentFingerprint(unittest.TestCase):
+    def test_equal_extents_should_have_equal_fingerprints(self):
+        extent = Polygon([[(153.1047, -27.3903), (153.1066, -27.3911), (153.1053, -27.3934), (153.1047, -27.3903)]])
+        noisy_extent = {'coordinates': [[[153.1047 + 1e-12, -27.3903], [153.1066, -27.3911], [153.1053, -27.3934], [153.1047, -27.3903]]], 'type': 'Polygon'}
+
+        self.assertEqual(extent_fingerprint(extent), extent_fingerprint(noisy_extent))
+
+    def test_different_extents_should_have_different_fingerprints(self):
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+        other_extent = Polygon([[(1, 1), (2, 2), (3, 2), (1, 1)]])
+
+        self.assertNotEqual(extent_fingerprint(extent), extent_fingerprint(other_extent))
+
+
+class TestSqliteDetectionsCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'detections.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries_should_persist_across_instances(self):
+        cache = SqliteDetectionsCache(self.path)
+        cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [TILE])
+        cache.put_tile(EXTENT_KEY, SCENE_ID, TILE, detections(2))
+        cache.put_tile_counts(EXTENT_KEY, SCENE_ID, TILE, {'cars': 2})
+        cache.close()
+
+        cache = SqliteDetectionsCache(self.path)
+
+        self.assertEqual(('map-id', [TILE]), cache.get_scene(EXTENT_KEY, SCENE_ID))
+        self.assertEqual(detections(2), cache.get_tile(EXTENT_KEY, SCENE_ID, TILE))
+        self.assertDictEqual({'cars': 2}, cache.get_tile_counts(EXTENT_KEY, SCENE_ID, TILE))
+        self.assertIsNone(cache.get_tile_counts(EXTENT_KEY, SCENE_ID, (19, 99, 0)))
+
+    def test_entries_of_other_extent_should_be_missing(self):
+        cache = SqliteDetectionsCache(self.path)
+        cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [TILE])
+        cache.put_tile(EXTENT_KEY, SCENE_ID, TILE, detections())
+
+        self.assertIsNone(cache.get_scene('other-extent', SCENE_ID))
+        self.assertIsNone(cache.get_tile('other-extent', SCENE_ID, TILE))
+
+    def test_least_recently_used_tiles_should_be_evicted(self):
+        now = [0.0]
+        with patch('spaceknow.cache.time', lambda: now[0]):
+            # Each tile takes up 142 bytes, so three tiles fit in.
+            cache = SqliteDetectionsCache(self.path, max_bytes=450)
+            for x in range(3):
+                now[0] += 1
+                cache.put_tile(EXTENT_KEY, SCENE_ID, (19, x, 0), detections())
+            now[0] += 1
+            cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 0, 0))
+            now[0] += 1
+            cache.put_tile(EXTENT_KEY, SCENE_ID, (19, 3, 0), detections())
+
+            self.assertIsNotNone(cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 0, 0)))
+            self.assertIsNone(cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 1, 0)))
+            self.assertIsNotNone(cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 3, 0)))
+
+    def test_expired_entries_should_be_missing(self):
+        now = [0.0]
+        with patch('spaceknow.cache.time', lambda: now[0]):
+            cache = SqliteDetectionsCache(self.path, ttl=60)
+            cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [TILE])
+            cache.put_tile(EXTENT_KEY, SCENE_ID, TILE, detections())
+            now[0] += 30
+            self.assertIsNotNone(cache.get_scene(EXTENT_KEY, SCENE_ID))
+            now[0] += 31
+
+            self.assertIsNone(cache.get_scene(EXTENT_KEY, SCENE_ID))
+            self.assertIsNone(cache.get_tile(EXTENT_KEY, SCENE_ID, TILE))
+
+
+    def test_evicted_tile_should_evict_its_scene(self):
+        now = [0.0]
+        with patch('spaceknow.cache.time', lambda: now[0]):
+            # The tile takes up 142 bytes, so it is the least recently used entry evicted first.
+            cache = SqliteDetectionsCache(self.path, max_bytes=200)
+            cache.put_tile(EXTENT_KEY, SCENE_ID, TILE, detections())
+            now[0] += 1
+            cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [TILE])
+            now[0] += 1
+
+            cache.put_tile('other-extent', SCENE_ID, TILE, detections())
+
+            self.assertIsNone(cache.get_tile(EXTENT_KEY, SCENE_ID, TILE))
+            self.assertIsNone(cache.get_scene(EXTENT_KEY, SCENE_ID))
+            self.assertIsNotNone(cache.get_tile('other-extent', SCENE_ID, TILE))
+
+    def test_counts_should_be_subject_to_size_limit(self):
+        cache = SqliteDetectionsCache(self.path, max_bytes=100)
+        for x in range(20):
+            cache.put_tile_counts(EXTENT_KEY, SCENE_ID, (19, x, 0), {'cars': x})
+
+        self.assertIsNone(cache.get_tile_counts(EXTENT_KEY, SCENE_ID, (19, 0, 0)))
+        self.assertDictEqual({'cars': 19}, cache.get_tile_counts(EXTENT_KEY, SCENE_ID, (19, 19, 0)))
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_entries_should_be_evicted(self):
+        cache = LRUCache(max_bytes=3, sizeof=lambda v: 1)
+        for key in 'abc':
+            cache.put(key, key.upper())
+        cache.get('a')
+
+        cache.put('d', 'D')
+
+        self.assertEqual('A', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.stats.evictions)
+
+    def test_size_should_not_exceed_max_bytes(self):
+        cache = LRUCache(max_bytes=100, sizeof=len)
+        for i in range(50):
+            cache.put(i, 'x' * (i % 30))
+
+        self.assertLessEqual(cache.stats.size_bytes, 100)
+
+    def test_value_bigger_than_max_bytes_should_not_be_stored(self):
+        cache = LRUCache(max_bytes=10, sizeof=len)
+        cache.put('small', 'x' * 5)
+
+        cache.put('big', 'x' * 11)
+
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual('x' * 5, cache.get('small'))
+
+    def test_stats_should_count_hits_and_misses(self):
+        cache = LRUCache(max_bytes=10, sizeof=len)
+        cache.put('key', 'value')
+
+        cache.get('key')
+        cache.get('key')
+        cache.get('missing')
+
+        self.assertEqual(CacheStats(hits=2, misses=1, evictions=0, entries=1, size_bytes=5), cache.stats)
+
+    def test_concurrent_puts_should_keep_size_consistent(self):
+        cache = LRUCache(max_bytes=1000, sizeof=len)
+        def put_many(offset):
+            for i in range(500):
+                cache.put((offset, i), 'x' * 10)
+        threads = [Thread(target=put_many, args=(t,)) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = cache.stats
+        self.assertEqual(100, stats.entries)
+        self.assertEqual(1000, stats.size_bytes)
+        self.assertEqual(8 * 500 - 100, stats.evictions)
+
+
+class TestMemoryDetectionsCache(unittest.TestCase):
+    def test_tiles_should_be_evicted_over_memory_ceiling(self):
+        cache = MemoryDetectionsCache(max_bytes=10 * 1024)
+        for x in range(100):
+            cache.put_tile(EXTENT_KEY, SCENE_ID, (19, x, 0), detections(2))
+
+        self.assertLessEqual(cache.stats.size_bytes, 10 * 1024)
+        self.assertGreater(cache.stats.evictions, 0)
+        self.assertEqual(detections(2), cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 99, 0)))
+        self.assertIsNone(cache.get_tile(EXTENT_KEY, SCENE_ID, (19, 0, 0)))
+
+    def test_evicted_tile_should_evict_its_scene(self):
+        cache = MemoryDetectionsCache(max_bytes=10 * 1024)
+        cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [(19, x, 0) for x in range(100)])
+        for x in range(100):
+            cache.put_tile(EXTENT_KEY, SCENE_ID, (19, x, 0), detections(2))
+
+        self.assertIsNone(cache.get_scene(EXTENT_KEY, SCENE_ID))
+
+    def test_expired_entries_should_be_missing(self):
+        now = [0.0]
+        cache = MemoryDetectionsCache(ttl=60, clock=lambda: now[0])
+        cache.put_scene(EXTENT_KEY, SCENE_ID, 'map-id', [TILE])
+        cache.put_tile_counts(EXTENT_KEY, SCENE_ID, TILE, {'cars': 2})
+        now[0] += 30
+        self.assertEqual(('map-id', [TILE]), cache.get_scene(EXTENT_KEY, SCENE_ID))
+        now[0] += 31
+
+        self.assertIsNone(cache.get_scene(EXTENT_KEY, SCENE_ID))
+        self.assertIsNone(cache.get_tile_counts(EXTENT_KEY, SCENE_ID, TILE))
+        self.assertEqual(0, cache.stats.entries)
+
+
+class TestTileImageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_images_should_persist_across_instances(self):
+        TileImageCache(self.directory.name).put('map-id', TILE, b'png-content')
+
+        actual = TileImageCache(self.directory.name).get('map-id', TILE)
+
+        self.assertEqual(b'png-content', actual)
+        self.assertIsNone(TileImageCache(self.directory.name).get('other-map-id', TILE))
+
+    def test_identical_images_should_be_stored_once(self):
+        cache = TileImageCache(self.directory.name)
+
+        cache.put('map-id', TILE, b'png-content')
+        cache.put('other-map-id', TILE, b'png-content')
+
+        self.assertEqual(len(b'png-content'), cache.size_bytes)
+        self.assertEqual(b'png-content', cache.get('other-map-id', TILE))
+
+    def test_least_recently_used_images_should_be_evicted(self):
+        cache = TileImageCache(self.directory.name, max_bytes=30)
+        for x in range(3):
+            cache.put('map-id', (19, x, 0), bytes([x]) * 10)
+            sleep(0.01)
+        cache.get('map-id', (19, 0, 0))
+
+        cache.put('map-id', (19, 3, 0), bytes([3]) * 10)
+
+        self.assertLessEqual(cache.size_bytes, 30)
+        self.assertIsNotNone(cache.get('map-id', (19, 0, 0)))
+        self.assertIsNone(cache.get('map-id', (19, 1, 0)))
+        self.assertIsNotNone(cache.get('map-id', (19, 3, 0)))
+
+    def test_eviction_should_remove_keys_of_evicted_images(self):
+        cache = TileImageCache(self.directory.name, max_bytes=30)
+        for x in range(4):
+            cache.put('map-id', (19, x, 0), bytes([x]) * 10)
+            sleep(0.01)
+
+        keys = os.listdir(os.path.join(self.directory.name, 'keys'))
+
+        self.assertEqual(2, len(keys))
+
+    def test_unfinished_writes_should_be_skipped(self):
+        TileImageCache(self.directory.name).put('map-id', TILE, b'png-content')
+        blob_directory = os.path.join(self.directory.name, 'blobs', os.listdir(os.path.join(self.directory.name, 'blobs'))[0])
+        with open(os.path.join(blob_directory, 'unfinished.1.2.tmp'), 'wb') as file:
+            file.write(b'partial')
+
+        cache = TileImageCache(self.directory.name, max_bytes=10)
+        cache.put('map-id', (19, 0, 0), b'x')
+
+        self.assertEqual(len(b'x'), cache.size_bytes)
+        self.assertTrue(os.path.exists(os.path.join(blob_directory, 'unfinished.1.2.tmp')))
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_uncovered_intervals_should_return_gaps_between_covered_intervals(self):
+        covered = [(datetime(2018,1,10), datetime(2018,1,20)), (datetime(2018,1,1), datetime(2018,1,5))]
+
+        actual = uncovered_intervals(covered, datetime(2018,1,3), datetime(2018,1,25))
+
+        self.assertListEqual([(datetime(2018,1,5), datetime(2018,1,10)), (datetime(2018,1,20), datetime(2018,1,25))], actual)
+
+    def test_uncovered_intervals_of_covered_window_should_be_empty(self):
+        actual = uncovered_intervals([(datetime(2018,1,1), datetime(2018,1,20))], datetime(2018,1,3), datetime(2018,1,20))
+
+        self.assertListEqual([], actual)
+
+    def test_uncovered_intervals_without_covered_should_return_window(self):
+        actual = uncovered_intervals([], datetime(2018,1,3), datetime(2018,1,3))
+
+        self.assertListEqual([(datetime(2018,1,3), datetime(2018,1,3))], actual)
+
+    def test_memory_search_cache_should_merge_intervals_and_results(self):
+        cache = MemorySearchCache()
+        cache.put('key', datetime(2018,1,1), datetime(2018,1,10), [(datetime(2018,1,6,10), 'scene-1')])
+        cache.put('key', datetime(2018,1,10), datetime(2018,1,20), [(datetime(2018,1,16,10), 'scene-2')])
+
+        self.assertListEqual([(datetime(2018,1,1), datetime(2018,1,20))], cache.get_intervals('key'))
+        self.assertListEqual([(datetime(2018,1,16,10), 'scene-2')], cache.get_results('key', datetime(2018,1,7), datetime(2018,1,20)))
+
+    def test_search_cache_should_not_mark_recent_dates_as_searched(self):
+        cache = MemorySearchCache(recent_margin=2 * 24 * 3600, clock=lambda: datetime(2018,1,20))
+        cache.put('key', datetime(2018,1,1), datetime(2018,1,20), [(datetime(2018,1,19), 'scene-late')])
+        cache.put('other-key', datetime(2018,1,19), datetime(2018,1,20), [])
+
+        self.assertListEqual([(datetime(2018,1,1), datetime(2018,1,18))], cache.get_intervals('key'))
+        self.assertListEqual([(datetime(2018,1,19), 'scene-late')], cache.get_results('key', datetime(2018,1,1), datetime(2018,1,20)))
+        self.assertListEqual([], cache.get_intervals('other-key'))
+
+    def test_sqlite_search_cache_should_persist_intervals_and_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'searches.sqlite')
+            cache = SqliteSearchCache(path)
+            cache.put('key', datetime(2018,1,1), datetime(2018,1,10), [(datetime(2018,1,6,10), 'scene-1')])
+            cache.put('key', datetime(2018,1,5), datetime(2018,1,20), [(datetime(2018,1,6,10), 'scene-1'), (datetime(2018,1,16,10), 'scene-2')])
+            cache.close()
+
+            cache = SqliteSearchCache(path)
+            self.assertListEqual([(datetime(2018,1,1), datetime(2018,1,20))], cache.get_intervals('key'))
+            self.assertListEqual([(datetime(2018,1,6,10), 'scene-1'), (datetime(2018,1,16,10), 'scene-2')], 
+                cache.get_results('key', datetime(2018,1,1), datetime(2018,1,20)))
+            self.assertListEqual([], cache.get_intervals('other-key'))
+            cache.close()
@@ -0,0 +1,82 @@
+import math
+import random
+import unittest
+from unittest.mock import patch
+from geojson import MultiPolygon, Polygon
+from spaceknow.clipping import ExtentIndex
+from spaceknow.models import DetectionBatch, Feature
+
+
+def star(center_x: float, center_y: float, vertices: int, radius: float, rng: random.Random) -> list:
+    ring = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius * (0.5 if i % 2 else rng.uniform(0.8, 1))
+        ring.append((center_x + r * math.cos(angle), center_y + r * math.sin(angle)))
+    return ring + ring[:1]
+
+
+def contains(rings: list, x: float, y: float) -> bool:
+    """Reference even-odd test against all the edges."""
+    inside = False
+    for ring in rings:
+        for (ax, ay), (bx, by) in zip(ring, ring[1:]):
+            if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+                inside = not inside
+    return inside
+
+
+def square(center_x: float, center_y: float, size: float = 0.01) -> Polygon:
+    d = size / 2
+    return Polygon([[(center_x - d, center_y - d), (center_x + d, center_y - d), (center_x + d, center_y + d), (center_x - d, center_y + d), (center_x - d, center_y - d)]])
+
+
+class TestExtentIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.rings = [star(0, 0, 200, 2, rng), star(0.2, 0.1, 30, 0.4, rng)]
+        self.extent = Polygon(self.rings, precision=15)
+        self.xs = [rng.uniform(-2.5, 2.5) for _ in range(2000)]
+        self.ys = [rng.uniform(-2.5, 2.5) for _ in range(2000)]
+
+    def test_contains_should_equal_reference(self):
+        expected = [contains(self.rings, x, y) for x, y in zip(self.xs, self.ys)]
+
+        actual = ExtentIndex(self.extent).contains(self.xs, self.ys)
+
+        self.assertListEqual(expected, [bool(a) for a in actual])
+
+    @patch('spaceknow.clipping.np', None)
+    def test_contains_without_numpy_should_equal_reference(self):
+        expected = [contains(self.rings, x, y) for x, y in zip(self.xs, self.ys)]
+
+        actual = ExtentIndex(self.extent).contains(self.xs, self.ys)
+
+        self.assertListEqual(expected, actual)
+
+    def test_contains_of_multipolygon_should_test_all_polygons(self):
+        extent = MultiPolygon([square(0, 0, 1)['coordinates'], square(5, 5, 1)['coordinates']])
+
+        actual = ExtentIndex(extent).contains([0, 5, 2.5], [0, 5, 2.5])
+
+        self.assertListEqual([True, True, False], [bool(a) for a in actual])
+
+    def test_count_within_should_count_detections_with_center_inside(self):
+        detections = DetectionBatch.from_features([
+            Feature('cars', 2, square(0.1, 0.1)), Feature('cars', 3, square(3, 3)), Feature('trucks', 1, square(-0.1, 0.1))])
+
+        index = ExtentIndex(square(0, 0, 1))
+
+        self.assertEqual(3, index.count_within(detections))
+        self.assertEqual(2, index.count_within(detections, 'cars'))
+        self.assertEqual(0, index.count_within(detections, 'buses'))
+
+    @patch('spaceknow.clipping.np', None)
+    def test_count_within_without_numpy_should_count_detections_with_center_inside(self):
+        detections = DetectionBatch.from_features([
+            Feature('cars', 2, square(0.1, 0.1)), Feature('cars', 3, square(3, 3)), Feature('trucks', 1, square(-0.1, 0.1))])
+
+        index = ExtentIndex(square(0, 0, 1))
+
+        self.assertEqual(3, index.count_within(detections))
+        self.assertEqual(1, index.count_within(detections, 'trucks'))
@@ -2,11 +2,14 @@ from unittest.mock import patch
 import unittest
 from requests import Response
 from spaceknow.api import AuthorizedSession
-from spaceknow.control import TaskingManager
+from spaceknow.control import ConcurrentExecutor, PollingPolicy, TaskingManager
 from spaceknow.api import TaskingObject
 from spaceknow.errors import TaskingError, TaskingException
+from spaceknow.models import TaskingStatus
 from tests.shared import generate_mocked_session_request
 import random as rnd
+from threading import Event, Lock, Thread
+from time import sleep
 
 
 __CALLED = False
@@ -64,3 +67,226 @@ class TestTaskingManager(unittest.TestCase):
 
         self.assertEqual(expected_text, actual_text)
 
+
+class ScriptedTaskingObject:
+    """Stand-in for TaskingObject, which goes through given (status, nextTry) responses."""
+    def __init__(self, name: str, responses: list, result = None):
+        self.name = name
+        self.__responses = list(responses)
+        self.__result = result
+
+    def get_status(self):
+        status, next_try = self.__responses.pop(0)
+        return TaskingStatus[status], next_try
+
+    def retrieve_data(self):
+        return self.__result
+
+
+IMMEDIATE_POLLING = PollingPolicy(min_interval=0, initial_interval=0)
+"""Checks procedures without missing 'nextTry' right away, so the tests don't sleep."""
+
+
+class TestTaskingManagerMultiplexing(unittest.TestCase):
+
+    def test_as_completed_should_yield_in_order_of_resolution(self):
+        slow = ScriptedTaskingObject('slow', [('NEW', 0), ('PROCESSING', 0), ('RESOLVED', 0)], 'slow')
+        fast = ScriptedTaskingObject('fast', [('PROCESSING', 0), ('RESOLVED', 0)], 'fast')
+        taskingMgr = TaskingManager(polling_policy=IMMEDIATE_POLLING)
+
+        actual = [result for _, result in taskingMgr.as_completed([slow, fast])]
+
+        self.assertListEqual(['fast', 'slow'], actual)
+
+    def test_wait_all_should_keep_order_of_tasking_objects(self):
+        slow = ScriptedTaskingObject('slow', [('PROCESSING', 0), ('PROCESSING', 0), ('RESOLVED', 0)], 'slow')
+        fast = ScriptedTaskingObject('fast', [('RESOLVED', 0)], 'fast')
+        taskingMgr = TaskingManager(polling_policy=IMMEDIATE_POLLING)
+
+        actual = taskingMgr.wait_all([slow, fast])
+
+        self.assertListEqual(['slow', 'fast'], actual)
+
+    def test_wait_all_should_wait_for_the_slowest_only(self):
+        task_objs = [ScriptedTaskingObject(str(i), [('PROCESSING', 5), ('RESOLVED', 0)]) for i in range(3)]
+        slept = []
+        with patch.object(Event, 'wait', lambda self, timeout: slept.append(timeout)), patch('spaceknow.control.monotonic', lambda: sum(slept)):
+            TaskingManager().wait_all(task_objs)
+
+        self.assertEqual(5, sum(slept))
+
+    def test_wait_all_fail_tasking_response_should_throw(self):
+        ok = ScriptedTaskingObject('ok', [('PROCESSING', 0), ('RESOLVED', 0)])
+        failed = ScriptedTaskingObject('failed', [('FAILED', 0)])
+
+        with self.assertRaises(TaskingException) as ctx:
+            TaskingManager(polling_policy=IMMEDIATE_POLLING).wait_all([ok, failed])
+        self.assertEqual(ctx.exception.error_type, TaskingManager.TASK_FAILED_ERROR)
+
+    def test_missing_next_try_should_back_off_exponentially(self):
+        task_obj = ScriptedTaskingObject('backoff', [('PROCESSING', 0)] * 4 + [('RESOLVED', 0)])
+        intervals = []
+        taskingMgr = TaskingManager(lambda s, i: intervals.append(i), PollingPolicy(min_interval=0, jitter=0))
+        with patch.object(Event, 'wait', lambda self, timeout: False):
+            taskingMgr.wait_untill_completed(task_obj)
+
+        self.assertListEqual([1, 2, 4, 8, 0], intervals)
+
+    def test_exceeded_deadline_should_throw(self):
+        task_obj = ScriptedTaskingObject('stuck', [('PROCESSING', 5)] * 10)
+        slept = []
+        with patch.object(Event, 'wait', lambda self, timeout: slept.append(timeout)), patch('spaceknow.control.monotonic', lambda: sum(slept)):
+            with self.assertRaises(TaskingException) as ctx:
+                TaskingManager(polling_policy=PollingPolicy(deadline=12)).wait_untill_completed(task_obj)
+
+        self.assertEqual(ctx.exception.error_type, TaskingManager.TASK_TIMEOUT_ERROR)
+        self.assertEqual(12, sum(slept))
+
+    def test_cancel_should_interrupt_wait(self):
+        task_obj = ScriptedTaskingObject('long', [('PROCESSING', 60), ('RESOLVED', 0)])
+        taskingMgr = TaskingManager()
+        errors = []
+        def wait():
+            try:
+                taskingMgr.wait_untill_completed(task_obj)
+            except TaskingException as ex:
+                errors.append(ex.error_type)
+        thread = Thread(target=wait)
+        thread.start()
+        sleep(0.05)
+
+        taskingMgr.cancel()
+        thread.join(timeout=5)
+
+        self.assertListEqual([TaskingManager.TASK_CANCELLED_ERROR], errors)
+
+    def test_cancel_token_should_interrupt_only_its_wait(self):
+        taskingMgr = TaskingManager(polling_policy=PollingPolicy(min_interval=0.01, max_interval=0.01))
+        cancel_token = Event()
+        errors, results = [], []
+        def wait(task_obj, token):
+            try:
+                results.append(taskingMgr.wait_untill_completed(task_obj, token))
+            except TaskingException as ex:
+                errors.append(ex.error_type)
+        threads = [Thread(target=wait, args=(ScriptedTaskingObject('long', [('PROCESSING', 0)] * 1000), cancel_token)),
+            Thread(target=wait, args=(ScriptedTaskingObject('short', [('PROCESSING', 0)] * 20 + [('RESOLVED', 0)], 'short'), None))]
+        for thread in threads:
+            thread.start()
+        sleep(0.05)
+
+        cancel_token.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertListEqual([TaskingManager.TASK_CANCELLED_ERROR], errors)
+        self.assertListEqual(['short'], results)
+
+    def test_max_pipelines_should_bound_procedures_in_flight_across_waits(self):
+        in_flight = []
+        max_in_flight = []
+        lock = Lock()
+        class CountedTaskingObject(ScriptedTaskingObject):
+            def retrieve_data(self):
+                with lock:
+                    in_flight.remove(self.name)
+                return super().retrieve_data()
+        def initiate(prefix):
+            # Procedures are initiated only when they are taken by the manager.
+            for i in range(5):
+                with lock:
+                    in_flight.append(f'{prefix}-{i}')
+                    max_in_flight.append(len(in_flight))
+                yield CountedTaskingObject(f'{prefix}-{i}', [('PROCESSING', 0)] * 3 + [('RESOLVED', 0)], i)
+        taskingMgr = TaskingManager(polling_policy=PollingPolicy(min_interval=0.001, initial_interval=0.001), max_pipelines=3)
+        results = []
+        threads = [Thread(target=lambda p=p: results.append(taskingMgr.wait_all(initiate(p)))) for p in ['a', 'b']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertListEqual([[0, 1, 2, 3, 4]] * 2, results)
+        self.assertLessEqual(max(max_in_flight), 3)
+
+    def test_max_pipelines_should_be_released_by_failed_wait(self):
+        taskingMgr = TaskingManager(polling_policy=IMMEDIATE_POLLING, max_pipelines=1)
+        with self.assertRaises(TaskingException):
+            taskingMgr.wait_all([ScriptedTaskingObject('failed', [('FAILED', 0)])])
+
+        actual = taskingMgr.wait_all([ScriptedTaskingObject('ok', [('RESOLVED', 0)], 'ok')])
+
+        self.assertListEqual(['ok'], actual)
+
+    def test_invalid_max_pipelines_should_throw(self):
+        with self.assertRaises(ValueError):
+            TaskingManager(max_pipelines=0)
+
+
+class TestPollingPolicy(unittest.TestCase):
+
+    def test_interval_should_honour_next_try_within_bounds(self):
+        policy = PollingPolicy(min_interval=2, max_interval=30)
+
+        self.assertListEqual([5, 2, 30], [policy.interval(0, 5), policy.interval(0, 0.5), policy.interval(0, 120)])
+
+    def test_interval_should_be_jittered(self):
+        low = PollingPolicy(min_interval=0, jitter=0.5, random_source=lambda: 0)
+        high = PollingPolicy(min_interval=0, jitter=0.5, random_source=lambda: 0.999)
+
+        self.assertAlmostEqual(2, low.interval(2))
+        self.assertAlmostEqual(6, high.interval(2), places=2)
+
+    def test_invalid_intervals_should_throw(self):
+        with self.assertRaises(ValueError):
+            PollingPolicy(min_interval=10, max_interval=1)
+
+
+class TestConcurrentExecutor(unittest.TestCase):
+
+    def test_map_should_keep_order_of_items(self):
+        executor = ConcurrentExecutor(4)
+        def delayed_square(i):
+            sleep(0.01 * (5 - i))
+            return i * i
+
+        actual = executor.map(delayed_square, range(5))
+
+        self.assertListEqual([0, 1, 4, 9, 16], actual)
+
+    def test_map_should_not_exceed_max_workers(self):
+        executor = ConcurrentExecutor(3)
+        lock = Lock()
+        running = 0
+        max_running = 0
+        def task(i):
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            sleep(0.01)
+            with lock:
+                running -= 1
+
+        executor.map(task, range(12))
+
+        self.assertLessEqual(max_running, 3)
+
+    def test_map_failure_should_throw_and_cancel_pending(self):
+        executor = ConcurrentExecutor(2)
+        called = []
+        def task(i):
+            called.append(i)
+            if i == 0:
+                raise TaskingException(TaskingManager.TASK_FAILED_ERROR, 'Failed.')
+            sleep(0.05)
+
+        with self.assertRaises(TaskingException):
+            executor.map(task, range(20))
+        executor.shutdown()
+
+        self.assertLess(len(called), 20)
+
+    def test_invalid_max_workers_should_throw(self):
+        with self.assertRaises(ValueError):
+            ConcurrentExecutor(0)
@@ -1,64 +1,456 @@
-from dataclasses import dataclass
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from types import SimpleNamespace
 import unittest
 from unittest.mock import patch
 from spaceknow.api import KrakenApi
-from spaceknow.control import TaskingManager
-from spaceknow.errors import AuthorizationException
-from spaceknow.interface import SpaceknowAnalysis
+from spaceknow.control import ConcurrentExecutor, PollingPolicy, TaskingManager
+from spaceknow.errors import MapExpiredException, NoEntriesException, TaskingException
+from spaceknow.interface import SpaceknowAnalysis, SpaceknowCarsAnalyser
+from spaceknow.cache import MemoryDetectionsCache, extent_fingerprint
+from spaceknow.checkpoint import MemoryCheckpointStore, SqliteCheckpointStore, checkpoint_key
+from spaceknow.models import DetectionBatch, Feature, TaskingStatus
+from geojson import Polygon
 from PIL.Image import Image
+import PIL.Image
+import json
+import os
+import tempfile
 
-class TestSpaceknowAnalysis(unittest.TestCase):
-    @dataclass
-    class DummyImage:
-        index_1: int
-        index_2: int
-        
-        def __eq__(self, o: object) -> bool:
-            return o.index_1 == self.index_1 and o.index_2 == self.index_2
+class ResolvedTaskingObject:
+    """Stand-in for TaskingObject, which is resolved on its first status check."""
+    def __init__(self, result, status=TaskingStatus.RESOLVED):
+        self.__result = result
+        self.__status = status
+        self.pipeline_id = result[0]
 
-    def test_build_layout(self):
-        sk_analysis = SpaceknowAnalysis(None,None,None,None)
-        test_tiles = []
-        test_images = []
+    def get_status(self):
+        return self.__status, 0
 
-        test_tiles.append((16, 24, 57))
-        test_images.append(self.DummyImage(24,57))
+    def retrieve_data(self):
+        return self.__result
 
-        test_tiles.append((16, 26, 57))
-        test_images.append(self.DummyImage(26, 57))
 
-        test_tiles.append((16, 23, 56))
-        test_images.append(self.DummyImage(23, 56))
+class FakeKrakenApi:
+    """Records calls. Every analysis covers the same two tiles and each tile contains one detection of 3 cars."""
+    TILES = [(16, 23, 56), (16, 24, 56)]
 
-        test_tiles.append((16, 23, 57))
-        test_images.append(self.DummyImage(23, 57))
+    def __init__(self, status=TaskingStatus.RESOLVED):
+        self.calls = []
+        self.status = status
 
-        test_tiles.append((16, 25, 57))
-        test_images.append(self.DummyImage(25, 57))
+    def attach_car_analysis(self, pipeline_id):
+        self.calls.append(('attach_car_analysis', pipeline_id))
+        return ResolvedTaskingObject((pipeline_id, self.TILES), self.status)
 
-        test_tiles.append((16, 25, 56))
-        test_images.append(self.DummyImage( 25, 56))
+    def attach_imagery_analysis(self, pipeline_id):
+        self.calls.append(('attach_imagery_analysis', pipeline_id))
+        return ResolvedTaskingObject((pipeline_id, self.TILES), self.status)
 
-        test_tiles.append((16, 26, 56))
-        test_images.append(self.DummyImage(26, 56))
+    def initiate_car_analysis(self, extent, scene_id):
+        self.calls.append(('initiate_car_analysis', scene_id))
+        return ResolvedTaskingObject((f'cars-{scene_id}', self.TILES))
 
-        test_tiles.append((16, 24, 56))
-        test_images.append(self.DummyImage(24, 56))
+    def initiate_imagery_analysis(self, extent, scene_id):
+        self.calls.append(('initiate_imagery_analysis', scene_id))
+        return ResolvedTaskingObject((f'imagery-{scene_id}', self.TILES))
 
+    def get_detection_batch(self, map_id, tile):
+        self.calls.append(('get_detection_batch', map_id))
+        return DetectionBatch.from_features([Feature('cars', 3, Polygon([[(0, 0), (0, 1), (1, 1), (0, 0)]]))])
 
+    def get_detection_counts(self, map_id, tile):
+        self.calls.append(('get_detection_counts', map_id))
+        return {'cars': 3}
 
-        expected = [
-            [self.DummyImage(23, 56),self.DummyImage( 24, 56),self.DummyImage(25, 56),self.DummyImage(26, 56)],
-            [self.DummyImage(23, 57),self.DummyImage(24, 57),self.DummyImage(25, 57),self.DummyImage( 26, 57)]
-        ]
+    def get_satelite_image(self, map_id, tile):
+        self.calls.append(('get_satelite_image', map_id))
+        return PIL.Image.new('RGB', (256, 256))
 
-        actual = list(sk_analysis._SpaceknowAnalysis__build_layout(test_tiles, test_images))
+
+class TestSpaceknowAnalysisPipelining(unittest.TestCase):
+    def test_get_car_counts_should_initiate_all_analyses_up_front(self):
+        kraken = FakeKrakenApi()
+        scenes = [(datetime(2018,1,i), f'pipelining-counts-{i}') for i in range(1, 4)]
+        sk_analysis = SpaceknowAnalysis(kraken, TaskingManager(), scenes, None, ConcurrentExecutor(1))
+
+        actual = sk_analysis.get_car_counts()
+
+        self.assertListEqual([(d, 6) for d, _ in scenes], actual)
+        names = [c[0] for c in kraken.calls]
+        self.assertListEqual(['initiate_car_analysis'] * 3, names[:3])
+        self.assertEqual(6, names.count('get_detection_counts'))
+        self.assertNotIn('get_detection_batch', names)
+
+    def test_get_images_should_initiate_all_analyses_up_front(self):
+        kraken = FakeKrakenApi()
+        scenes = [(datetime(2018,1,i), f'pipelining-images-{i}') for i in range(1, 3)]
+        sk_analysis = SpaceknowAnalysis(kraken, TaskingManager(), scenes, None, ConcurrentExecutor(1))
+
+        actual = sk_analysis.get_images()
+
+        self.assertListEqual([d for d, _ in scenes], [d for d, _ in actual])
+        self.assertEqual((512, 256), actual[0][1].size)
+        names = [c[0] for c in kraken.calls]
+        self.assertCountEqual(['initiate_car_analysis'] * 2 + ['initiate_imagery_analysis'] * 2, names[:4])
+
+    def test_get_car_counts_with_cached_scenes_should_not_call_kraken(self):
+        cache = MemoryDetectionsCache()
+        scenes = [(datetime(2018,1,i), f'cached-{i}') for i in range(1, 3)]
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+        expected = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_car_counts()
+        kraken = FakeKrakenApi()
+
+        actual = SpaceknowAnalysis(kraken, TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_car_counts()
 
         self.assertListEqual(expected, actual)
+        self.assertListEqual([], kraken.calls)
+
+    def test_get_car_counts_after_get_images_should_not_fetch_detections(self):
+        cache = MemoryDetectionsCache()
+        scenes = [(datetime(2018,1,1), 'counts-after-images')]
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+        SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_images()
+        kraken = FakeKrakenApi()
+
+        actual = SpaceknowAnalysis(kraken, TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_car_counts()
+
+        self.assertListEqual([(datetime(2018,1,1), 6)], actual)
+        self.assertListEqual([], kraken.calls)
+
+    def test_get_car_counts_should_cache_only_counts(self):
+        cache = MemoryDetectionsCache()
+        scenes = [(datetime(2018,1,1), 'counts-only')]
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+
+        SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_car_counts()
+
+        extent_key = extent_fingerprint(extent)
+        self.assertDictEqual({'cars': 3}, cache.get_tile_counts(extent_key, 'counts-only', FakeKrakenApi.TILES[0]))
+        self.assertIsNone(cache.get_tile(extent_key, 'counts-only', FakeKrakenApi.TILES[0]))
+
+    def test_get_car_counts_with_other_extent_should_not_use_cache(self):
+        cache = MemoryDetectionsCache()
+        scenes = [(datetime(2018,1,1), 'cached-extent')]
+        SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]]), ConcurrentExecutor(1), cache).get_car_counts()
+        kraken = FakeKrakenApi()
+
+        SpaceknowAnalysis(kraken, TaskingManager(), scenes, Polygon([[(1, 1), (2, 2), (3, 2), (1, 1)]]), ConcurrentExecutor(1), cache).get_car_counts()
+
+        self.assertIn(('initiate_car_analysis', 'cached-extent'), kraken.calls)
+
+
+    def test_get_car_counts_with_expired_cached_map_should_initiate_analysis_again(self):
+        class ExpiringKrakenApi(FakeKrakenApi):
+            def get_detection_counts(self, map_id, tile):
+                if map_id == 'expired-map':
+                    raise MapExpiredException('NON-EXISTENT-MAP', 'Map was not found.')
+                return super().get_detection_counts(map_id, tile)
+        cache = MemoryDetectionsCache()
+        scenes = [(datetime(2018,1,1), 'expired')]
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+        cache.put_scene(extent_fingerprint(extent), 'expired', 'expired-map', FakeKrakenApi.TILES)
+        kraken = ExpiringKrakenApi()
+
+        actual = SpaceknowAnalysis(kraken, TaskingManager(), scenes, extent, ConcurrentExecutor(1), cache).get_car_counts()
+
+        self.assertListEqual([(datetime(2018,1,1), 6)], actual)
+        self.assertIn(('initiate_car_analysis', 'expired'), kraken.calls)
+        self.assertEqual(('cars-expired', FakeKrakenApi.TILES), cache.get_scene(extent_fingerprint(extent), 'expired'))
+
+
+class TestSpaceknowAnalysisStreaming(unittest.TestCase):
+    SCENES = [(datetime(2018,1,3), 'streaming-a'), (datetime(2018,1,1), 'streaming-b'), (datetime(2018,1,2), 'streaming-c')]
+
+    def test_iter_car_counts_should_yield_in_order_of_completion(self):
+        sk_analysis = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), self.SCENES, None, ConcurrentExecutor(1))
+
+        actual = list(sk_analysis.iter_car_counts())
+
+        self.assertListEqual([(d, 6) for d, _ in self.SCENES], actual)
+
+    def test_iter_car_counts_ordered_should_yield_in_order_of_dates(self):
+        sk_analysis = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), self.SCENES, None, ConcurrentExecutor(1))
+
+        actual = list(sk_analysis.iter_car_counts(ordered=True))
+
+        self.assertListEqual([(d, 6) for d, _ in sorted(self.SCENES)], actual)
+
+    def test_iter_images_should_be_lazy(self):
+        kraken = FakeKrakenApi()
+        sk_analysis = SpaceknowAnalysis(kraken, TaskingManager(), self.SCENES, None, ConcurrentExecutor(1))
+
+        date_time, image = next(sk_analysis.iter_images())
+
+        self.assertEqual(self.SCENES[0][0], date_time)
+        self.assertEqual((512, 256), image.size)
+        self.assertEqual(2, [c[0] for c in kraken.calls].count('get_satelite_image'))
+
+    def test_iter_images_ordered_should_yield_scene_for_each_of_its_dates(self):
+        scenes = [(datetime(2018,1,2), 'streaming-d'), (datetime(2018,1,1), 'streaming-d')]
+        sk_analysis = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, None, ConcurrentExecutor(1))
+
+        actual = [d for d, _ in sk_analysis.iter_images(ordered=True)]
+
+        self.assertListEqual([datetime(2018,1,1), datetime(2018,1,2)], actual)
+
+    def test_export_images_should_write_tiles_and_index(self):
+        scenes = [(datetime(2018,1,1), 'export-a')]
+        sk_analysis = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, None, ConcurrentExecutor(1))
+
+        with tempfile.TemporaryDirectory() as directory:
+            actual = sk_analysis.export_images(directory)
+
+            date_time, index_path = actual[0]
+            with open(index_path) as index_file:
+                index = json.load(index_file)
+            self.assertEqual(datetime(2018,1,1), date_time)
+            self.assertListEqual([list(t) for t in FakeKrakenApi.TILES], index['tiles'])
+            for z, x, y in index['tiles']:
+                self.assertTrue(os.path.isfile(os.path.join(os.path.dirname(index_path), str(z), str(x), f'{y}.png')))
+
+
+class TestSpaceknowAnalysisCheckpoints(unittest.TestCase):
+    EXTENT = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+
+    def test_get_images_with_resolved_checkpoints_should_not_initiate_analyses(self):
+        store = MemoryCheckpointStore()
+        scenes = [(datetime(2018,1,1), 'checkpoint-images')]
+        SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store).get_images()
+        kraken = FakeKrakenApi()
+
+        actual = SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store).get_images()
+
+        self.assertEqual((512, 256), actual[0][1].size)
+        names = [c[0] for c in kraken.calls]
+        self.assertNotIn('initiate_car_analysis', names)
+        self.assertNotIn('initiate_imagery_analysis', names)
+
+    def test_get_car_counts_with_initiated_pipeline_should_attach_to_it(self):
+        store = MemoryCheckpointStore()
+        key = checkpoint_key('cars', extent_fingerprint(self.EXTENT), 'checkpoint-attach')
+        store.put_pipeline(key, 'cars-previous-run')
+        kraken = FakeKrakenApi()
+
+        actual = SpaceknowAnalysis(kraken, TaskingManager(), [(datetime(2018,1,1), 'checkpoint-attach')], self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store).get_car_counts()
+
+        self.assertListEqual([(datetime(2018,1,1), 6)], actual)
+        self.assertIn(('attach_car_analysis', 'cars-previous-run'), kraken.calls)
+        self.assertNotIn(('initiate_car_analysis', 'checkpoint-attach'), kraken.calls)
+        self.assertEqual('cars-previous-run', store.get_result(key)[0])
+
+    def test_get_car_counts_with_failed_pipeline_should_initiate_it_again(self):
+        store = MemoryCheckpointStore()
+        key = checkpoint_key('cars', extent_fingerprint(self.EXTENT), 'checkpoint-failed')
+        store.put_pipeline(key, 'cars-failed-run')
+        kraken = FakeKrakenApi(TaskingStatus.FAILED)
+
+        analysis = SpaceknowAnalysis(kraken, TaskingManager(), [(datetime(2018,1,1), 'checkpoint-failed')], self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store)
+        list(analysis._SpaceknowAnalysis__start_analyses([('cars', ('checkpoint-failed', 0))], {}))
+
+        self.assertIn(('initiate_car_analysis', 'checkpoint-failed'), kraken.calls)
+        self.assertEqual('cars-checkpoint-failed', store.get_pipeline(key))
+
+    def test_export_images_should_skip_completed_tiles(self):
+        store = MemoryCheckpointStore()
+        scenes = [(datetime(2018,1,1), 'checkpoint-export')]
+        with tempfile.TemporaryDirectory() as directory:
+            SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store).export_images(directory)
+            kraken = FakeKrakenApi()
+
+            actual = SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), checkpoint_store=store).export_images(directory)
+
+            with open(actual[0][1]) as index_file:
+                index = json.load(index_file)
+            self.assertListEqual([256, 256], index['tileSize'])
+            self.assertNotIn('get_satelite_image', [c[0] for c in kraken.calls])
+
+    def test_get_images_without_checkpoint_store_should_initiate_analyses_again(self):
+        scenes = [(datetime(2018,1,1), 'checkpoint-none')]
+        kraken = FakeKrakenApi()
+
+        SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1)).get_images()
+        SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1)).get_images()
+
+        names = [c[0] for c in kraken.calls]
+        self.assertEqual(2, names.count('initiate_imagery_analysis'))
+        self.assertNotIn('attach_imagery_analysis', names)
+
+    def test_memory_checkpoint_store_should_expire_results(self):
+        now = [1000.0]
+        store = MemoryCheckpointStore(ttl=60, clock=lambda: now[0])
+        store.put_pipeline('cars/extent/scene', 'pipeline-1')
+        store.put_result('cars/extent/scene', ['map-1', [[16, 23, 56]]])
+
+        now[0] += 59
+        self.assertEqual('map-1', store.get_result('cars/extent/scene')[0])
+        now[0] += 1
+        self.assertIsNone(store.get_result('cars/extent/scene'))
+        self.assertIsNone(store.get_pipeline('cars/extent/scene'))
+
+
+class TestSpaceknowAnalysisExactCounts(unittest.TestCase):
+    def test_get_car_counts_exact_should_count_only_cars_within_extent(self):
+        scenes = [(datetime(2018,1,1), 'exact-counts')]
+        inside = Polygon([[(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]])
+        outside = Polygon([[(5, 5), (6, 5), (6, 6), (5, 6), (5, 5)]])
+
+        actual_inside = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, inside, ConcurrentExecutor(1)).get_car_counts(exact=True)
+        actual_outside = SpaceknowAnalysis(FakeKrakenApi(), TaskingManager(), scenes, outside, ConcurrentExecutor(1)).get_car_counts(exact=True)
+
+        self.assertListEqual([(datetime(2018,1,1), 6)], actual_inside)
+        self.assertListEqual([(datetime(2018,1,1), 0)], actual_outside)
+
+
+class TestSpaceknowAnalysisSplitting(unittest.TestCase):
+    EXTENT = Polygon([[(153.104780, -27.390398), (153.106688, -27.391102), (153.105343, -27.393405), (153.103649, -27.392496), (153.104780, -27.390398)]])
+
+    def test_get_car_counts_of_split_extent_should_deduplicate_tiles(self):
+        kraken = FakeKrakenApi()
+        scenes = [(datetime(2018,1,1), 'split-counts')]
+        sk_analysis = SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), max_tiles_per_pipeline=5)
+
+        actual = sk_analysis.get_car_counts()
+
+        self.assertListEqual([(datetime(2018,1,1), 6)], actual)
+        self.assertGreater([c[0] for c in kraken.calls].count('initiate_car_analysis'), 1)
+
+    def test_get_images_of_split_extent_should_merge_tiles(self):
+        kraken = FakeKrakenApi()
+        scenes = [(datetime(2018,1,1), 'split-images')]
+        sk_analysis = SpaceknowAnalysis(kraken, TaskingManager(), scenes, self.EXTENT, ConcurrentExecutor(1), max_tiles_per_pipeline=5)
+
+        actual = sk_analysis.get_images()
+
+        self.assertEqual((512, 256), actual[0][1].size)
+        names = [c[0] for c in kraken.calls]
+        self.assertEqual(names.count('initiate_car_analysis'), names.count('initiate_imagery_analysis'))
+        self.assertEqual(2, names.count('get_satelite_image'))
+
+
+class TestSqliteCheckpointStore(unittest.TestCase):
+    def test_sqlite_checkpoint_store_should_persist_checkpoints(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoints.sqlite')
+            store = SqliteCheckpointStore(path)
+            store.put_pipeline('cars/extent/scene', 'pipeline-1')
+            store.put_result('cars/extent/scene', ['map-1', [[16, 23, 56]]])
+            store.put_completed_tile('export/extent/scene', (16, 23, 56))
+            store.close()
+
+            store = SqliteCheckpointStore(path)
+            self.assertEqual('pipeline-1', store.get_pipeline('cars/extent/scene'))
+            self.assertListEqual(['map-1', [[16, 23, 56]]], store.get_result('cars/extent/scene'))
+            self.assertSetEqual({(16, 23, 56)}, store.get_completed_tiles('export/extent/scene'))
+            store.discard('cars/extent/scene')
+            self.assertIsNone(store.get_pipeline('cars/extent/scene'))
+            self.assertIsNone(store.get_result('cars/extent/scene'))
+            store.close()
+
+
+class TestSpaceknowCarsAnalyserBatch(unittest.TestCase):
+    def setUp(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = Lock()
+        patcher = patch.object(SpaceknowCarsAnalyser, 'initialize', lambda analyser: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def analyse_on(self, extent, from_date, to_date):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if extent == 'empty':
+            raise NoEntriesException('No scene ids.')
+        return extent
+
+    def test_analyse_many_should_yield_result_per_extent(self):
+        extents = ['a', 'empty', 'c']
+        with patch.object(SpaceknowCarsAnalyser, 'analyse_on', lambda analyser, *args, **kwargs: self.analyse_on(*args)), SpaceknowCarsAnalyser('username', 'password') as analyser:
+            actual = list(analyser.analyse_many(extents, datetime(2018,1,1), datetime(2018,1,2), action=str.upper))
+
+        self.assertListEqual(extents, [r.extent for r in sorted(actual, key=lambda r: r.index)])
+        self.assertCountEqual(['A', None, 'C'], [r.result for r in actual])
+        self.assertIsInstance([r for r in actual if r.extent == 'empty'][0].error, NoEntriesException)
+
+    def test_analyse_many_should_bound_extents_in_flight(self):
+        consumed = []
+        def extents():
+            for i in range(10):
+                consumed.append(i)
+                yield f'extent-{i}'
+        with patch.object(SpaceknowCarsAnalyser, 'analyse_on', lambda analyser, *args, **kwargs: self.analyse_on(*args)), SpaceknowCarsAnalyser('username', 'password') as analyser:
+            results = analyser.analyse_many(extents(), datetime(2018,1,1), datetime(2018,1,2), action=str.upper, max_concurrent_extents=3)
+            next(results)
+            self.assertLessEqual(len(consumed), 4)
+            actual = [next(results)] + list(results)
+
+        self.assertEqual(9, len(actual))
+        self.assertLessEqual(self.max_in_flight, 3)
+
+    def test_analyse_many_break_should_cancel_running_extents(self):
+        analyser = SpaceknowCarsAnalyser('username', 'password', polling_policy=PollingPolicy(min_interval=0.01, initial_interval=0.01))
+        self.addCleanup(analyser.close)
+        tasking_manager = analyser._SpaceknowCarsAnalyser__tasking_manager
+        errors = []
+        polling = Event()
+        released = Event()
+        def analyse_on(extent, from_date, to_date, cancel_token=None):
+            if extent == 'quick':
+                polling.wait(5)
+            if extent == 'stuck':
+                stuck = SimpleNamespace(get_status=lambda: polling.set() or (TaskingStatus.PROCESSING, 60))
+                try:
+                    tasking_manager.wait_untill_completed(stuck, cancel_token)
+                except TaskingException as ex:
+                    errors.append(ex.error_type)
+                    raise
+            if extent == 'other':
+                # Another job of the analyser, which is being polled while the loop of analyse_many is broken.
+                other = SimpleNamespace(get_status=lambda: (TaskingStatus.RESOLVED, 0) if released.is_set() else (TaskingStatus.PROCESSING, 0),
+                    retrieve_data=lambda: 'other')
+                return tasking_manager.wait_untill_completed(other, cancel_token)
+            return extent
+        with patch.object(SpaceknowCarsAnalyser, 'analyse_on', lambda analyser, *args, **kwargs: analyse_on(*args, **kwargs)):
+            others = []
+            other_thread = Thread(target=lambda: others.append(analyser.analyse_on('other', datetime(2018,1,1), datetime(2018,1,2))))
+            other_thread.start()
+            started = monotonic()
+            for result in analyser.analyse_many(['stuck', 'quick'], datetime(2018,1,1), datetime(2018,1,2), action=str.upper, max_concurrent_extents=2):
+                break
+            elapsed = monotonic() - started
+            sleep(0.1)
+            released.set()
+            other_thread.join(timeout=5)
 
+        self.assertEqual('QUICK', result.result)
+        self.assertLess(elapsed, 5)
+        self.assertListEqual([TaskingManager.TASK_CANCELLED_ERROR], errors)
+        self.assertListEqual(['other'], others)
 
-        
+    def test_cancel_token_should_cancel_waits_started_after_it_was_set(self):
+        cancel_token = Event()
+        cancel_token.set()
+        kraken = FakeKrakenApi()
+        extent = Polygon([[(1, 1), (2, 2), (3, 1), (1, 1)]])
+        analysis = SpaceknowAnalysis(kraken, TaskingManager(), [(datetime(2018,1,1), 'scene')], extent, ConcurrentExecutor(1), cancel_token=cancel_token)
 
+        with self.assertRaises(TaskingException) as ctx:
+            analysis.get_car_counts()
+        self.assertEqual(TaskingManager.TASK_CANCELLED_ERROR, ctx.exception.error_type)
+        self.assertListEqual([], kraken.calls)
 
+    def test_close_should_close_session_and_stop_workers(self):
+        with SpaceknowCarsAnalyser('username', 'password', max_workers=2) as analyser:
+            executor = analyser._SpaceknowCarsAnalyser__executor
+            executor.map(str, [1, 2])
+            with patch.object(analyser._SpaceknowCarsAnalyser__auth_session, 'close') as close:
+                analyser.close()
 
-        
\ No newline at end of file
+        close.assert_called()
+        self.assertIsNone(executor._ConcurrentExecutor__pool)
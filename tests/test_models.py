@@ -0,0 +1,67 @@
+import sys
+import unittest
+from geojson import Polygon
+from spaceknow.models import DetectionBatch, Feature
+
+CAR = Polygon([[(153.10501, -27.39101), (153.10511, -27.39101), (153.10511, -27.39111), (153.10501, -27.39101)]])
+TRUCK_WITH_HOLE = Polygon([
+    [(0.0, 0.0), (0.0, 2.0), (2.0, 2.0), (2.0, 0.0), (0.0, 0.0)],
+    [(0.5, 0.5), (0.5, 1.0), (1.0, 1.0), (0.5, 0.5)]])
+
+
+def features() -> list[Feature]:
+    return [Feature('cars', 2, CAR), Feature('trucks', 1, TRUCK_WITH_HOLE), Feature('cars', 3, CAR)]
+
+
+class TestDetectionBatch(unittest.TestCase):
+    def test_to_features_should_equal_original_features(self):
+        batch = DetectionBatch.from_features(features())
+
+        self.assertListEqual(features(), batch.to_features())
+        self.assertEqual(features()[1], batch[-2])
+
+    def test_class_types_should_be_interned(self):
+        batch = DetectionBatch.from_features(features())
+
+        self.assertListEqual(['cars', 'trucks'], batch.class_names)
+        self.assertListEqual([0, 1, 0], list(batch.class_codes))
+
+    def test_total_count(self):
+        batch = DetectionBatch.from_features(features())
+
+        self.assertEqual(6, batch.total_count())
+        self.assertEqual(5, batch.total_count('cars'))
+        self.assertEqual(0, batch.total_count('planes'))
+
+    def test_outer_rings_should_contain_first_ring_of_every_polygon(self):
+        batch = DetectionBatch.from_features(features())
+
+        lons, lats, offsets = batch.outer_rings()
+
+        self.assertListEqual([0, 4, 9, 13], offsets)
+        self.assertListEqual([c[0] for c in TRUCK_WITH_HOLE['coordinates'][0]], list(lons[4:9]))
+        self.assertListEqual([c[1] for c in CAR['coordinates'][0]], list(lats[9:13]))
+
+    def test_to_geojson_should_be_parsable_as_kraken_response(self):
+        batch = DetectionBatch.from_features(features())
+
+        geojson = batch.to_geojson()
+
+        self.assertEqual('Polygon', geojson['features'][1]['geometry']['type'])
+        self.assertEqual({'class': 'trucks', 'count': 1}, geojson['features'][1]['properties'])
+
+    def test_from_bytes_should_equal_serialized_batch(self):
+        batch = DetectionBatch.from_features(features())
+
+        self.assertEqual(batch, DetectionBatch.from_bytes(batch.to_bytes()))
+        self.assertEqual(0, len(DetectionBatch.from_bytes(DetectionBatch.from_features([]).to_bytes())))
+
+    def test_batch_should_be_smaller_than_features(self):
+        many_features = [Feature('cars', 1, CAR) for _ in range(1000)]
+        features_size = sum(sys.getsizeof(f) + sys.getsizeof(f.geometry) + sys.getsizeof(f.geometry['coordinates'][0]) for f in many_features)
+
+        self.assertLess(sys.getsizeof(DetectionBatch.from_features(many_features)), features_size)
+
+    def test_not_polygon_geometry_should_throw(self):
+        with self.assertRaises(ValueError):
+            DetectionBatch.from_features([Feature('cars', 1, {'type': 'Point', 'coordinates': [0, 0]})])
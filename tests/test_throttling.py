@@ -0,0 +1,73 @@
+from unittest.mock import patch
+import unittest
+import requests
+from spaceknow.throttling import RateLimiter, RetryPolicy, TokenBucket, retry_after
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve_should_allow_burst_then_keep_rate(self):
+        with patch('spaceknow.throttling.monotonic', lambda: 0.0):
+            bucket = TokenBucket(rate=2, capacity=3)
+
+            delays = [bucket.reserve() for _ in range(5)]
+
+        self.assertListEqual([0, 0, 0, 0.5, 1.0], delays)
+
+    def test_reserve_should_refill_tokens_over_time(self):
+        now = 0.0
+        with patch('spaceknow.throttling.monotonic', lambda: now):
+            bucket = TokenBucket(rate=1, capacity=1)
+            bucket.reserve()
+            now = 1.0
+
+            self.assertEqual(0, bucket.reserve())
+
+    def test_invalid_rate_should_throw(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_family_of_endpoints(self):
+        self.assertEqual(RateLimiter.RAGNAR, RateLimiter.family('/imagery/search/initiate'))
+        self.assertEqual(RateLimiter.KRAKEN_RELEASE, RateLimiter.family('/kraken/release/cars/geojson/initiate'))
+        self.assertEqual(RateLimiter.KRAKEN_GRID, RateLimiter.family('/kraken/grid/map-id/-/19/1/2/truecolor.png'))
+        self.assertEqual(RateLimiter.TASKING, RateLimiter.family('/tasking/get-status'))
+        self.assertIsNone(RateLimiter.family('/unknown'))
+
+    def test_families_should_be_limited_independently(self):
+        with patch('spaceknow.throttling.monotonic', lambda: 0.0):
+            limiter = RateLimiter({RateLimiter.KRAKEN_GRID: TokenBucket(1), RateLimiter.TASKING: TokenBucket(1)})
+
+            self.assertEqual(0, limiter.reserve('/kraken/grid/a'))
+            self.assertEqual(0, limiter.reserve('/tasking/get-status'))
+            self.assertEqual(1, limiter.reserve('/kraken/grid/b'))
+            self.assertEqual(0, limiter.reserve('/imagery/search/initiate'))
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_should_retry_only_idempotent_methods_on_transient_errors(self):
+        policy = RetryPolicy(max_retries=2)
+
+        self.assertTrue(policy.should_retry('GET', 0, 503))
+        self.assertTrue(policy.should_retry('GET', 1, exception=requests.ConnectionError()))
+        self.assertFalse(policy.should_retry('GET', 2, 503))
+        self.assertFalse(policy.should_retry('GET', 0, 404))
+        self.assertFalse(policy.should_retry('GET', 0, exception=ValueError()))
+        self.assertFalse(policy.should_retry('POST', 0, 503))
+
+    def test_delay_should_be_capped(self):
+        policy = RetryPolicy(initial_delay=1, max_delay=5, random_source=lambda: 0.999)
+
+        self.assertAlmostEqual(2, policy.delay(1), places=2)
+        self.assertEqual(5, policy.delay(10))
+        self.assertEqual(3, policy.delay(10, retry_after=3))
+        self.assertEqual(5, policy.delay(0, retry_after=60))
+
+    def test_retry_after(self):
+        self.assertEqual(2.5, retry_after({'Retry-After': '2.5'}))
+        self.assertIsNone(retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+        self.assertIsNone(retry_after(None))
@@ -0,0 +1,137 @@
+import math
+import unittest
+from area import area
+from geojson import MultiPolygon, Polygon
+from spaceknow.tiling import split_extent, tile_cover
+from spaceknow.visualization import tile_to_deg_coords
+
+EXTENT = Polygon([[
+    (153.10478095093333,-27.390398450838056),
+    (153.10668832863644,-27.391102659318708),
+    (153.10534310906212,-27.393405862986185),
+    (153.10364951776478,-27.392496065380755),
+    (153.10478095093333,-27.390398450838056)]])
+
+
+def tile_coords_polygon(points: list[tuple[float, float]], zoom: int = 19) -> Polygon:
+    """Polygon given by tile coordinates relative to the tile (482233, 297428)."""
+    corners = [tile_to_deg_coords(482233 + x, 297428 + y, zoom) for x, y in points + points[:1]]
+    return Polygon([[(lon, lat) for lat, lon in corners]], precision=15)
+
+
+def is_simple(ring: list) -> bool:
+    """Tests that no two edges of a closed ring intersect, except of the shared vertices of the neighbouring ones, which mustn't overlap."""
+    cross = lambda o, a, b: (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+    def touches(p, q, r, s):
+        d1, d2, d3, d4 = cross(r, s, p), cross(r, s, q), cross(p, q, r), cross(p, q, s)
+        if ((d1 > 0) != (d2 > 0) and d1 != 0 and d2 != 0) and ((d3 > 0) != (d4 > 0) and d3 != 0 and d4 != 0):
+            return True
+        on_segment = lambda a, b, c: min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+        return any(d == 0 and on_segment(*segment, point) for d, segment, point in [(d1, (r, s), p), (d2, (r, s), q), (d3, (p, q), r), (d4, (p, q), s)])
+    edges = list(zip(ring[:-1], ring[1:]))
+    for i, (p, q) in enumerate(edges):
+        for j in range(i + 1, len(edges)):
+            r, s = edges[j]
+            if j == i + 1 or (i == 0 and j == len(edges) - 1):
+                shared, other = (q, s) if j == i + 1 else (p, r)
+                far = p if j == i + 1 else q
+                # Neighbouring edges share a vertex only, i.e. they don't run back along each other.
+                if cross(shared, far, other) == 0 and (far[0] - shared[0]) * (other[0] - shared[0]) + (far[1] - shared[1]) * (other[1] - shared[1]) > 0:
+                    return False
+            elif touches(p, q, r, s):
+                return False
+    return True
+
+
+def tile_polygon(x: int, y: int, zoom: int) -> Polygon:
+    corners = [tile_to_deg_coords(*c, zoom) for c in [(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1), (x, y)]]
+    return Polygon([[(lon, lat) for lat, lon in corners]], precision=15)
+
+
+class TestTileCover(unittest.TestCase):
+    def test_tile_cover_of_tile_should_be_the_tile(self):
+        actual = tile_cover(tile_polygon(482233, 297428, 19))
+
+        self.assertListEqual([(19, 482233, 297428)], actual)
+
+    def test_tile_cover_should_skip_tiles_of_bounding_box_outside_extent(self):
+        triangle = Polygon([[(0.0, 0.0), (1.0, 0.0), (0.0, -1.0), (0.0, 0.0)]])
+
+        actual = tile_cover(triangle, 10)
+
+        self.assertIn((10, 512, 512), actual)
+        self.assertNotIn((10, 514, 514), actual)
+        self.assertLess(len(actual), 9)
+
+    def test_tile_cover_of_multipolygon_should_join_covers(self):
+        extent = MultiPolygon([tile_polygon(10, 10, 19)['coordinates'], tile_polygon(12, 10, 19)['coordinates']], precision=15)
+
+        actual = tile_cover(extent)
+
+        self.assertListEqual([(19, 10, 10), (19, 12, 10)], actual)
+
+    def test_tile_cover_should_include_tile_overlapped_by_sliver(self):
+        # The edge crosses the corner of the tile (6, 6) by ~0.002 x 0.004 tiles.
+        triangle = tile_coords_polygon([(6.222282087467731, 7.346111054640419), (4.3531374167246994, 7.4825805246983), (4.653632524088448, 4.877977824985028)])
+
+        actual = tile_cover(triangle)
+
+        self.assertIn((19, 482239, 297434), actual)
+        self.assertNotIn((19, 482239, 297433), actual)
+        self.assertCountEqual(actual, [t for e in split_extent(triangle, 1) for t in tile_cover(e)])
+
+
+class TestSplitExtent(unittest.TestCase):
+    def test_small_extent_should_not_be_split(self):
+        actual = split_extent(EXTENT, len(tile_cover(EXTENT)))
+
+        self.assertListEqual([EXTENT], actual)
+
+    def test_split_extent_should_partition_tile_cover(self):
+        expected = tile_cover(EXTENT)
+
+        actual = split_extent(EXTENT, 5)
+
+        covers = [tile_cover(e) for e in actual]
+        self.assertGreater(len(actual), 1)
+        self.assertTrue(all(len(c) <= 5 for c in covers))
+        self.assertCountEqual(expected, [t for c in covers for t in c])
+        self.assertAlmostEqual(area(EXTENT), sum(area(e) for e in actual), delta=area(EXTENT) * 0.01)
+
+    def test_split_large_extent_should_partition_tile_cover(self):
+        circle = tile_coords_polygon([(60.3 + 55 * math.cos(math.pi * i / 20), 60.3 + 55 * math.sin(math.pi * i / 20)) for i in range(40)])
+        expected = tile_cover(circle)
+
+        actual = split_extent(circle, 256)
+
+        covers = [tile_cover(e) for e in actual]
+        self.assertGreater(len(expected), 9000)
+        self.assertTrue(all(len(c) <= 256 for c in covers))
+        self.assertCountEqual(expected, [t for c in covers for t in c])
+
+    def test_split_extent_with_non_positive_max_tiles_should_throw(self):
+        with self.assertRaises(ValueError):
+            split_extent(EXTENT, 0)
+
+    def test_split_concave_extent_should_not_bridge_its_parts(self):
+        extent = tile_coords_polygon([(0.01, 0.01), (4.01, 0.01), (4.01, 9.99), (3.01, 9.99), (3.01, 2.01), (1.01, 2.01), (1.01, 9.99), (0.01, 9.99)])
+        expected = tile_cover(extent)
+
+        for max_tiles in (15, 25):
+            actual = split_extent(extent, max_tiles)
+
+            polygons = [p for e in actual for p in ([e['coordinates']] if e['type'] == 'Polygon' else e['coordinates'])]
+            self.assertTrue(all(is_simple(ring) for polygon in polygons for ring in polygon))
+            self.assertCountEqual(expected, [t for e in actual for t in tile_cover(e)])
+            self.assertAlmostEqual(area(extent), sum(area(e) for e in actual), delta=area(extent) * 0.01)
+        self.assertIn('MultiPolygon', [e['type'] for e in split_extent(extent, 25)])
+
+    def test_split_extent_with_hole_should_keep_hole(self):
+        extent = tile_coords_polygon([(0.5, 0.5), (5.5, 0.5), (5.5, 5.5), (0.5, 5.5)])
+        hole = tile_coords_polygon([(2.2, 2.2), (2.2, 2.8), (2.8, 2.8), (2.8, 2.2)])
+        extent = Polygon(extent['coordinates'] + hole['coordinates'], precision=15)
+
+        actual = split_extent(extent, 10)
+
+        self.assertEqual(sum(len(e['coordinates']) for e in actual if e['type'] == 'Polygon'), len(actual) + 1)
+        self.assertAlmostEqual(area(extent), sum(area(e) for e in actual), delta=area(extent) * 0.01)
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+from geojson import Polygon
+from PIL import Image, ImageDraw
+from spaceknow.visualization import build_layout, build_mosaic, deg_to_tile_coords, deg_to_tile_coords_array, highlight_cars_on_tile, merge_images, tile_to_deg_coords, \
+    tile_to_deg_coords_array, tile_to_pixel_coords, tile_to_pixel_coords_array
+
+TILE = (19, 482233, 297428)
+LON_DEGS = [153.1047, 153.1066, 153.1053, -0.5, 12.25]
+LAT_DEGS = [-27.3903, -27.3911, -27.3934, 51.5, 0.0]
+
+
+def car_polygons() -> list[Polygon]:
+    lat, lon = tile_to_deg_coords(TILE[1] + 0.25, TILE[2] + 0.25, TILE[0])
+    step = 0.00005
+    return [Polygon([[(lon + i * step, lat - i * step), (lon + (i + 1) * step, lat - i * step), (lon + (i + 1) * step, lat - (i + 1) * step), (lon + i * step, lat - i * step)]]) for i in range(5)]
+
+
+class TestCoordinatesTransformations(unittest.TestCase):
+    def assert_batched_transformations_equal_scalar(self):
+        x_tiles, y_tiles = deg_to_tile_coords_array(LON_DEGS, LAT_DEGS, TILE[0])
+        lat_degs, lon_degs = tile_to_deg_coords_array(x_tiles, y_tiles, TILE[0])
+        x_pixels, y_pixels = tile_to_pixel_coords_array((TILE[1], TILE[2]), (256, 256), x_tiles, y_tiles)
+
+        for i, (lon, lat) in enumerate(zip(LON_DEGS, LAT_DEGS)):
+            x_tile, y_tile = deg_to_tile_coords(lon, lat, TILE[0])
+            self.assertAlmostEqual(x_tile, x_tiles[i])
+            self.assertAlmostEqual(y_tile, y_tiles[i])
+            self.assertAlmostEqual(tile_to_deg_coords(x_tile, y_tile, TILE[0])[0], lat_degs[i])
+            self.assertAlmostEqual(tile_to_deg_coords(x_tile, y_tile, TILE[0])[1], lon_degs[i])
+            self.assertAlmostEqual(lat, lat_degs[i])
+            self.assertAlmostEqual(tile_to_pixel_coords((TILE[1], TILE[2]), (256, 256), (x_tile, y_tile))[0], x_pixels[i], places=4)
+            self.assertAlmostEqual(tile_to_pixel_coords((TILE[1], TILE[2]), (256, 256), (x_tile, y_tile))[1], y_pixels[i], places=4)
+
+    def test_batched_transformations_should_equal_scalar(self):
+        self.assert_batched_transformations_equal_scalar()
+
+    @patch('spaceknow.visualization.np', None)
+    def test_batched_transformations_without_numpy_should_equal_scalar(self):
+        self.assert_batched_transformations_equal_scalar()
+
+
+class TestHighlightCarsOnTile(unittest.TestCase):
+    def expected_image(self) -> Image.Image:
+        """Highlights cars vertex by vertex."""
+        image = Image.new('RGB', (256, 256))
+        draw = ImageDraw.Draw(image)
+        for polygon in car_polygons():
+            tile_coords = [deg_to_tile_coords(*c, TILE[0]) for c in polygon['coordinates'][0]]
+            draw.polygon([tile_to_pixel_coords((TILE[1], TILE[2]), image.size, c) for c in tile_coords], fill='Red')
+        return image
+
+    def test_highlight_cars_on_tile_should_equal_per_vertex_highlighting(self):
+        actual = highlight_cars_on_tile(TILE, Image.new('RGB', (256, 256)), car_polygons())
+
+        self.assertEqual(list(self.expected_image().getdata()), list(actual.getdata()))
+
+    @patch('spaceknow.visualization.np', None)
+    def test_highlight_cars_on_tile_without_numpy_should_equal_per_vertex_highlighting(self):
+        actual = highlight_cars_on_tile(TILE, Image.new('RGB', (256, 256)), car_polygons())
+
+        self.assertEqual(list(self.expected_image().getdata()), list(actual.getdata()))
+
+    def test_highlight_cars_on_tile_without_cars_should_not_change_image(self):
+        actual = highlight_cars_on_tile(TILE, Image.new('RGB', (256, 256)), [])
+
+        self.assertEqual(list(Image.new('RGB', (256, 256)).getdata()), list(actual.getdata()))
+
+
+class TestMosaic(unittest.TestCase):
+    COLORS = {(16, 23, 56): 'red', (16, 24, 56): 'green', (16, 23, 57): 'blue'}
+
+    def test_build_mosaic_should_paste_tiles_at_their_offsets(self):
+        tiles = list(self.COLORS)
+        images = [Image.new('RGB', (256, 256), self.COLORS[t]) for t in tiles]
+
+        actual = build_mosaic(tiles, images)
+
+        self.assertEqual((512, 512), actual.size)
+        self.assertEqual((255, 0, 0), actual.getpixel((10, 10)))
+        self.assertEqual((0, 128, 0), actual.getpixel((300, 10)))
+        self.assertEqual((0, 0, 255), actual.getpixel((10, 300)))
+
+    def test_build_mosaic_missing_tile_should_leave_empty_cell(self):
+        tiles = list(self.COLORS)
+        images = [Image.new('RGB', (256, 256), self.COLORS[t]) for t in tiles]
+
+        actual = build_mosaic(tiles, images)
+
+        self.assertEqual((0, 0, 0), actual.getpixel((300, 300)))
+
+    def test_build_layout_should_arrange_images_in_rows_of_tiles(self):
+        tiles = [(16, 24, 57), (16, 26, 57), (16, 23, 56), (16, 23, 57), (16, 25, 57), (16, 25, 56), (16, 26, 56), (16, 24, 56)]
+        # Stand-ins of the images, which are only arranged.
+        images = [t[1:] for t in tiles]
+
+        actual = build_layout(tiles, images)
+
+        self.assertListEqual([[(23, 56), (24, 56), (25, 56), (26, 56)], [(23, 57), (24, 57), (25, 57), (26, 57)]], actual)
+
+    def test_merge_images_should_equal_mosaic_of_full_layout(self):
+        tiles = [(16, 23, 56), (16, 24, 56), (16, 23, 57), (16, 24, 57)]
+        images = [Image.new('RGB', (256, 256), c) for c in ['red', 'green', 'blue', 'white']]
+
+        actual = merge_images(build_layout(tiles, images))
+
+        self.assertEqual(list(build_mosaic(tiles, images).getdata()), list(actual.getdata()))